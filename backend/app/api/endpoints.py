@@ -1,35 +1,134 @@
-from typing import List, Optional
-from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, Query
-from fastapi.responses import StreamingResponse
-from sqlmodel import Session, select
-from app.models.schemas import DocumentUploadResponse, DocumentInfo, ChatRequest, HealthResponse
+import json
+import base64
+import secrets
+from datetime import datetime, timezone
+from typing import Any, List, Literal, Optional
+from fastapi import APIRouter, UploadFile, File, Form, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from sqlalchemy import DateTime, func, literal, tuple_
+from sqlmodel import Session, col, select
+from app.models.schemas import (
+    DocumentUploadResponse, DocumentInfo, ChatRequest, HealthResponse, IngestJobStatus,
+    BulkIngestRequest, BulkUploadResponse, ReadinessResponse, SearchRequest, SearchResponse,
+    BatchSearchRequest, MaintenanceRequest
+)
 from app.models.db import get_session, Document as DBDocument
+from app.core.metrics import registry, CHAT_STREAM_RESUMES
 from app.services.ingestion import ingestion_service
 from app.services.chat_service import chat_service
+from app.services.streaming import chat_streams, sse_response
 from app.services.vector_store import vector_service
+from app.services.rerank import retrieval_pipeline
+from app.services.search_service import search_service
+from app.services.maintenance import maintenance_service
+from app.services.cache import TTLCache
+from app.core.config import get_settings
+
+settings = get_settings()
 
 router = APIRouter()
 
-@router.post("/documents/upload", response_model=DocumentUploadResponse)
+# Counts reported by /health; probes hit it constantly, counts change slowly
+health_stats_cache = TTLCache(max_entries=8, ttl_seconds=settings.HEALTH_CACHE_SECONDS)
+
+@router.post("/documents/upload", response_model=DocumentUploadResponse, status_code=202)
 def upload_document(
     file: UploadFile = File(...),
+    replace_doc_id: Optional[str] = Form(None),
     session: Session = Depends(get_session)
 ):
+    job = ingestion_service.process_file(file, replace_doc_id=replace_doc_id)
+    return DocumentUploadResponse(
+        doc_id=job.doc_id,
+        chunk_count=0,
+        status=job.status,
+        job_id=job.job_id
+    )
+
+@router.post("/documents/upload/batch", response_model=BulkUploadResponse, status_code=202)
+def upload_documents(files: List[UploadFile] = File(...)):
+    job = ingestion_service.process_files(files)
+    return BulkUploadResponse(
+        job_id=job.job_id,
+        status=job.status,
+        file_count=job.files_total,
+        doc_ids=[f.doc_id for f in job.files]
+    )
+
+@router.post("/documents/ingest/path", response_model=BulkUploadResponse, status_code=202)
+def ingest_path(request: BulkIngestRequest):
+    job = ingestion_service.process_path(request.path)
+    return BulkUploadResponse(job_id=job.job_id, status=job.status, file_count=0, doc_ids=[])
+
+@router.get("/documents/jobs/{job_id}", response_model=IngestJobStatus)
+def get_ingest_job(job_id: str):
+    job = ingestion_service.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return IngestJobStatus.model_validate(job, from_attributes=True)
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite stores naive UTC timestamps: convert aware values to UTC and drop
+    # the offset, and take naive ones (query values and cursors) as UTC already
+    return value.astimezone(timezone.utc).replace(tzinfo=None) if value.tzinfo else value
+
+def _utc_param(value: datetime):
+    # Bound as a plain DateTime so the column type does not re-apply an offset
+    return literal(_as_utc(value), DateTime())
+
+def _encode_cursor(sort_value: Any, doc_id: str) -> str:
+    if isinstance(sort_value, datetime):
+        sort_value = _as_utc(sort_value).isoformat()
+    return base64.urlsafe_b64encode(json.dumps([sort_value, doc_id]).encode("utf-8")).decode("ascii")
+
+def _decode_cursor(cursor: str, sort: str):
     try:
-        doc_id, chunk_count = ingestion_service.process_file(file)
-        return DocumentUploadResponse(
-            doc_id=doc_id,
-            chunk_count=chunk_count,
-            status="success"
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        sort_value, doc_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if sort == "created_at":
+            sort_value = _utc_param(datetime.fromisoformat(sort_value))
+        return sort_value, str(doc_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 @router.get("/documents", response_model=List[DocumentInfo])
 def list_documents(
+    response: Response,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor from the previous page"),
+    sort: Literal["created_at", "filename"] = "created_at",
+    order: Literal["asc", "desc"] = "desc",
+    filename: Optional[str] = Query(None, description="Case-insensitive filename substring"),
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
     session: Session = Depends(get_session)
 ):
-    documents = session.exec(select(DBDocument)).all()
+    """
+    Keyset-paginated listing: each page seeks past the last (sort column, doc_id)
+    of the previous one via the composite index, so deep pages cost the same as
+    the first. The cursor for the next page is returned in X-Next-Cursor.
+    """
+    sort_column = col(getattr(DBDocument, sort))
+    key = tuple_(sort_column, col(DBDocument.doc_id))
+    statement = select(DBDocument)
+    if filename:
+        statement = statement.where(col(DBDocument.filename).contains(filename, autoescape=True))
+    if created_after:
+        statement = statement.where(col(DBDocument.created_at) >= _utc_param(created_after))
+    if created_before:
+        statement = statement.where(col(DBDocument.created_at) < _utc_param(created_before))
+    if cursor:
+        after = tuple_(*_decode_cursor(cursor, sort))
+        statement = statement.where(key < after if order == "desc" else key > after)
+    if order == "desc":
+        statement = statement.order_by(sort_column.desc(), col(DBDocument.doc_id).desc())
+    else:
+        statement = statement.order_by(sort_column, col(DBDocument.doc_id))
+
+    documents = session.exec(statement.limit(limit + 1)).all()
+    if len(documents) > limit:
+        documents = documents[:limit]
+        last = documents[-1]
+        response.headers["X-Next-Cursor"] = _encode_cursor(getattr(last, sort), last.doc_id)
     return [
         DocumentInfo(
             doc_id=doc.doc_id,
@@ -51,27 +150,113 @@ def delete_document(
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/chat/stream")
-async def chat_stream(request: ChatRequest):
-    return StreamingResponse(
-        chat_service.stream_chat(
+async def chat_stream(request: ChatRequest, http_request: Request):
+    # Reject with 429 while the response can still carry a status code. Answer-cache
+    # hits are only known after retrieval, so they are subject to the same check
+    chat_service.llm.limiter.check()
+    stream = chat_streams.start(
+        lambda is_disconnected: chat_service.events(
             query=request.query,
             doc_ids=request.doc_ids,
-            history=request.history
-        ),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "X-Accel-Buffering": "no",
-            "Connection": "keep-alive",
-        }
+            history=[message.model_dump() for message in request.history],
+            is_disconnected=is_disconnected
+        )
+    )
+    return sse_response(stream, http_request.headers.get("accept-encoding", ""))
+
+@router.get("/chat/stream/{stream_id}")
+async def resume_chat_stream(
+    stream_id: str,
+    http_request: Request,
+    last_event_id: Optional[int] = Query(None, ge=0, description="Overrides the Last-Event-ID header")
+):
+    """
+    Reattach to a chat stream after a dropped connection. Frames after
+    Last-Event-ID are replayed, then the stream continues live.
+    """
+    stream = chat_streams.get(stream_id)
+    if stream is None:
+        CHAT_STREAM_RESUMES.inc(result="expired")
+        raise HTTPException(status_code=404, detail="Stream not found or expired")
+    if last_event_id is None:
+        header = http_request.headers.get("last-event-id", "0")
+        if not header.isdigit():
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+        last_event_id = int(header)
+    CHAT_STREAM_RESUMES.inc(result="resumed")
+    return sse_response(stream, http_request.headers.get("accept-encoding", ""), after=last_event_id)
+
+@router.post("/search", response_model=SearchResponse)
+async def search(request: SearchRequest):
+    return await search_service.search(request)
+
+@router.post("/search/batch")
+async def search_batch(request: BatchSearchRequest):
+    if len(request.queries) > settings.SEARCH_MAX_BATCH_QUERIES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.SEARCH_MAX_BATCH_QUERIES} queries per batch"
+        )
+    return StreamingResponse(
+        search_service.stream_batch(request),
+        media_type="application/x-ndjson",
+        headers={"X-Accel-Buffering": "no"}
     )
 
 @router.get("/health", response_model=HealthResponse)
 def health_check(session: Session = Depends(get_session)):
-    doc_count = session.exec(select(DBDocument)).all()
-    vector_stats = vector_service.get_stats()
+    doc_count = health_stats_cache.get("doc_count")
+    if doc_count is None:
+        doc_count = session.exec(select(func.count()).select_from(DBDocument)).one()
+        health_stats_cache.set("doc_count", doc_count)
+
+    # Never blocks on warmup: vector_count stays 0 until the store is loaded
+    ready = vector_service.ready
+    vector_count = health_stats_cache.get("vector_count") if ready else 0
+    if vector_count is None:
+        vector_count = vector_service.get_stats().get("count", 0)
+        health_stats_cache.set("vector_count", vector_count)
     return HealthResponse(
-        status="ok",
-        doc_count=len(doc_count),
-        vector_count=vector_stats.get("count", 0)
+        status="ok" if ready else "starting",
+        doc_count=doc_count,
+        vector_count=vector_count
+    )
+
+@router.get("/health/live")
+def liveness():
+    return {"status": "ok"}
+
+@router.get("/health/ready", response_model=ReadinessResponse, responses={503: {"model": ReadinessResponse}})
+def readiness():
+    if retrieval_pipeline.ready or not settings.WARMUP_ON_STARTUP:
+        # With warmup disabled, models load on first use and the app is always ready
+        return ReadinessResponse(status="ready", startup=retrieval_pipeline.startup_report)
+    status = "failed" if retrieval_pipeline.warmup_error else "starting"
+    body = ReadinessResponse(status=status, error=retrieval_pipeline.warmup_error)
+    return JSONResponse(status_code=503, content=body.model_dump())
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    # Admin routes can delete data, so they stay disabled until a token is configured
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin API is disabled (ADMIN_TOKEN is not set)")
+    if not secrets.compare_digest(x_admin_token or "", settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@router.post("/admin/maintenance", dependencies=[Depends(require_admin)])
+def run_maintenance(request: MaintenanceRequest = MaintenanceRequest()):
+    """
+    Reconcile documents, indexes and stored uploads now; returns the report.
+    """
+    return maintenance_service.run(
+        dry_run=request.dry_run,
+        compact=request.compact,
+        orphan_grace=request.orphan_grace_seconds
     )
+
+@router.get("/admin/maintenance", dependencies=[Depends(require_admin)])
+def maintenance_status():
+    return maintenance_service.status()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
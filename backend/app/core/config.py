@@ -10,15 +10,135 @@ class Settings(BaseSettings):
     # LLM Settings
     LLM_PROVIDER: Literal["openai", "deepseek"] = "deepseek"
     EMBEDDING_PROVIDER: Literal["openai", "huggingface"] = "huggingface"
+    EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
     OPENAI_API_KEY: Optional[str] = None
     DEEPSEEK_API_KEY: Optional[str] = None
+    LLM_BASE_URL: Optional[str] = None  # override the provider endpoint (OpenAI-compatible)
+    LLM_FALLBACK_PROVIDER: Optional[Literal["openai", "deepseek"]] = None  # used when the primary is down
+    LLM_FALLBACK_BASE_URL: Optional[str] = None
     
-    # Vector DB
+    # Upstream LLM client
+    LLM_MAX_CONCURRENCY: int = 32            # completions streaming at once (per worker)
+    LLM_MAX_QUEUE: int = 64                  # requests waiting for a slot before new ones get 429
+    LLM_QUEUE_TIMEOUT_SECONDS: float = 10.0
+    LLM_RATE_LIMIT_PER_SECOND: float = 0.0   # completion starts per second (0: unlimited)
+    LLM_MAX_RETRIES: int = 2                 # per provider, only before the first token
+    LLM_RETRY_BACKOFF_SECONDS: float = 0.5
+    LLM_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    LLM_READ_TIMEOUT_SECONDS: float = 60.0   # max gap between streamed chunks
+    LLM_MAX_CONNECTIONS: int = 100
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    LLM_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    
+    # Chat stream transport
+    SSE_COALESCE_MS: float = 25.0          # merge token deltas for up to this long (0: one frame per delta)
+    SSE_COALESCE_BYTES: int = 512          # ...or until this much text is pending
+    SSE_COMPRESSION: bool = True           # gzip/br when the client accepts it (br needs `brotli`)
+    SSE_HEARTBEAT_SECONDS: float = 15.0    # comment frame on idle connections (0: off)
+    SSE_RESUME_GRACE_SECONDS: float = 15.0 # keep generating this long with no client attached
+    SSE_RESUME_TTL_SECONDS: float = 120.0  # keep finished streams for replay this long
+    SSE_RESUME_MAX_STREAMS: int = 1000     # finished streams kept for replay (oldest dropped first)
+    
+    # Vector DB: "chroma", or "local" for the built-in quantized, memory-mapped index
+    VECTOR_BACKEND: Literal["chroma", "local"] = "chroma"
     CHROMA_PERSIST_DIRECTORY: str = "./data/chroma_db"
     COLLECTION_NAME: str = "knowledge_base"
+    # Use a Chroma server instead of the embedded store; required with several uvicorn workers
+    CHROMA_HOST: Optional[str] = None
+    CHROMA_PORT: int = 8000
+    # Partition the corpus by doc_id hash; 1 keeps the single collection/index.
+    # Changing it later needs a re-ingest (only the unsharded layout is imported)
+    VECTOR_SHARDS: int = 1
+    VECTOR_SHARD_MAX_WORKERS: int = 8   # threads fanning a search out across shards
+    
+    # Local vector backend
+    VECTOR_INDEX_DIRECTORY: str = "./data/vector_index"
+    VECTOR_QUANTIZATION: Literal["int8", "float16"] = "int8"
+    VECTOR_IVF_MIN_ROWS: int = 100_000  # exact search below this, IVF above
+    VECTOR_IVF_NPROBE: int = 16         # IVF lists scanned per query (more: better recall, slower)
+    
+    # Embedding engine (huggingface provider)
+    EMBEDDING_BACKEND: Literal["torch", "onnx", "onnx-int8"] = "torch"  # onnx* need sentence-transformers[onnx]
+    EMBEDDING_ONNX_FILE: Optional[str] = None  # override the ONNX file inside the model repo
+    EMBEDDING_THREADS: int = 0                # intra-op threads per model call (0: runtime default)
+    EMBEDDING_WORKERS: int = 1                # model calls running in parallel
+    EMBEDDING_QUERY_BATCH_SIZE: int = 32      # concurrent query embeddings coalesced into one call
+    EMBEDDING_BATCH_WAIT_MS: float = 2.0      # how long a query waits for others to batch with
+    EMBEDDING_BULK_BATCH_SIZE: int = 64       # ingest texts per call; queries can run between calls
+    
+    # Lexical (BM25) index, persisted alongside the vector store and shared by all workers
+    BM25_INDEX_DIRECTORY: str = "./data/bm25_index"
+    BM25_REFRESH_INTERVAL_SECONDS: float = 1.0  # how often a worker checks for other workers' writes
+    
+    # Retrieval & Rerank
+    RETRIEVAL_TOP_K: int = 20          # candidates recalled per retriever and kept after fusion
+    RERANK_TOP_N: int = 5              # chunks passed to the LLM
+    RRF_K: int = 60
+    VECTOR_WEIGHT: float = 0.5
+    BM25_WEIGHT: float = 0.5
+    RERANKER: Literal["none", "cross-encoder"] = "none"
+    RERANK_MODEL: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    RERANK_BATCH_SIZE: int = 16
+    RERANK_MAX_WORKERS: int = 2
+    SEARCH_MAX_WORKERS: int = 4           # threads scoring vector/BM25 queries
+    RETRIEVAL_TIMEOUT_SECONDS: float = 5.0  # per-request deadline; slower retrievers/rerank are dropped
+    SEARCH_MAX_BATCH_QUERIES: int = 10000   # queries accepted per /api/search/batch request
+    SEARCH_BATCH_CHUNK_SIZE: int = 256      # queries embedded and scored together before results are streamed
+    
+    # Prompt budget (tokens, counted with tiktoken)
+    CONTEXT_TOKEN_BUDGET: int = 3000         # retrieved passages
+    HISTORY_TOKEN_BUDGET: int = 1500         # recent conversation turns sent verbatim
+    HISTORY_SUMMARY_TOKEN_BUDGET: int = 200  # condensed older user questions (0 to drop them)
+    
+    # Query caches (set MAX_ENTRIES to 0 to disable)
+    QUERY_CACHE_TTL_SECONDS: float = 600
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 10000
+    EMBEDDING_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    RESULT_CACHE_MAX_ENTRIES: int = 2000
+    RESULT_CACHE_MAX_BYTES: int = 128 * 1024 * 1024
+    
+    # Semantic answer cache for /chat/stream (opt-in)
+    ANSWER_CACHE_ENABLED: bool = False
+    ANSWER_CACHE_SIMILARITY: float = 0.95   # cosine similarity between questions to reuse an answer
+    ANSWER_CACHE_TTL_SECONDS: float = 3600
+    ANSWER_CACHE_MAX_ENTRIES: int = 1000
+    ANSWER_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+    
+    # Ingestion
+    CHUNK_SIZE: int = 512
+    CHUNK_OVERLAP: int = 50
+    INGEST_WORKERS: int = 2            # concurrent jobs
+    INGEST_PARSE_PROCESSES: int = 2    # process pool for PDF/Markdown parsing
+    INGEST_QUEUE_SIZE: int = 100       # pending jobs before uploads are rejected with 429
+    INGEST_EMBED_BATCH_SIZE: int = 256
+    INGEST_MAX_PENDING_BYTES: int = 4 * 1024 * 1024   # flush chunk text to the index beyond this
+    INGEST_PDF_PAGE_WINDOW: int = 16   # PDF pages loaded per parse task
+    INGEST_TEXT_WINDOW_BYTES: int = 1024 * 1024        # text file bytes loaded per parse task
+    INGEST_JOB_RETENTION: int = 1000   # finished jobs kept for status lookups
+    BULK_INGEST_ROOT: Optional[str] = None  # server-side directory/zip ingestion is disabled unless set
+    INGEST_MAX_FILE_BYTES: int = 100 * 1024 * 1024          # per file, including zip members
+    INGEST_MAX_ARCHIVE_BYTES: int = 2 * 1024 * 1024 * 1024  # uncompressed total of a zip archive
+    
+    # Maintenance: reconcile SQLite, vector/BM25 indexes and stored uploads
+    MAINTENANCE_INTERVAL_SECONDS: float = 6 * 3600  # scheduled runs (0: only via /api/admin/maintenance)
+    MAINTENANCE_ORPHAN_GRACE_SECONDS: float = 3600  # orphans must stay orphaned this long before removal
+    MAINTENANCE_BATCH_SIZE: int = 500               # orphan documents deleted per index call
+    MAINTENANCE_COMPACT_TOMBSTONE_RATIO: float = 0.2  # compact an index once this share of its segment is deleted
+    MAINTENANCE_UPLOAD_RETENTION_DAYS: float = 0    # drop stored uploads of indexed documents after this (0: keep)
+    ADMIN_TOKEN: Optional[str] = None               # X-Admin-Token for /api/admin/* (unset: admin API disabled)
+    
+    # Startup
+    WARMUP_ON_STARTUP: bool = True     # load models/indexes in the background at startup instead of on first use
+    
+    # Observability
+    TIMING_HEADERS: bool = True        # add a Server-Timing header to API responses
     
     # Metadata DB (SQLite)
     SQLITE_URL: str = "sqlite:///./data/metadata.db"
+    SQLITE_POOL_SIZE: int = 10             # pooled connections (WAL mode: readers don't block each other)
+    SQLITE_MAX_OVERFLOW: int = 20
+    SQLITE_BUSY_TIMEOUT_SECONDS: float = 5.0  # wait this long for a writer's lock before failing
+    HEALTH_CACHE_SECONDS: float = 5.0      # document/vector counts reported by /health are reused this long
 
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra="ignore")
 
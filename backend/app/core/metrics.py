@@ -0,0 +1,266 @@
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+THROUGHPUT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._lock = threading.Lock()
+
+    def samples(self) -> Iterable[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in self.samples())
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, description: str):
+        super().__init__(name, description)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, _format_labels(key), value) for key, value in self._values.items()]
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, description: str):
+        super().__init__(name, description)
+        self._values: Dict[LabelKey, float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, _format_labels(key), value) for key, value in self._values.items()]
+
+
+class CallbackMetric(Metric):
+    """
+    Values read from a callback at scrape time, for state that already lives
+    elsewhere (cache statistics, queue depths). The callback returns
+    (labels, value) pairs.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        callback: Callable[[], Iterable[Tuple[Dict[str, str], float]]],
+        metric_type: str = "gauge"
+    ):
+        super().__init__(name, description)
+        self.callback = callback
+        self.type = metric_type
+
+    def samples(self):
+        try:
+            values = list(self.callback())
+        except Exception:
+            return []
+        return [(self.name, _format_labels(_label_key(labels)), value) for labels, value in values]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, description)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelKey, List[float]] = {}  # per-bucket counts + [sum, count]
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        out = []
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in series.items():
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                out.append((f"{self.name}_bucket", _format_labels(key, ("le", _format_value(bound))), cumulative))
+            out.append((f"{self.name}_bucket", _format_labels(key, ("le", "+Inf")), values[-1]))
+            out.append((f"{self.name}_sum", _format_labels(key), values[-2]))
+            out.append((f"{self.name}_count", _format_labels(key), values[-1]))
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, description: str) -> Counter:
+        return self.register(Counter(name, description))
+
+    def gauge(self, name: str, description: str) -> Gauge:
+        return self.register(Gauge(name, description))
+
+    def callback(self, name: str, description: str, callback, metric_type: str = "gauge") -> CallbackMetric:
+        return self.register(CallbackMetric(name, description, callback, metric_type))
+
+    def histogram(self, name: str, description: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, description, buckets))
+
+    def render(self) -> str:
+        """
+        Prometheus text exposition format (version 0.0.4).
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# Hot-path instruments shared by the services
+STAGE_LATENCY = registry.histogram(
+    "retriv_stage_latency_seconds",
+    "Latency of retrieval and chat pipeline stages"
+)
+HTTP_LATENCY = registry.histogram(
+    "retriv_http_request_duration_seconds",
+    "HTTP request latency until response headers are sent"
+)
+CHAT_TTFT = registry.histogram(
+    "retriv_chat_ttft_seconds",
+    "Time from chat request to the first streamed token"
+)
+CHAT_TOKENS_PER_SECOND = registry.histogram(
+    "retriv_chat_tokens_per_second",
+    "Completion tokens per second after the first token",
+    buckets=THROUGHPUT_BUCKETS
+)
+CHAT_REQUESTS = registry.counter(
+    "retriv_chat_requests_total",
+    "Chat requests by outcome"
+)
+CHAT_IN_FLIGHT = registry.gauge(
+    "retriv_chat_in_flight",
+    "Chat streams currently open"
+)
+INGEST_CHUNKS = registry.counter(
+    "retriv_ingest_chunks_total",
+    "Chunks embedded and indexed; rate() gives ingest chunks/sec"
+)
+INGEST_BATCH_THROUGHPUT = registry.histogram(
+    "retriv_ingest_batch_chunks_per_second",
+    "Embed+index throughput of individual ingest batches",
+    buckets=THROUGHPUT_BUCKETS
+)
+INGEST_JOBS = registry.counter(
+    "retriv_ingest_jobs_total",
+    "Finished ingest jobs by outcome"
+)
+ANSWER_CACHE_LOOKUPS = registry.counter(
+    "retriv_answer_cache_lookups_total",
+    "Semantic answer cache lookups by result (hit, miss, stale)"
+)
+LLM_UPSTREAM_REQUESTS = registry.counter(
+    "retriv_llm_upstream_requests_total",
+    "Upstream completion attempts by provider and outcome (ok, retryable, error)"
+)
+LLM_QUEUE_WAIT = registry.histogram(
+    "retriv_llm_queue_wait_seconds",
+    "Time chat requests waited for an upstream completion slot"
+)
+SEARCH_QUERIES = registry.counter(
+    "retriv_search_queries_total",
+    "Queries answered by the retrieval-only search API, by mode"
+)
+CHAT_STREAM_FRAMES = registry.counter(
+    "retriv_chat_stream_frames_total",
+    "SSE frames written for chat streams, by event type (token frames are coalesced)"
+)
+CHAT_STREAM_RESUMES = registry.counter(
+    "retriv_chat_stream_resumes_total",
+    "Chat stream reconnects by result (resumed, expired)"
+)
+MAINTENANCE_RUNS = registry.counter(
+    "retriv_maintenance_runs_total",
+    "Maintenance runs by outcome (ok, error)"
+)
+MAINTENANCE_REMOVED = registry.counter(
+    "retriv_maintenance_removed_total",
+    "Items removed by maintenance, by kind (orphan_documents, uploads)"
+)
+MAINTENANCE_RECLAIMED_BYTES = registry.counter(
+    "retriv_maintenance_reclaimed_bytes_total",
+    "Disk space reclaimed by maintenance, by source (uploads, compaction)"
+)
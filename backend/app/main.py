@@ -4,26 +4,57 @@ import sys
 # Ensure backend directory is in sys.path when running this script directly
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import time
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import get_settings
+from app.core.metrics import HTTP_LATENCY
 from app.api.endpoints import router as api_router
 from app.models.db import create_db_and_tables
+from app.services.ingestion import ingestion_service
+from app.services.vector_store import vector_service
+from app.services.rerank import retrieval_pipeline
+from app.services.chat_service import chat_service
+from app.services.streaming import chat_streams
+from app.services.maintenance import maintenance_service
 
 settings = get_settings()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup
+    # Startup: only cheap work happens before the server binds. Models and
+    # indexes load in the background; /health/ready gates traffic until then.
+    start = time.perf_counter()
     create_db_and_tables()
-    # Initialize Vector Store (BM25 building happens in __init__ which is imported)
-    # Could explicitly call vector_service.warmup() here if needed
-    print("Startup complete. Vector Store and DB ready.")
+    print(f"Startup complete in {time.perf_counter() - start:.2f}s. DB ready.")
+
+    warmup_task = None
+    if settings.WARMUP_ON_STARTUP:
+        async def warmup():
+            warmup_start = time.perf_counter()
+            report = await asyncio.get_running_loop().run_in_executor(None, retrieval_pipeline.warmup)
+            if retrieval_pipeline.ready:
+                print(f"Warmup complete in {time.perf_counter() - warmup_start:.2f}s: {report}")
+        warmup_task = asyncio.create_task(warmup())
+
+    maintenance_task = None
+    if settings.MAINTENANCE_INTERVAL_SECONDS > 0:
+        maintenance_task = asyncio.create_task(maintenance_service.run_periodically())
+
     yield
     # Shutdown
     print("Shutting down...")
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    if maintenance_task is not None:
+        maintenance_task.cancel()
+    ingestion_service.shutdown()
+    vector_service.shutdown()
+    await chat_streams.aclose()
+    await chat_service.llm.aclose()
 
 app = FastAPI(
     title=settings.APP_NAME,
@@ -39,6 +70,22 @@ async def unicode_exception_handler(request: Request, exc: UnicodeEncodeError):
         content={"detail": "File encoding error. Please ensure filenames and content are UTF-8 compatible or try renaming the file."},
     )
 
+# Request latency (until response headers; streaming bodies are timed by their own stages)
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    HTTP_LATENCY.observe(
+        elapsed,
+        method=request.method,
+        route=getattr(route, "path", "unmatched")
+    )
+    if settings.TIMING_HEADERS:
+        response.headers["Server-Timing"] = f"app;dur={elapsed * 1000:.2f}"
+    return response
+
 # CORS
 origins = [
     "http://localhost:5173",
@@ -52,6 +99,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing", "X-Stream-Id"],
 )
 
 app.include_router(api_router, prefix=settings.API_V1_STR)
@@ -1,22 +1,60 @@
 from datetime import datetime, timezone
 from typing import Optional
+from sqlalchemy import Index, event, inspect, text
 from sqlmodel import Field, SQLModel, create_engine, Session, select
 from app.core.config import get_settings
 
 settings = get_settings()
 
+# Keyset pagination orders by (column, doc_id), so each sortable column gets a composite index
+LISTING_INDEXES = {
+    "ix_document_created_at_doc_id": ("created_at", "doc_id"),
+    "ix_document_filename_doc_id": ("filename", "doc_id"),
+}
+
 class Document(SQLModel, table=True):
+    __table_args__ = tuple(Index(name, *columns) for name, columns in LISTING_INDEXES.items())
+
     doc_id: str = Field(primary_key=True)
     filename: str
     chunk_count: int
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     file_path: Optional[str] = None
+    content_hash: Optional[str] = Field(default=None, index=True)  # sha256 of the uploaded file
 
-# SQLite setup
-engine = create_engine(settings.SQLITE_URL, connect_args={"check_same_thread": False})
+# SQLite setup: a pooled engine shared by request threads and ingest workers
+engine = create_engine(
+    settings.SQLITE_URL,
+    connect_args={"check_same_thread": False, "timeout": settings.SQLITE_BUSY_TIMEOUT_SECONDS},
+    pool_size=settings.SQLITE_POOL_SIZE,
+    max_overflow=settings.SQLITE_MAX_OVERFLOW,
+    pool_pre_ping=True
+)
+
+@event.listens_for(engine, "connect")
+def _configure_sqlite(dbapi_connection, connection_record):
+    # WAL lets readers (listing, health) run alongside an ingest commit instead of
+    # blocking on it; NORMAL sync is durable across app crashes in WAL mode
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
 
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
+    _migrate()
+
+def _migrate():
+    """
+    Add columns introduced after a database was created; create_all only creates missing tables.
+    """
+    columns = {column["name"] for column in inspect(engine).get_columns("document")}
+    with engine.begin() as conn:
+        if "content_hash" not in columns:
+            conn.execute(text("ALTER TABLE document ADD COLUMN content_hash VARCHAR"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_document_content_hash ON document (content_hash)"))
+        for name, index_columns in LISTING_INDEXES.items():
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON document ({', '.join(index_columns)})"))
 
 def get_session():
     with Session(engine) as session:
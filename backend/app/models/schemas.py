@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Literal, Optional
 from pydantic import BaseModel, Field
 from datetime import datetime
 
@@ -11,10 +11,72 @@ class ChatRequest(BaseModel):
     doc_ids: Optional[List[str]] = Field(default_factory=list)
     history: List[Message] = Field(default_factory=list)
 
+class SearchQuery(BaseModel):
+    query: str
+    k: int = Field(5, ge=1, le=100)
+    doc_ids: Optional[List[str]] = Field(default_factory=list)
+
+class SearchRequest(SearchQuery):
+    mode: Literal["hybrid", "vector", "keyword"] = "hybrid"
+    rerank: bool = False
+
+class BatchSearchRequest(BaseModel):
+    queries: List[SearchQuery] = Field(min_length=1)
+    mode: Literal["hybrid", "vector", "keyword"] = "hybrid"
+    rerank: bool = False
+
+class SearchHit(BaseModel):
+    chunk_id: Optional[str] = None
+    doc_id: Optional[str] = None
+    filename: Optional[str] = None
+    score: float
+    text: str
+    metadata: Dict[str, Any] = {}
+
+class SearchResponse(BaseModel):
+    query: str
+    hits: List[SearchHit]
+    timings: Dict[str, Any] = {}
+
 class DocumentUploadResponse(BaseModel):
     doc_id: str
     chunk_count: int
     status: str
+    job_id: Optional[str] = None
+
+class BulkIngestRequest(BaseModel):
+    path: str
+
+class BulkUploadResponse(BaseModel):
+    job_id: str
+    status: str
+    file_count: int
+    doc_ids: List[str]
+
+class IngestFileStatus(BaseModel):
+    doc_id: str
+    filename: str
+    status: str
+    pages: int
+    chunk_count: int
+    content_hash: Optional[str] = None
+    error: Optional[str] = None
+
+class IngestJobStatus(BaseModel):
+    job_id: str
+    doc_id: Optional[str] = None
+    filename: Optional[str] = None
+    status: str
+    files_total: int
+    files_processed: int
+    pages_parsed: int
+    chunks_total: int
+    chunks_embedded: int
+    chunks_reused: int
+    error: Optional[str] = None
+    files: List[IngestFileStatus] = Field(default_factory=list)
+    created_at: datetime
+    updated_at: datetime
 
 class DocumentInfo(BaseModel):
     doc_id: str
@@ -26,3 +88,13 @@ class HealthResponse(BaseModel):
     status: str
     doc_count: int
     vector_count: int
+
+class ReadinessResponse(BaseModel):
+    status: str  # ready, starting or failed
+    startup: Dict[str, Any] = {}
+    error: Optional[str] = None
+
+class MaintenanceRequest(BaseModel):
+    dry_run: bool = True   # report only; deleting must be asked for with dry_run=false
+    compact: bool = False  # compact every local index, not only those past the tombstone ratio
+    orphan_grace_seconds: Optional[float] = Field(None, ge=0)  # overrides MAINTENANCE_ORPHAN_GRACE_SECONDS
@@ -0,0 +1,594 @@
+import os
+import re
+import json
+import math
+import pickle
+from collections import Counter
+from typing import List, Dict, Any, Iterable, Optional, Set, Tuple
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from app.services.segments import JournaledIndex, Segment, load_array
+
+# CJK ideographs are indexed one character at a time, everything else by word
+TOKEN_PATTERN = re.compile(r"[一-鿿㐀-䶿]|[^\W_]+", re.UNICODE)
+
+# Pre-segment format (one pickle + one journal), migrated on load
+LEGACY_SNAPSHOT_FILE = "bm25.snapshot"
+LEGACY_JOURNAL_FILE = "bm25.journal"
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def matches_filter(metadata: Dict[str, Any], where: Dict[str, Any]) -> bool:
+    """
+    Evaluate a Chroma-style `where` filter against chunk metadata.
+    Supports equality, $eq/$ne/$in/$nin/$gt/$gte/$lt/$lte and $and/$or.
+    """
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for op, operand in condition.items():
+                if op == "$eq" and value != operand:
+                    return False
+                if op == "$ne" and value == operand:
+                    return False
+                if op == "$in" and value not in operand:
+                    return False
+                if op == "$nin" and value in operand:
+                    return False
+                if op in ("$gt", "$gte", "$lt", "$lte"):
+                    if value is None:
+                        return False
+                    if op == "$gt" and not value > operand:
+                        return False
+                    if op == "$gte" and not value >= operand:
+                        return False
+                    if op == "$lt" and not value < operand:
+                        return False
+                    if op == "$lte" and not value <= operand:
+                        return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+def split_doc_filter(where: Optional[Dict[str, Any]]) -> Tuple[Optional[List[str]], Optional[Dict[str, Any]]]:
+    """
+    Pull a top-level doc_id constraint out of a filter so it can be answered
+    from the doc_id -> chunk index. Returns (doc_ids, remaining_filter).
+    """
+    if not where:
+        return None, None
+    clauses = where["$and"] if set(where) == {"$and"} else [{key: value} for key, value in where.items()]
+
+    doc_ids = None
+    rest = []
+    for clause in clauses:
+        condition = clause.get("doc_id") if len(clause) == 1 else None
+        if isinstance(condition, str):
+            ids = [condition]
+        elif isinstance(condition, dict) and set(condition) == {"$eq"}:
+            ids = [condition["$eq"]]
+        elif isinstance(condition, dict) and set(condition) == {"$in"}:
+            ids = list(condition["$in"])
+        else:
+            rest.append(clause)
+            continue
+        doc_ids = ids if doc_ids is None else [d for d in doc_ids if d in ids]
+
+    if not rest:
+        remaining = None
+    elif len(rest) == 1:
+        remaining = rest[0]
+    else:
+        remaining = {"$and": rest}
+    return doc_ids, remaining
+
+
+class BM25Segment(Segment):
+    """
+    Postings are stored term by term in two flat arrays (chunk position, tf),
+    sorted by position within each term. Everything except the term and
+    doc_id dictionaries is mapped read-only, so worker processes share one
+    copy of the index through the page cache.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.terms: Dict[str, Tuple[int, int]] = self.meta["terms"]          # term -> (start, stop)
+        self.doc_chunks: Dict[str, np.ndarray] = self.meta["doc_chunks"]     # doc_id -> positions
+        self.total_length: int = self.meta["total_length"]
+        self.docs = load_array(os.path.join(path, "postings_docs.npy"))
+        self.tfs = load_array(os.path.join(path, "postings_tfs.npy"))
+        self.lengths = load_array(os.path.join(path, "lengths.npy"))
+
+    @staticmethod
+    def write(
+        path: str,
+        ids: List[str],
+        lengths: np.ndarray,
+        records: Iterable[bytes],
+        postings: Iterable[Tuple[str, np.ndarray, np.ndarray]],
+        doc_chunks: Dict[str, np.ndarray]
+    ):
+        """
+        Write a segment directory. `postings` yields (term, positions, tfs)
+        with positions ascending.
+        """
+        os.makedirs(path, exist_ok=True)
+        terms: Dict[str, Tuple[int, int]] = {}
+        docs_parts, tf_parts, start = [], [], 0
+        for term, docs, tfs in postings:
+            terms[term] = (start, start + len(docs))
+            start += len(docs)
+            docs_parts.append(docs)
+            tf_parts.append(tfs)
+        np.save(os.path.join(path, "postings_docs.npy"),
+                np.concatenate(docs_parts).astype(np.int32) if docs_parts else np.zeros(0, np.int32))
+        np.save(os.path.join(path, "postings_tfs.npy"),
+                np.concatenate(tf_parts).astype(np.int32) if tf_parts else np.zeros(0, np.int32))
+        np.save(os.path.join(path, "lengths.npy"), lengths.astype(np.int32))
+        Segment.write_common(path, ids, records, {
+            "terms": terms,
+            "doc_chunks": doc_chunks,
+            "total_length": int(lengths.sum()),
+        })
+
+
+class BM25Index(JournaledIndex):
+    """
+    Inverted-index BM25 engine with incremental add/delete, safe to share
+    between worker processes (see JournaledIndex for the on-disk layout).
+
+    Journal entries carry pre-computed term frequencies, so loading never
+    re-tokenizes the collection. In memory each process holds a tombstone
+    mask over the memory-mapped segment plus a small delta index of
+    journaled chunks.
+    """
+
+    def __init__(
+        self,
+        index_dir: str,
+        k1: float = 1.5,
+        b: float = 0.75,
+        compact_bytes: int = 64 * 1024 * 1024,
+        refresh_interval: float = 1.0
+    ):
+        self.k1 = k1
+        self.b = b
+        super().__init__(index_dir, compact_bytes, refresh_interval)
+
+    def _reset(self):
+        self._alive = np.ones(len(self._segment) if self._segment else 0, dtype=bool)
+        self._base_live = len(self._alive)
+        self._base_length = self._segment.total_length if self._segment else 0
+        # Delta: chunks journaled since the segment was written
+        self.postings: Dict[str, Dict[str, int]] = {}      # term -> {chunk_id: tf}
+        self.doc_lengths: Dict[str, int] = {}              # chunk_id -> token count
+        self.chunk_terms: Dict[str, Dict[str, int]] = {}   # chunk_id -> {term: tf}
+        self.chunks: Dict[str, Tuple[str, Dict[str, Any]]] = {}  # chunk_id -> (text, metadata)
+        self.doc_chunks: Dict[str, List[str]] = {}         # doc_id -> [chunk_id]
+        self.total_length = 0
+
+    def _open_segment(self, path: str) -> BM25Segment:
+        return BM25Segment(path)
+
+    def _has_tombstones(self) -> bool:
+        return self._base_live < len(self._alive)
+
+    def _touched(self, entry: Dict[str, Any]) -> Iterable[str]:
+        if entry["op"] == "delete":
+            return [entry["doc_id"]]
+        return [metadata.get("doc_id") for _, _, metadata, _ in entry["chunks"]]
+
+    def __len__(self) -> int:
+        return self._base_live + len(self.doc_lengths)
+
+    def exists(self) -> bool:
+        return super().exists() or \
+            os.path.exists(os.path.join(self.index_dir, LEGACY_SNAPSHOT_FILE)) or \
+            os.path.exists(os.path.join(self.index_dir, LEGACY_JOURNAL_FILE))
+
+    # ------------------------------------------------------------------
+    # In-memory mutations
+    # ------------------------------------------------------------------
+
+    def _add_chunk(self, chunk_id: str, text: str, metadata: Dict[str, Any], terms: Dict[str, int]):
+        replaced = chunk_id in self.chunks
+        if replaced:
+            self._remove_chunk(chunk_id)
+        elif self._segment is not None:
+            position = self._segment.find(chunk_id)
+            if position is not None:
+                self._kill(np.array([position]))
+
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[chunk_id] = tf
+        length = sum(terms.values())
+        self.doc_lengths[chunk_id] = length
+        self.chunk_terms[chunk_id] = terms
+        self.chunks[chunk_id] = (text, metadata)
+        self.total_length += length
+
+        doc_id = metadata.get("doc_id")
+        if doc_id is not None:
+            chunk_ids = self.doc_chunks.setdefault(doc_id, [])
+            if not replaced or chunk_id not in chunk_ids:
+                chunk_ids.append(chunk_id)
+
+    def _remove_chunk(self, chunk_id: str):
+        terms = self.chunk_terms.pop(chunk_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(chunk_id, 0)
+        self.chunks.pop(chunk_id, None)
+
+    def _kill(self, positions: np.ndarray) -> int:
+        """
+        Tombstone segment chunks. Returns how many were still alive.
+        """
+        positions = positions[self._alive[positions]]
+        self._alive[positions] = False
+        self._base_live -= len(positions)
+        self._base_length -= int(self._segment.lengths[positions].sum())
+        return len(positions)
+
+    def _delete_doc(self, doc_id: str) -> int:
+        removed = 0
+        if self._segment is not None and doc_id in self._segment.doc_chunks:
+            removed += self._kill(self._segment.doc_chunks[doc_id])
+        chunk_ids = self.doc_chunks.pop(doc_id, [])
+        for chunk_id in chunk_ids:
+            self._remove_chunk(chunk_id)
+        return removed + len(chunk_ids)
+
+    def _apply(self, entry: Dict[str, Any]):
+        if entry["op"] == "add":
+            for chunk_id, text, metadata, terms in entry["chunks"]:
+                self._add_chunk(chunk_id, text, metadata, terms)
+        elif entry["op"] == "delete":
+            self._delete_doc(entry["doc_id"])
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def add_documents(self, ids: List[str], documents: List[Document]):
+        """
+        Index chunks under the given ids. Cost is proportional to the number of
+        tokens in the new chunks, not to the size of the collection.
+        """
+        if not documents:
+            return
+        entry = {
+            "op": "add",
+            "chunks": [
+                [chunk_id, doc.page_content, dict(doc.metadata), dict(Counter(tokenize(doc.page_content)))]
+                for chunk_id, doc in zip(ids, documents)
+            ]
+        }
+        with self._writing():
+            self._apply(entry)
+            self._append_journal(entry)
+
+    def delete_document(self, doc_id: str) -> int:
+        """
+        Remove every chunk belonging to doc_id. Returns the number of chunks removed.
+        """
+        entry = {"op": "delete", "doc_id": doc_id}
+        with self._writing():
+            removed = self._delete_doc(doc_id)
+            if removed:
+                self._append_journal(entry)
+        return removed
+
+    def _resolve_docs(self, doc_ids: List[str]) -> Tuple[np.ndarray, Set[str]]:
+        """
+        Live segment positions (ascending) and delta chunk ids for the given documents.
+        """
+        parts = []
+        delta: Set[str] = set()
+        for doc_id in doc_ids:
+            if self._segment is not None and doc_id in self._segment.doc_chunks:
+                parts.append(self._segment.doc_chunks[doc_id])
+            delta.update(self.doc_chunks.get(doc_id, ()))
+        positions = np.unique(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+        return positions[self._alive[positions]], delta
+
+    def search(self, query: str, k: int = 20, filters: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        """
+        Return the top-k (chunk_id, score) pairs for the query.
+
+        A doc_id constraint in `filters` is resolved to a chunk mask up front and
+        applied while walking postings, so a filtered query only touches the
+        selected documents. Any other metadata conditions are checked on the
+        scored candidates in rank order.
+        """
+        self.maybe_refresh()
+        terms = Counter(tokenize(query))
+        doc_ids, remaining = split_doc_filter(filters)
+        with self._lock:
+            n = len(self)
+            if not n or not terms:
+                return []
+            avgdl = (self._base_length + self.total_length) / n
+            segment = self._segment if self._segment is not None and len(self._segment) else None
+            # Writers flip tombstones in place, so searches get their own copy
+            alive = self._alive.copy() if self._has_tombstones() else None
+
+            base_mask, delta_mask = None, None
+            if doc_ids is not None:
+                base_mask, delta_mask = self._resolve_docs(doc_ids)
+                if not len(base_mask) and not delta_mask:
+                    return []
+
+            # The delta dicts change under writers: copy what the query needs, as
+            # term -> (df, [(chunk_id, tf, length)]), and score after releasing the lock
+            delta_terms: Dict[str, Tuple[int, List[Tuple[str, int, int]]]] = {}
+            for term in terms:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                if delta_mask is None:
+                    matched = postings.items()
+                elif len(delta_mask) < len(postings):
+                    matched = ((chunk_id, postings[chunk_id]) for chunk_id in delta_mask if chunk_id in postings)
+                else:
+                    matched = ((chunk_id, tf) for chunk_id, tf in postings.items() if chunk_id in delta_mask)
+                delta_terms[term] = (len(postings), [(c, tf, self.doc_lengths[c]) for c, tf in matched])
+            delta_metadata = {
+                chunk_id: self.chunks[chunk_id][1]
+                for _, matched in delta_terms.values() for chunk_id, _, _ in matched
+            } if remaining else {}
+
+        k1, b = self.k1, self.b
+        # Segment scores are accumulated densely: over all positions, or over the mask
+        base_scores = None
+        if segment is not None:
+            base_scores = np.zeros(len(segment) if base_mask is None else len(base_mask))
+        delta_scores: Dict[str, float] = {}
+
+        for term, qtf in terms.items():
+            start, stop = segment.terms.get(term, (0, 0)) if segment is not None else (0, 0)
+            docs = segment.docs[start:stop] if stop > start else None
+            df, matched = delta_terms.get(term, (0, []))
+            if docs is None and not df:
+                continue
+
+            if docs is not None:
+                df += int(np.count_nonzero(alive[docs])) if alive is not None else len(docs)
+            if not df:
+                continue
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5)) * qtf
+
+            if docs is not None:
+                tfs = segment.tfs[start:stop]
+                if base_mask is None:
+                    targets, tf = docs, tfs
+                else:
+                    index = np.searchsorted(docs, base_mask)
+                    found = index < len(docs)
+                    found[found] = docs[index[found]] == base_mask[found]
+                    targets, tf = np.nonzero(found)[0], tfs[index[found]]
+                positions = docs if base_mask is None else base_mask[targets]
+                tf = tf.astype(np.float64)
+                norm = k1 * (1 - b + b * segment.lengths[positions] / avgdl)
+                base_scores[targets] += idf * tf * (k1 + 1) / (tf + norm)
+
+            for chunk_id, tf, length in matched:
+                norm = k1 * (1 - b + b * length / avgdl)
+                delta_scores[chunk_id] = delta_scores.get(chunk_id, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+
+        # Candidates as (score, chunk_id, segment position or None)
+        candidates: List[Tuple[float, str, Optional[int]]] = [
+            (score, chunk_id, None) for chunk_id, score in delta_scores.items()
+        ]
+        if base_scores is not None:
+            if base_mask is None and alive is not None:
+                base_scores[~alive] = 0.0
+            hits = np.nonzero(base_scores)[0]
+            if not remaining and len(hits) > k:
+                hits = hits[np.argpartition(base_scores[hits], -k)[-k:]]
+            positions = hits if base_mask is None else base_mask[hits]
+            candidates.extend(
+                (float(base_scores[hit]), segment.chunk_id(position), int(position))
+                for hit, position in zip(hits, positions)
+            )
+
+        ranked = sorted(candidates, key=lambda c: c[0], reverse=True)
+        if not remaining:
+            return [(chunk_id, score) for score, chunk_id, _ in ranked[:k]]
+
+        results = []
+        for score, chunk_id, position in ranked:
+            metadata = delta_metadata[chunk_id] if position is None else segment.record(position)[1]
+            if matches_filter(metadata, remaining):
+                results.append((chunk_id, score))
+                if len(results) == k:
+                    break
+        return results
+
+    def get_documents(self, hits: List[Tuple[str, float]]) -> List[Document]:
+        documents = []
+        with self._lock:
+            for chunk_id, score in hits:
+                chunk = self.chunks.get(chunk_id)
+                if chunk is None and self._segment is not None:
+                    position = self._segment.find(chunk_id)
+                    if position is not None and self._alive[position]:
+                        chunk = self._segment.record(position)
+                if chunk is None:
+                    continue
+                text, metadata = chunk
+                documents.append(Document(page_content=text, metadata={**metadata, "score": score}, id=chunk_id))
+        return documents
+
+    def doc_ids(self) -> Set[str]:
+        """
+        doc_ids with at least one live chunk.
+        """
+        with self._lock:
+            docs = {doc_id for doc_id, chunk_ids in self.doc_chunks.items() if chunk_ids}
+            if self._segment is not None:
+                docs.update(
+                    doc_id for doc_id, positions in self._segment.doc_chunks.items()
+                    if self._alive[positions].any()
+                )
+            return docs
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            segment_terms = self._segment.terms if self._segment is not None else {}
+            return {
+                "chunks": len(self),
+                "documents": len(self.doc_ids()),
+                "terms": len(segment_terms) + sum(1 for term in self.postings if term not in segment_terms),
+                "generation": self.generation,
+                "segment_chunks": self._base_live,
+                "journal_chunks": len(self.doc_lengths),
+                "tombstones": len(self._alive) - self._base_live,
+                "disk_bytes": self.disk_bytes(),
+            }
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def _migrate_locked(self):
+        """
+        Convert an index in the pre-segment format (pickle snapshot + journal).
+        """
+        if os.path.exists(self.current_path) or not self._load_legacy():
+            return
+        self._compact_locked()
+        for name in (LEGACY_SNAPSHOT_FILE, LEGACY_JOURNAL_FILE):
+            path = os.path.join(self.index_dir, name)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _load_legacy(self) -> bool:
+        snapshot_path = os.path.join(self.index_dir, LEGACY_SNAPSHOT_FILE)
+        journal_path = os.path.join(self.index_dir, LEGACY_JOURNAL_FILE)
+        if not os.path.exists(snapshot_path) and not os.path.exists(journal_path):
+            return False
+        self._segment = None
+        self._reset()
+        if os.path.exists(snapshot_path):
+            with open(snapshot_path, "rb") as f:
+                state = pickle.load(f)
+            self.postings = state["postings"]
+            self.doc_lengths = state["doc_lengths"]
+            self.chunk_terms = state["chunk_terms"]
+            self.chunks = state["chunks"]
+            self.doc_chunks = state["doc_chunks"]
+            self.total_length = state["total_length"]
+        if os.path.exists(journal_path):
+            with open(journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._apply(json.loads(line))
+                    except json.JSONDecodeError:
+                        break
+        return True
+
+    def rebuild(self, ids: List[str], documents: List[Document]):
+        """
+        Replace the whole index with the given chunks and write a fresh segment.
+        Only used to bootstrap from an existing vector store.
+        """
+        with self._lock, self._file_lock():
+            # Not closed: a search running without the lock may still read it
+            self._segment = None
+            self._reset()
+            for chunk_id, doc in zip(ids, documents):
+                self._add_chunk(chunk_id, doc.page_content, dict(doc.metadata), dict(Counter(tokenize(doc.page_content))))
+            self.generation = self._read_generation()
+            self._compact_locked()
+
+    def _write_segment(self, path: str):
+        segment = self._segment
+        live = np.nonzero(self._alive)[0] if segment is not None else np.zeros(0, dtype=np.int64)
+        delta_ids = list(self.chunks)
+        base_count = len(live)
+
+        # Segment positions are renumbered densely: surviving chunks first, then the delta
+        remap = np.full(len(segment) if segment is not None else 0, -1, dtype=np.int64)
+        remap[live] = np.arange(base_count)
+        delta_positions = {chunk_id: base_count + i for i, chunk_id in enumerate(delta_ids)}
+
+        def postings():
+            segment_terms = segment.terms if segment is not None else {}
+            for term in sorted(set(segment_terms) | set(self.postings)):
+                docs_parts, tf_parts = [], []
+                if term in segment_terms:
+                    start, stop = segment_terms[term]
+                    docs = remap[segment.docs[start:stop]]
+                    keep = docs >= 0
+                    docs_parts.append(docs[keep])
+                    tf_parts.append(np.asarray(segment.tfs[start:stop])[keep])
+                delta = self.postings.get(term)
+                if delta:
+                    docs_parts.append(np.fromiter((delta_positions[c] for c in delta), dtype=np.int64, count=len(delta)))
+                    tf_parts.append(np.fromiter(delta.values(), dtype=np.int64, count=len(delta)))
+                docs = np.concatenate(docs_parts)
+                if not len(docs):
+                    continue
+                order = np.argsort(docs, kind="stable")
+                yield term, docs[order], np.concatenate(tf_parts)[order]
+
+        def records():
+            for position in live:
+                yield segment.raw_record(int(position))
+            for chunk_id in delta_ids:
+                yield json.dumps(self.chunks[chunk_id], ensure_ascii=False).encode("utf-8")
+
+        doc_chunks: Dict[str, List[int]] = {}
+        if segment is not None:
+            for doc_id, positions in segment.doc_chunks.items():
+                kept = remap[positions]
+                kept = kept[kept >= 0]
+                if len(kept):
+                    doc_chunks[doc_id] = list(kept)
+        for doc_id, chunk_ids in self.doc_chunks.items():
+            doc_chunks.setdefault(doc_id, []).extend(delta_positions[c] for c in chunk_ids)
+
+        ids = ([segment.chunk_id(int(p)) for p in live] if segment is not None else []) + delta_ids
+        lengths = np.concatenate([
+            np.asarray(segment.lengths)[live] if segment is not None else np.zeros(0, dtype=np.int64),
+            np.fromiter((self.doc_lengths[c] for c in delta_ids), dtype=np.int64, count=len(delta_ids)),
+        ])
+
+        BM25Segment.write(
+            path, ids, lengths, records(), postings(),
+            {doc_id: np.asarray(positions, dtype=np.int64) for doc_id, positions in doc_chunks.items()}
+        )
+
+
+class BM25IndexRetriever(BaseRetriever):
+    """
+    LangChain retriever over a shared BM25Index.
+    """
+    index: Any
+    k: int = 20
+    filters: Optional[Dict[str, Any]] = None
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self.index.get_documents(self.index.search(query, k=self.k, filters=self.filters))
@@ -0,0 +1,257 @@
+import sys
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Set
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from app.core.metrics import STAGE_LATENCY
+
+# Tag for entries whose results may change when any document changes (unfiltered queries)
+GLOBAL_SCOPE = "*"
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+
+def freeze(value: Any) -> Hashable:
+    """
+    Turn a (possibly nested) filter dict into a hashable, order-independent key.
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(sorted((freeze(v) for v in value), key=repr))
+    return value
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with per-entry TTL, an entry-count cap and an
+    approximate memory cap. Entries can carry tags so a group of them can be
+    invalidated at once (e.g. every result that may include a given doc_id).
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        max_bytes: Optional[int] = None,
+        sizeof: Callable[[Any], int] = sys.getsizeof
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (value, expires_at, size, tags)
+        self._tags: Dict[str, Set[Hashable]] = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key: Hashable) -> Any:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[1] < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any, tags: Iterable[str] = ()):
+        if not self.enabled:
+            return
+        size = self.sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        tags = frozenset(tags)
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, time.monotonic() + self.ttl_seconds, size, tags)
+            self.bytes += size
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+
+            while self._data and (
+                len(self._data) > self.max_entries
+                or (self.max_bytes is not None and self.bytes > self.max_bytes)
+            ):
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def invalidate_tags(self, tags: Iterable[str]) -> int:
+        removed = 0
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+                    removed += 1
+            self.invalidations += removed
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._tags.clear()
+            self.bytes = 0
+
+    def _remove(self, key: Hashable):
+        value, _, size, tags = self._data.pop(key)
+        self.bytes -= size
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+class SemanticAnswerCache(TTLCache):
+    """
+    Chat answers looked up by query similarity instead of exact key. Values
+    are dicts with the lookup "scope" (filters, history, model), the unit-length
+    query "vector", a "sources_key" identifying the context the answer was
+    generated from, and whatever the caller needs to replay the answer.
+    Inherits LRU/TTL/byte limits and tag invalidation (tag by source doc_id).
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, max_bytes: int, threshold: float):
+        super().__init__(max_entries, ttl_seconds, max_bytes=max_bytes, sizeof=lambda value: value["size"])
+        self.threshold = threshold
+        self.stale = 0
+
+    @staticmethod
+    def unit(vector: List[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def search(self, scope: Hashable, vector: List[float]) -> Optional[tuple]:
+        """
+        Most similar live entry in `scope` above the threshold, as (value, similarity).
+        Doesn't count a hit or miss: the caller still has to check the sources.
+        """
+        if not self.enabled:
+            return None
+        query = self.unit(vector)
+        now = time.monotonic()
+        with self._lock:
+            candidates = [
+                (key, entry[0]) for key, entry in self._data.items()
+                if entry[0]["scope"] == scope and entry[1] >= now
+            ]
+            if not candidates:
+                return None
+            similarities = np.stack([value["vector"] for _, value in candidates]) @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+            key, value = candidates[best]
+            self._data.move_to_end(key)
+            return value, float(similarities[best])
+
+    def record(self, result: str):
+        """
+        Count a lookup outcome: "hit", "miss", or "stale" (a similar question
+        whose sources have changed since; it is replaced by the new answer).
+        """
+        with self._lock:
+            if result == "hit":
+                self.hits += 1
+            else:
+                self.misses += 1
+                if result == "stale":
+                    self.stale += 1
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats["stale"] = self.stale
+        return stats
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Wraps an Embeddings model so repeated queries skip the model entirely.
+    Document (ingest) embeddings are passed through uncached.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: TTLCache):
+        self.embeddings = embeddings
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = normalize_query(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            with STAGE_LATENCY.time(stage="query_embedding"):
+                vector = self.embeddings.embed_query(text)
+            self.cache.set(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = normalize_query(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            with STAGE_LATENCY.time(stage="query_embedding"):
+                vector = await self.embeddings.aembed_query(text)
+            self.cache.set(key, vector)
+        return vector
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed many queries at once. Cached vectors are reused and the rest go to
+        the model as one bulk request, so a large batch yields to interactive
+        queries instead of flooding their queue. A single miss is embedded as
+        an ordinary query.
+        """
+        keys = [normalize_query(text) for text in texts]
+        vectors = [self.cache.get(key) for key in keys]
+        missing: Dict[str, str] = {}
+        for key, text, vector in zip(keys, texts, vectors):
+            if vector is None:
+                missing.setdefault(key, text)
+        if not missing:
+            return vectors
+
+        with STAGE_LATENCY.time(stage="query_embedding"):
+            if len(missing) == 1:
+                embedded = [await self.embeddings.aembed_query(next(iter(missing.values())))]
+            else:
+                embedded = await self.embeddings.aembed_documents(list(missing.values()))
+        fresh = dict(zip(missing, embedded))
+        for key, vector in fresh.items():
+            self.cache.set(key, vector)
+        return [vector if vector is not None else fresh[key] for key, vector in zip(keys, vectors)]
@@ -1,26 +1,47 @@
 import json
+import time
+import uuid
 import asyncio
-from typing import AsyncGenerator, List, Dict
-from openai import AsyncOpenAI
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, Hashable, List, Optional, Set
 from app.core.config import get_settings
+from app.core.metrics import (
+    registry, STAGE_LATENCY, CHAT_TTFT, CHAT_TOKENS_PER_SECOND, CHAT_REQUESTS, CHAT_IN_FLIGHT, ANSWER_CACHE_LOOKUPS
+)
+from app.services.rerank import retrieval_pipeline
 from app.services.vector_store import vector_service
+from app.services.cache import SemanticAnswerCache, freeze, normalize_query
+from app.services.hashing import hash_text
+from app.services.context_packer import build_context_packer
+from app.services.llm_client import LLMClient
+from app.services.streaming import format_event
 
 settings = get_settings()
 
+
+class ClientDisconnected(Exception):
+    pass
+
+
 class ChatService:
     def __init__(self):
-        # Initialize OpenAI Client for DeepSeek or OpenAI
-        if settings.LLM_PROVIDER == "deepseek":
-            self.client = AsyncOpenAI(
-                api_key=settings.DEEPSEEK_API_KEY,
-                base_url="https://api.deepseek.com"
-            )
-            self.model = "deepseek-chat"
-        else:
-            self.client = AsyncOpenAI(
-                api_key=settings.OPENAI_API_KEY
-            )
-            self.model = "gpt-3.5-turbo"
+        # Pooled upstream client with concurrency limits, retries and provider failover
+        self.llm = LLMClient()
+        self.model = self.llm.model
+        self.packer = build_context_packer(self.model)
+        
+        # Opt-in: answers replayed for similar questions over unchanged sources
+        self.answer_cache = SemanticAnswerCache(
+            max_entries=settings.ANSWER_CACHE_MAX_ENTRIES if settings.ANSWER_CACHE_ENABLED else 0,
+            ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+            max_bytes=settings.ANSWER_CACHE_MAX_BYTES,
+            threshold=settings.ANSWER_CACHE_SIMILARITY
+        )
+        vector_service.change_listeners.append(self._on_documents_changed)
+        registry.callback(
+            "retriv_answer_cache_entries",
+            "Chat answers currently cached",
+            lambda: [({}, self.answer_cache.stats()["entries"])]
+        )
         
         self.system_prompt = """
         You are a strict AI assistant. Answer the user's question solely based on the provided context.
@@ -28,27 +49,144 @@ class ChatService:
         Do not make up facts.
         """
 
+    def _on_documents_changed(self, doc_ids: Optional[Set[str]]):
+        if doc_ids is None:
+            self.answer_cache.clear()
+        else:
+            self.answer_cache.invalidate_tags(doc_ids)
+
+    def _answer_scope(self, filters: Optional[Dict[str, Any]], history: Optional[List[Dict]]) -> Hashable:
+        # Answers are only reused for the same document filter, conversation and model
+        turns = [(m.get("role"), normalize_query(m.get("content") or "")) for m in history or []]
+        return freeze(filters), hash_text(json.dumps(turns)), self.model
+
+    @staticmethod
+    async def _until_disconnected(is_disconnected: Callable[[], Awaitable[bool]], interval: float = 0.1):
+        while not await is_disconnected():
+            await asyncio.sleep(interval)
+
+    async def _unless_disconnected(self, coro, is_disconnected: Optional[Callable[[], Awaitable[bool]]]):
+        """
+        Await `coro`, cancelling it (and the search/embedding work it queued)
+        if the client disconnects first.
+        """
+        if is_disconnected is None:
+            return await coro
+        work = asyncio.ensure_future(coro)
+        watcher = asyncio.ensure_future(self._until_disconnected(is_disconnected))
+        done = set()
+        try:
+            done, _ = await asyncio.wait([work, watcher], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            watcher.cancel()
+            if work not in done:
+                work.cancel()
+        if work in done:
+            return work.result()
+        # Wait for the cancellation to land so queued work is really dropped
+        try:
+            await work
+        except asyncio.CancelledError:
+            pass
+        raise ClientDisconnected()
+
+    def _replay(
+        self,
+        entry: Dict[str, Any],
+        similarity: float,
+        timings: Dict[str, float],
+        timed_out: List[str],
+        request_start: float
+    ):
+        """
+        Re-emit a cached answer as the original sources/token/done event sequence.
+        """
+        yield {'type': 'sources', 'sources': entry['sources']}
+        CHAT_TTFT.observe(time.perf_counter() - request_start)
+        timings["ttft_ms"] = round((time.perf_counter() - request_start) * 1000, 2)
+        for content in entry["tokens"]:
+            yield {'type': 'token', 'content': content}
+        timings["total_ms"] = round((time.perf_counter() - request_start) * 1000, 2)
+        done_data = {
+            'type': 'done',
+            'timings': timings,
+            'context': entry['context'],
+            'cache': {'hit': True, 'similarity': round(similarity, 4)}
+        }
+        if timed_out:
+            done_data['timed_out'] = timed_out
+        yield done_data
+
     async def stream_chat(
+        self,
+        query: str,
+        doc_ids: List[str] = None,
+        history: List[Dict] = None,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None
+    ) -> AsyncGenerator[str, None]:
+        """
+        The answer as plain SSE frames, one per event. The HTTP endpoint goes
+        through the streaming transport (coalescing, resume) instead.
+        """
+        async for event in self.events(query, doc_ids=doc_ids, history=history, is_disconnected=is_disconnected):
+            yield format_event(event)
+
+    async def events(
         self, 
         query: str, 
         doc_ids: List[str] = None, 
-        history: List[Dict] = None
-    ) -> AsyncGenerator[str, None]:
-        
+        history: List[Dict] = None,
+        is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Sources, token, done and error events for one question.
+        """
+        request_start = time.perf_counter()
+        CHAT_IN_FLIGHT.inc()
+        status = "ok"
+        stream = None
         try:
-            # 1. Retrieval (Hybrid)
+            # 1. Retrieval (Hybrid) + 2. Rerank
             filters = None
             if doc_ids:
                 filters = {"doc_id": {"$in": doc_ids}}
                 
-            retriever = vector_service.get_retriever(k=20, filters=filters)
-            docs = await retriever.ainvoke(query)
+            top_docs, timings, timed_out = await self._unless_disconnected(
+                retrieval_pipeline.run(query, filters=filters), is_disconnected
+            )
             
-            # 2. Simple Rerank (Take Top 5)
-            top_docs = docs[:5]
+            # 3. Pack context and history into the token budget
+            context_start = time.perf_counter()
+            packed_docs, packing = self.packer.pack_documents(top_docs)
             
-            # 3. Format Context
-            context_str = "\n\n".join([d.page_content for d in top_docs])
+            # Answer cache: a similar question answered from exactly these passages
+            cache_entry = None
+            if self.answer_cache.enabled:
+                lookup_start = time.perf_counter()
+                # Already embedded (and cached) by the vector search
+                vector = await vector_service.embeddings.aembed_query(query)
+                cache_entry = {
+                    "scope": self._answer_scope(filters, history),
+                    "vector": SemanticAnswerCache.unit(vector),
+                    "sources_key": tuple(sorted(hash_text(d.page_content) for d in packed_docs)),
+                    "key": uuid.uuid4().hex,
+                }
+                match = self.answer_cache.search(cache_entry["scope"], vector)
+                result = "miss"
+                if match is not None:
+                    cached, similarity = match
+                    result = "hit" if cached["sources_key"] == cache_entry["sources_key"] else "stale"
+                    # A stale answer is overwritten by this one
+                    cache_entry["key"] = cached["key"]
+                self.answer_cache.record(result)
+                ANSWER_CACHE_LOOKUPS.inc(result=result)
+                timings["answer_cache_ms"] = round((time.perf_counter() - lookup_start) * 1000, 2)
+                if result == "hit":
+                    for event in self._replay(cached, similarity, timings, timed_out, request_start):
+                        yield event
+                    return
+            
+            context_str = "\n\n".join([d.page_content for d in packed_docs])
             
             # 4. Stream Sources
             sources = [
@@ -57,35 +195,46 @@ class ChatService:
                     "score": d.metadata.get("score", 0),
                     "source": d.metadata.get("filename", "unknown")
                 } 
-                for d in top_docs
+                for d in packed_docs
             ]
-            yield f"data: {json.dumps({'type': 'sources', 'sources': sources})}\n\n"
+            yield {'type': 'sources', 'sources': sources}
             
             # 5. Prepare Messages
+            system_content = f"{self.system_prompt}\n\nContext:\n{context_str}"
             messages = [
-                {"role": "system", "content": f"{self.system_prompt}\n\nContext:\n{context_str}"},
+                {"role": "system", "content": system_content},
             ]
             
-            # Add history if needed (simplified for now)
-            if history:
-                for msg in history:
-                    # Ensure role is valid (user/assistant)
-                    if msg.get("role") in ["user", "assistant"]:
-                        messages.append({"role": msg["role"], "content": msg["content"]})
+            # Recent turns verbatim, older ones summarized
+            history_messages, history_stats = self.packer.pack_history(history or [])
+            messages.extend(history_messages)
+            packing.update(history_stats)
             
             messages.append({"role": "user", "content": query})
+            packing["prompt_tokens"] = (
+                self.packer.counter.count(system_content)
+                + packing["history_tokens"]
+                + self.packer.counter.count(query)
+            )
+            context_elapsed = time.perf_counter() - context_start
+            STAGE_LATENCY.observe(context_elapsed, stage="context_assembly")
+            timings["context_ms"] = round(context_elapsed * 1000, 2)
             
             # 6. Stream Response
             # Set stream_options={"include_usage": True} to get usage stats in the last chunk
-            stream = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
+            llm_start = time.perf_counter()
+            upstream: Dict[str, Any] = {}
+            stream = self.llm.stream(
+                messages,
+                meta=upstream,
                 max_tokens=1024,
-                stream=True,
                 stream_options={"include_usage": True}
             )
             
             usage_info = None
+            first_token_at = None
+            token_events = 0
+            answer_tokens: List[str] = []
             
             async for chunk in stream:
                 # Handle usage if present (usually in the last chunk with empty choices)
@@ -103,17 +252,58 @@ class ChatService:
                     
                 delta = chunk.choices[0].delta
                 if delta.content:
-                    yield f"data: {json.dumps({'type': 'token', 'content': delta.content})}\n\n"
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        CHAT_TTFT.observe(first_token_at - request_start)
+                    token_events += 1
+                    answer_tokens.append(delta.content)
+                    yield {'type': 'token', 'content': delta.content}
                 
-            # 7. Done with usage
-            done_data = {'type': 'done'}
+            # 7. Done with usage and timings
+            end = time.perf_counter()
+            STAGE_LATENCY.observe(end - llm_start, stage="llm_stream")
+            timings["llm_ms"] = round((end - llm_start) * 1000, 2)
+            if first_token_at is not None:
+                timings["ttft_ms"] = round((first_token_at - request_start) * 1000, 2)
+                tokens = usage_info["completion_tokens"] if usage_info else token_events
+                if end > first_token_at:
+                    tokens_per_s = tokens / (end - first_token_at)
+                    CHAT_TOKENS_PER_SECOND.observe(tokens_per_s)
+                    timings["tokens_per_s"] = round(tokens_per_s, 1)
+            timings["total_ms"] = round((end - request_start) * 1000, 2)
+
+            done_data = {'type': 'done', 'timings': timings, 'context': packing, 'upstream': upstream}
+            if timed_out:
+                # Retrieval stages dropped at the deadline, kept apart from the numeric timings
+                done_data['timed_out'] = timed_out
             if usage_info:
                 done_data['usage'] = usage_info
                 
-            yield f"data: {json.dumps(done_data)}\n\n"
+            yield done_data
+            
+            if cache_entry is not None and answer_tokens:
+                cache_entry.update(
+                    sources=sources,
+                    tokens=answer_tokens,
+                    context=packing,
+                    size=1024 + 4 * len(cache_entry["vector"]) + sum(len(t) for t in answer_tokens)
+                    + sum(len(source["text"]) for source in sources)
+                )
+                doc_ids = {d.metadata.get("doc_id") for d in packed_docs}
+                self.answer_cache.set(cache_entry["key"], cache_entry, tags=[d for d in doc_ids if d])
             
+        except ClientDisconnected:
+            # Nobody is listening; the stage work has been cancelled
+            status = "disconnected"
         except Exception as e:
+            status = "error"
             # Yield error message instead of raising, to prevent connection drop without info
-            yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+            yield {'type': 'error', 'message': str(e)}
+        finally:
+            # Release the upstream slot and connection right away if the client went away mid-stream
+            if stream is not None:
+                await stream.aclose()
+            CHAT_IN_FLIGHT.dec()
+            CHAT_REQUESTS.inc(status=status)
 
 chat_service = ChatService()
@@ -0,0 +1,252 @@
+from typing import Any, Dict, List, Tuple
+from langchain_core.documents import Document
+from app.core.config import get_settings
+
+settings = get_settings()
+
+# Shortest suffix/prefix match treated as splitter overlap rather than coincidence
+MIN_OVERLAP_CHARS = 16
+# Don't bother truncating a chunk or message into less than this
+MIN_FRAGMENT_TOKENS = 32
+
+
+class TokenCounter:
+    """
+    tiktoken-based counting and truncation. The encoding is loaded on first use;
+    if it can't be (tiktoken fetches BPE files on first run, which fails offline)
+    counts fall back to a ~4 characters per token estimate.
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+        self._encoding = None
+        self._loaded = False
+
+    @property
+    def encoding(self):
+        if not self._loaded:
+            self._loaded = True
+            try:
+                import tiktoken
+                try:
+                    self._encoding = tiktoken.encoding_for_model(self.model)
+                except KeyError:
+                    # Non-OpenAI models (e.g. deepseek-chat): close enough for budgeting
+                    self._encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                print(f"tiktoken unavailable, estimating tokens from length: {e}")
+        return self._encoding
+
+    def count(self, text: str) -> int:
+        if self.encoding is None:
+            return (len(text) + 3) // 4
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int, keep: str = "head") -> str:
+        """
+        Cut text to at most max_tokens, keeping its beginning ("head") or end ("tail").
+        """
+        if self.encoding is None:
+            chars = max_tokens * 4
+            return text[:chars] if keep == "head" else text[-chars:]
+        tokens = self.encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        tokens = tokens[:max_tokens] if keep == "head" else tokens[-max_tokens:]
+        return self.encoding.decode(tokens)
+
+
+def _overlap(left: str, right: str, max_chars: int) -> int:
+    """
+    Length of the longest suffix of `left` that is a prefix of `right`
+    (at least MIN_OVERLAP_CHARS, at most max_chars), or 0.
+    """
+    for size in range(min(len(left), len(right), max_chars), MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _group_key(doc: Document) -> Tuple[Any, Any]:
+    # Chunks can only be neighbours within one document (and one PDF page)
+    return doc.metadata.get("doc_id"), doc.metadata.get("page")
+
+
+def _score(doc: Document) -> float:
+    return doc.metadata.get("score", 0) or 0
+
+
+class ContextPacker:
+    """
+    Builds the prompt context under a token budget.
+
+    Retrieved chunks are deduplicated, chunks from the same document that
+    overlap (the splitter repeats up to CHUNK_OVERLAP characters between
+    neighbours) are merged into one passage, and passages are then added by
+    score until CONTEXT_TOKEN_BUDGET is spent. History keeps the most recent
+    turns that fit HISTORY_TOKEN_BUDGET; older user turns are condensed into a
+    short summary line instead of being sent verbatim.
+    """
+
+    def __init__(
+        self,
+        counter: TokenCounter,
+        context_budget: int,
+        history_budget: int,
+        summary_budget: int,
+        max_overlap_chars: int
+    ):
+        self.counter = counter
+        self.context_budget = context_budget
+        self.history_budget = history_budget
+        self.summary_budget = summary_budget
+        # The splitter backs off to word boundaries, so allow some slack over CHUNK_OVERLAP
+        self.max_overlap_chars = max(MIN_OVERLAP_CHARS, max_overlap_chars * 2)
+
+    def _merge(self, docs: List[Document]) -> Tuple[List[Document], int, int]:
+        """
+        Drop duplicate and contained chunks and join overlapping neighbours.
+        Returns (passages, duplicates_removed, merges).
+        """
+        seen = set()
+        unique: List[Document] = []
+        for doc in docs:
+            key = doc.metadata.get("chunk_hash") or doc.page_content
+            if key not in seen:
+                seen.add(key)
+                unique.append(doc)
+        duplicates = len(docs) - len(unique)
+
+        groups: Dict[Tuple[Any, Any], List[Document]] = {}
+        for doc in unique:
+            groups.setdefault(_group_key(doc), []).append(doc)
+
+        merges = 0
+        passages: List[Document] = []
+        for group in groups.values():
+            changed = True
+            while changed and len(group) > 1:
+                changed = False
+                for i, left in enumerate(group):
+                    for j, right in enumerate(group):
+                        if i == j:
+                            continue
+                        if right.page_content in left.page_content:
+                            text = left.page_content
+                        else:
+                            size = _overlap(left.page_content, right.page_content, self.max_overlap_chars)
+                            if not size:
+                                continue
+                            text = left.page_content + right.page_content[size:]
+                        # The passage ranks as its best chunk
+                        best = left if _score(left) >= _score(right) else right
+                        merged = Document(page_content=text, metadata=dict(best.metadata), id=best.id)
+                        merged.metadata["merged_chunks"] = (
+                            left.metadata.get("merged_chunks", 1) + right.metadata.get("merged_chunks", 1)
+                        )
+                        group = [d for k, d in enumerate(group) if k not in (i, j)] + [merged]
+                        merges += 1
+                        changed = True
+                        break
+                    if changed:
+                        break
+            passages.extend(group)
+        return passages, duplicates, merges
+
+    def pack_documents(self, docs: List[Document]) -> Tuple[List[Document], Dict[str, int]]:
+        """
+        Returns the passages to put in the prompt, best first, and packing stats.
+        """
+        passages, duplicates, merges = self._merge(docs)
+        passages.sort(key=_score, reverse=True)
+
+        packed: List[Document] = []
+        used = 0
+        truncated = 0
+        for doc in passages:
+            tokens = self.counter.count(doc.page_content)
+            remaining = self.context_budget - used
+            if tokens > remaining:
+                # Only the best passage is worth cutting down; lower ones are skipped
+                # in favour of smaller passages further down that may still fit
+                if packed or remaining < MIN_FRAGMENT_TOKENS:
+                    continue
+                doc = Document(
+                    page_content=self.counter.truncate(doc.page_content, remaining),
+                    metadata={**doc.metadata, "truncated": True},
+                    id=doc.id
+                )
+                tokens = self.counter.count(doc.page_content)
+                truncated += 1
+            packed.append(doc)
+            used += tokens
+
+        return packed, {
+            "chunks_retrieved": len(docs),
+            "chunks_deduplicated": duplicates,
+            "chunks_merged": merges,
+            "passages_packed": len(packed),
+            "passages_dropped": len(passages) - len(packed),
+            "passages_truncated": truncated,
+            "context_tokens": used,
+        }
+
+    def pack_history(self, history: List[Dict[str, str]]) -> Tuple[List[Dict[str, str]], Dict[str, int]]:
+        """
+        Keep the newest turns that fit the history budget. Older user questions are
+        condensed into one system note so follow-ups keep their referents.
+        """
+        turns = [
+            {"role": msg["role"], "content": msg["content"]}
+            for msg in history
+            if msg.get("role") in ("user", "assistant") and msg.get("content")
+        ]
+
+        kept: List[Dict[str, str]] = []
+        used = 0
+        cut = len(turns)
+        for index in range(len(turns) - 1, -1, -1):
+            turn = turns[index]
+            tokens = self.counter.count(turn["content"])
+            remaining = self.history_budget - used
+            if tokens > remaining:
+                if remaining >= MIN_FRAGMENT_TOKENS:
+                    # Keep the end of the oldest turn that still partly fits
+                    content = self.counter.truncate(turn["content"], remaining, keep="tail")
+                    kept.append({"role": turn["role"], "content": content})
+                    used += self.counter.count(content)
+                    cut = index
+                break
+            kept.append(turn)
+            used += tokens
+            cut = index
+        kept.reverse()
+
+        summary_tokens = 0
+        dropped = turns[:cut]
+        questions = [turn["content"] for turn in dropped if turn["role"] == "user"]
+        if questions and self.summary_budget >= MIN_FRAGMENT_TOKENS:
+            per_question = max(MIN_FRAGMENT_TOKENS // 2, self.summary_budget // len(questions))
+            # Most recent questions win when they don't all fit
+            asked = "; ".join(" ".join(self.counter.truncate(q, per_question).split()) for q in questions)
+            summary = "Earlier in this conversation the user asked: " + self.counter.truncate(
+                asked, self.summary_budget, keep="tail"
+            )
+            summary_tokens = self.counter.count(summary)
+            kept.insert(0, {"role": "system", "content": summary})
+
+        return kept, {
+            "history_turns": len(turns),
+            "history_turns_dropped": len(dropped),
+            "history_tokens": used + summary_tokens,
+        }
+
+
+def build_context_packer(model: str) -> ContextPacker:
+    return ContextPacker(
+        TokenCounter(model),
+        context_budget=settings.CONTEXT_TOKEN_BUDGET,
+        history_budget=settings.HISTORY_TOKEN_BUDGET,
+        summary_budget=settings.HISTORY_SUMMARY_TOKEN_BUDGET,
+        max_overlap_chars=settings.CHUNK_OVERLAP
+    )
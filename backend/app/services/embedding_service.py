@@ -0,0 +1,364 @@
+import time
+import asyncio
+import platform
+import threading
+from collections import deque
+from concurrent.futures import Future, InvalidStateError
+from typing import Any, Callable, Deque, Dict, List, Optional
+from langchain_core.embeddings import Embeddings
+from app.core.config import get_settings
+from app.core.metrics import registry, THROUGHPUT_BUCKETS
+
+settings = get_settings()
+
+QUERY = "query"
+BULK = "bulk"
+
+EMBED_BATCH_SIZE = registry.histogram(
+    "retriv_embedding_batch_size",
+    "Texts per embedding model call",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+)
+EMBED_TEXTS = registry.counter(
+    "retriv_embedded_texts_total",
+    "Texts embedded, by priority and backend"
+)
+EMBED_THROUGHPUT = registry.histogram(
+    "retriv_embedding_texts_per_second",
+    "Throughput of individual embedding model calls",
+    buckets=THROUGHPUT_BUCKETS
+)
+
+
+class Encoder:
+    """
+    Synchronous batch encoder. Implementations should release the GIL while
+    computing so several service workers can encode in parallel.
+    """
+    name: str = "encoder"
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+
+class SentenceTransformerEncoder(Encoder):
+    """
+    Local sentence-transformers model on CPU, with the torch or ONNX Runtime backend.
+    """
+
+    def __init__(self, model_name: str, backend: str = "torch", threads: int = 0, onnx_file: Optional[str] = None):
+        self.name = backend
+        # Imported here: sentence-transformers pulls in torch, which alone costs seconds
+        from sentence_transformers import SentenceTransformer
+        if backend == "torch":
+            if threads:
+                import torch
+                torch.set_num_threads(threads)
+            self.model = SentenceTransformer(model_name, device="cpu")
+            return
+
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise RuntimeError(
+                f"EMBEDDING_BACKEND={backend} requires ONNX Runtime: pip install 'sentence-transformers[onnx]'"
+            ) from e
+        session_options = onnxruntime.SessionOptions()
+        if threads:
+            session_options.intra_op_num_threads = threads
+        model_kwargs: Dict[str, Any] = {"provider": "CPUExecutionProvider", "session_options": session_options}
+        if backend == "onnx-int8":
+            # Dynamically quantized weights published alongside the model
+            model_kwargs["file_name"] = onnx_file or (
+                "onnx/model_qint8_arm64.onnx" if platform.machine().lower() in ("arm64", "aarch64")
+                else "onnx/model_quint8_avx2.onnx"
+            )
+        elif onnx_file:
+            model_kwargs["file_name"] = onnx_file
+        self.model = SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        return self.model.encode(texts, batch_size=len(texts), convert_to_numpy=True, show_progress_bar=False).tolist()
+
+
+class LangChainEncoder(Encoder):
+    """
+    Adapter for LangChain embeddings (e.g. OpenAI), which batch internally.
+    """
+
+    def __init__(self, embeddings: Embeddings, name: str = "langchain"):
+        self.embeddings = embeddings
+        self.name = name
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+
+def create_encoder(provider: Optional[str] = None, backend: Optional[str] = None) -> Encoder:
+    provider = provider or settings.EMBEDDING_PROVIDER
+    if provider == "huggingface":
+        return SentenceTransformerEncoder(
+            settings.EMBEDDING_MODEL,
+            backend=backend or settings.EMBEDDING_BACKEND,
+            threads=settings.EMBEDDING_THREADS,
+            onnx_file=settings.EMBEDDING_ONNX_FILE
+        )
+    from langchain_openai import OpenAIEmbeddings
+    return LangChainEncoder(
+        OpenAIEmbeddings(model="text-embedding-3-small", openai_api_key=settings.OPENAI_API_KEY),
+        name="openai"
+    )
+
+
+class _Request:
+    """
+    One embed call. Bulk requests are split into slices that workers pick up
+    one at a time, so queued queries can run between slices.
+    """
+
+    def __init__(self, texts: List[str], priority: str):
+        self.texts = texts
+        self.priority = priority
+        self.results: List[Optional[List[float]]] = [None] * len(texts)
+        self.next = 0         # first text not yet handed to a worker
+        self.outstanding = 0  # slices handed out but not finished
+        self.future: Future = Future()
+
+
+class EmbeddingService(Embeddings):
+    """
+    Shared embedding engine with two priority queues.
+
+    Interactive queries (embed_query) always go first; concurrent queries that
+    arrive within `batch_wait_ms` of each other are encoded as one batch.
+    Bulk ingest (embed_documents) is encoded in slices of `bulk_batch_size`,
+    so a large upload delays a query by at most one slice. `workers` threads
+    encode in parallel on top of the backend's own intra-op threads.
+    """
+
+    def __init__(
+        self,
+        encoder_factory: Optional[Callable[[], Encoder]] = None,
+        workers: int = 1,
+        query_batch_size: int = 32,
+        batch_wait_ms: float = 2.0,
+        bulk_batch_size: int = 64
+    ):
+        self.encoder_factory = encoder_factory
+        self.workers = max(1, workers)
+        self.query_batch_size = max(1, query_batch_size)
+        self.batch_wait = batch_wait_ms / 1000
+        self.bulk_batch_size = max(1, bulk_batch_size)
+        self._encoder: Optional[Encoder] = None
+        self._load_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._queues: Dict[str, Deque[_Request]] = {QUERY: deque(), BULK: deque()}
+        self._threads: List[threading.Thread] = []
+        self._closed = False
+        self._stats = {priority: {"texts": 0, "batches": 0, "seconds": 0.0} for priority in (QUERY, BULK)}
+
+    @property
+    def encoder(self) -> Encoder:
+        if self._encoder is None:
+            with self._load_lock:
+                if self._encoder is None:
+                    factory = self.encoder_factory or create_encoder
+                    self._encoder = factory()
+        return self._encoder
+
+    @property
+    def backend(self) -> str:
+        return self._encoder.name if self._encoder is not None else "unloaded"
+
+    def warmup(self):
+        """
+        Load the model and run one inference so the first request doesn't pay for lazy init.
+        """
+        self.embed_query("warmup")
+
+    def _start(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"embedding-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _enqueue(self, texts: List[str], priority: str) -> Future:
+        request = _Request(texts, priority)
+        if not texts:
+            request.future.set_result([])
+            return request.future
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Embedding service is shut down")
+            self._start()
+            self._queues[priority].append(request)
+            self._cond.notify_all()
+        return request.future
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._enqueue([text], QUERY).result()[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._enqueue(list(texts), BULK).result()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        # Awaits the worker directly instead of parking a thread on it; cancelling
+        # the await drops the request if no worker has picked it up yet
+        return (await asyncio.wrap_future(self._enqueue([text], QUERY)))[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.wrap_future(self._enqueue(list(texts), BULK))
+
+    def _next_work(self):
+        """
+        Called with the lock held. Returns (priority, [(request, start, stop)]) or None.
+        """
+        queries = self._queues[QUERY]
+        if queries:
+            # Give concurrent queries a moment to coalesce into one batch
+            deadline = time.monotonic() + self.batch_wait
+            while len(queries) < self.query_batch_size and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            work = []
+            while queries and len(work) < self.query_batch_size:
+                request = queries.popleft()
+                # Running futures can't be cancelled, so results can always be set
+                if request.future.set_running_or_notify_cancel():
+                    work.append((request, 0, len(request.texts)))
+            if work:
+                return QUERY, work
+
+        bulk = self._queues[BULK]
+        while bulk and bulk[0].next == 0 and not bulk[0].future.set_running_or_notify_cancel():
+            bulk.popleft()
+        if bulk:
+            request = bulk[0]
+            start = request.next
+            stop = min(start + self.bulk_batch_size, len(request.texts))
+            request.next = stop
+            request.outstanding += 1
+            if stop == len(request.texts):
+                bulk.popleft()
+            return BULK, [(request, start, stop)]
+        return None
+
+    @staticmethod
+    def _settle(future: Future, result: Any = None, error: Optional[BaseException] = None):
+        # Another slice of the same request may have settled it already
+        try:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        except InvalidStateError:
+            pass
+
+    def _worker(self):
+        while True:
+            try:
+                if not self._work_once():
+                    return
+            except Exception as e:
+                # A dead worker would leave every later request waiting forever
+                print(f"Embedding worker error: {e}")
+
+    def _work_once(self) -> bool:
+        """
+        Encode one batch. Returns False once the service is closed.
+        """
+        with self._cond:
+            work = None
+            while work is None:
+                if self._closed:
+                    return False
+                work = self._next_work()
+                if work is None:
+                    self._cond.wait()
+        priority, slices = work
+        texts = [text for request, start, stop in slices for text in request.texts[start:stop]]
+
+        try:
+            encoder = self.encoder
+            began = time.perf_counter()
+            vectors = encoder.encode(texts)
+            elapsed = time.perf_counter() - began
+        except Exception as e:
+            with self._cond:
+                for request, _, _ in slices:
+                    self._settle(request.future, error=e)
+            return True
+
+        self._record(priority, encoder.name, len(texts), elapsed)
+        offset = 0
+        with self._cond:
+            for request, start, stop in slices:
+                request.results[start:stop] = vectors[offset:offset + stop - start]
+                offset += stop - start
+                if priority == BULK:
+                    request.outstanding -= 1
+                if priority == QUERY or (request.outstanding == 0 and request.next == len(request.texts)):
+                    self._settle(request.future, request.results)
+        return True
+
+    def _record(self, priority: str, backend: str, count: int, elapsed: float):
+        EMBED_BATCH_SIZE.observe(count, priority=priority)
+        EMBED_TEXTS.inc(count, priority=priority, backend=backend)
+        if elapsed > 0:
+            EMBED_THROUGHPUT.observe(count / elapsed, priority=priority, backend=backend)
+        with self._cond:
+            stats = self._stats[priority]
+            stats["texts"] += count
+            stats["batches"] += 1
+            stats["seconds"] += elapsed
+
+    def queue_depth(self, priority: str) -> int:
+        with self._cond:
+            return sum(len(r.texts) - r.next for r in self._queues[priority])
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = {
+                "backend": self.backend,
+                "workers": self.workers,
+                "threads": settings.EMBEDDING_THREADS or "default",
+            }
+            for priority, values in self._stats.items():
+                stats[priority] = {
+                    "texts": values["texts"],
+                    "batches": values["batches"],
+                    "avg_batch": round(values["texts"] / values["batches"], 2) if values["batches"] else 0.0,
+                    # Model throughput while encoding, excluding queue wait
+                    "texts_per_s": round(values["texts"] / values["seconds"], 1) if values["seconds"] else 0.0,
+                    "queued": sum(len(r.texts) - r.next for r in self._queues[priority]),
+                }
+            return stats
+
+    def shutdown(self):
+        with self._cond:
+            self._closed = True
+            pending = [r for queue in self._queues.values() for r in queue]
+            for queue in self._queues.values():
+                queue.clear()
+            self._cond.notify_all()
+        for request in pending:
+            self._settle(request.future, error=RuntimeError("Embedding service is shut down"))
+
+
+def build_embedding_service() -> EmbeddingService:
+    service = EmbeddingService(
+        workers=settings.EMBEDDING_WORKERS,
+        query_batch_size=settings.EMBEDDING_QUERY_BATCH_SIZE,
+        batch_wait_ms=settings.EMBEDDING_BATCH_WAIT_MS,
+        bulk_batch_size=settings.EMBEDDING_BULK_BATCH_SIZE
+    )
+    registry.callback(
+        "retriv_embedding_queue_depth",
+        "Texts waiting for the embedding model",
+        lambda: [({"priority": priority}, service.queue_depth(priority)) for priority in (QUERY, BULK)]
+    )
+    return service
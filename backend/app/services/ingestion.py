@@ -1,95 +1,406 @@
 import uuid
 import os
+import time
+import queue
 import shutil
-from typing import List
+import zipfile
+import itertools
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
 from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
 from fastapi import UploadFile, HTTPException
-from langchain_community.document_loaders import PyPDFLoader, TextLoader, UnstructuredMarkdownLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
+from app.core.config import get_settings
+from app.core.metrics import registry, INGEST_CHUNKS, INGEST_BATCH_THROUGHPUT, INGEST_JOBS
 from app.services.vector_store import vector_service
+from app.services.parsing import SUPPORTED_EXTENSIONS, Window, plan_windows, parse_window
+from app.services.hashing import hash_file
+from app.services.jobs import IngestFile, IngestJob, JobQueue
 from app.models.db import Document as DBDocument, get_session, engine
-from sqlmodel import Session
+from sqlmodel import Session, select
+
+settings = get_settings()
 
 TEMP_DIR = "./temp_uploads"
 os.makedirs(TEMP_DIR, exist_ok=True)
 
 class IngestionService:
     def __init__(self):
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=512,
-            chunk_overlap=50,
-            separators=["\n\n", "\n", " ", ""]
+        self.chunk_size = settings.CHUNK_SIZE
+        self.chunk_overlap = settings.CHUNK_OVERLAP
+        self.embed_batch_size = settings.INGEST_EMBED_BATCH_SIZE
+        self.max_pending_bytes = settings.INGEST_MAX_PENDING_BYTES
+        self.page_window = settings.INGEST_PDF_PAGE_WINDOW
+        self.byte_window = settings.INGEST_TEXT_WINDOW_BYTES
+        self.jobs = JobQueue(
+            handler=self._run_job,
+            workers=settings.INGEST_WORKERS,
+            max_queue=settings.INGEST_QUEUE_SIZE,
+            retention=settings.INGEST_JOB_RETENTION
+        )
+        self._parse_pool: Optional[ProcessPoolExecutor] = None
+        registry.callback(
+            "retriv_ingest_queue_depth",
+            "Ingest jobs waiting for a worker",
+            lambda: [({}, self.jobs.depth())]
         )
 
-    def process_file(self, file: UploadFile) -> tuple[str, int]:
-        # 1. Use UUID for filename to avoid encoding issues with non-ASCII characters in file system
-        ext = os.path.splitext(file.filename)[1]
-        safe_filename = f"{uuid.uuid4()}{ext}"
-        file_path = os.path.join(TEMP_DIR, safe_filename)
-        
-        try:
+    @property
+    def parse_pool(self) -> ProcessPoolExecutor:
+        # Workers come from a fork server that only has the parsing module loaded,
+        # so they never inherit model weights or Chroma handles from this process
+        if self._parse_pool is None:
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload(["app.services.parsing"])
+            else:
+                context = multiprocessing.get_context("spawn")
+            self._parse_pool = ProcessPoolExecutor(
+                max_workers=settings.INGEST_PARSE_PROCESSES,
+                mp_context=context
+            )
+        return self._parse_pool
+
+    def process_file(self, file: UploadFile, replace_doc_id: Optional[str] = None) -> IngestJob:
+        """
+        Save the upload and enqueue it for background ingestion.
+        Returns immediately; progress is tracked on the returned job.
+
+        With replace_doc_id the upload is a new revision of that document: it is
+        skipped if the content is unchanged, otherwise only changed chunks are
+        embedded and the old document is removed once the new one is indexed.
+        """
+        ext = os.path.splitext(file.filename)[1].lower()
+        if ext not in SUPPORTED_EXTENSIONS:
+            raise HTTPException(status_code=400, detail=f"Unsupported file type: {ext}")
+        if replace_doc_id:
+            with Session(engine) as session:
+                if not session.get(DBDocument, replace_doc_id):
+                    raise HTTPException(status_code=404, detail="Document not found")
+        return self.process_files([file], replace_doc_id=replace_doc_id)
+
+    def process_files(self, files: List[UploadFile], replace_doc_id: Optional[str] = None) -> IngestJob:
+        """
+        Enqueue several uploads as one job. Zip archives are expanded by the
+        worker, so their members are ingested without a separate request.
+        """
+        for file in files:
+            ext = os.path.splitext(file.filename)[1].lower()
+            if ext not in SUPPORTED_EXTENSIONS and ext != ".zip":
+                raise HTTPException(status_code=400, detail=f"Unsupported file type: {ext} ({file.filename})")
+
+        job = IngestJob(job_id=str(uuid.uuid4()))
+        for file in files:
+            ext = os.path.splitext(file.filename)[1].lower()
+            # Use UUID for filename to avoid encoding issues with non-ASCII characters in file system
+            file_path = os.path.join(TEMP_DIR, f"{uuid.uuid4()}{ext}")
             # Save temp file (binary mode, no encoding needed)
             with open(file_path, "wb") as buffer:
                 shutil.copyfileobj(file.file, buffer)
-            
-            # Load
-            documents = self._load_file(file_path, file.filename)
-            
-            # Split
-            chunks = self.text_splitter.split_documents(documents)
-            
-            # Generate doc_id
-            doc_id = str(uuid.uuid4())
-            
-            # Add metadata
-            # 4. Ensure metadata is safe. While Chroma supports UTF-8, some environments might trigger encoding errors.
-            # We keep original filename but ensure it's handled if it causes issues.
-            for chunk in chunks:
-                chunk.metadata.update({
-                    "doc_id": doc_id,
-                    "filename": file.filename,
-                    "created_at": datetime.now(timezone.utc).isoformat()
-                })
-            
-            # Index to Vector Store (and BM25)
-            vector_service.add_documents(chunks)
-            
-            # Record in SQL DB
-            with Session(engine) as session:
-                db_doc = DBDocument(
-                    doc_id=doc_id,
+            if ext == ".zip":
+                job.sources.append(file_path)
+            else:
+                job.files.append(IngestFile(
+                    doc_id=str(uuid.uuid4()),
                     filename=file.filename,
-                    chunk_count=len(chunks),
-                    file_path=file_path  # Keep file for future reference or delete?
+                    file_path=file_path,
+                    replaces=replace_doc_id
+                ))
+
+        self._submit(job, staged=[f.file_path for f in job.files] + job.sources)
+        return job
+
+    def process_path(self, path: str) -> IngestJob:
+        """
+        Enqueue a server-side directory (walked recursively) or zip archive.
+        Only paths under BULK_INGEST_ROOT are accepted.
+        """
+        if not settings.BULK_INGEST_ROOT:
+            raise HTTPException(status_code=403, detail="Server-side ingestion is disabled (BULK_INGEST_ROOT is not set)")
+        root = os.path.realpath(settings.BULK_INGEST_ROOT)
+        real_path = os.path.realpath(path)
+        if os.path.commonpath([root, real_path]) != root:
+            raise HTTPException(status_code=403, detail="Path is outside BULK_INGEST_ROOT")
+        if not (os.path.isdir(real_path) or (os.path.isfile(real_path) and real_path.lower().endswith(".zip"))):
+            raise HTTPException(status_code=400, detail="Path must be a directory or a .zip archive")
+
+        job = IngestJob(job_id=str(uuid.uuid4()), sources=[real_path])
+        self._submit(job, staged=[])
+        return job
+
+    def _submit(self, job: IngestJob, staged: List[str]):
+        try:
+            self.jobs.submit(job)
+        except queue.Full:
+            for file_path in staged:
+                os.remove(file_path)
+            raise HTTPException(
+                status_code=429,
+                detail="Ingestion queue is full, please retry later",
+                headers={"Retry-After": "5"}
+            )
+
+    def get_job(self, job_id: str) -> Optional[IngestJob]:
+        return self.jobs.get(job_id)
+
+    def _expand_sources(self, job: IngestJob):
+        """
+        Turn directories and zip archives into per-file entries. Files are not
+        copied yet; each one is staged just before it is parsed.
+        """
+        for source in job.sources:
+            if os.path.isdir(source):
+                root = os.path.realpath(settings.BULK_INGEST_ROOT or source)
+                for dirpath, _, filenames in os.walk(source):
+                    for name in sorted(filenames):
+                        ext = os.path.splitext(name)[1].lower()
+                        if ext not in SUPPORTED_EXTENSIONS:
+                            continue
+                        # Symlinks inside the tree may point anywhere: only read files that resolve under the root
+                        real_path = os.path.realpath(os.path.join(dirpath, name))
+                        if os.path.commonpath([root, real_path]) != root or not os.path.isfile(real_path):
+                            continue
+                        job.files.append(IngestFile(
+                            doc_id=str(uuid.uuid4()),
+                            filename=os.path.relpath(os.path.join(dirpath, name), source),
+                            file_path=os.path.join(TEMP_DIR, f"{uuid.uuid4()}{ext}"),
+                            source_path=real_path
+                        ))
+            else:
+                with zipfile.ZipFile(source) as archive:
+                    members = [
+                        member for member in archive.infolist()
+                        if not member.is_dir() and os.path.splitext(member.filename)[1].lower() in SUPPORTED_EXTENSIONS
+                    ]
+                    # Declared sizes are what zipfile extracts at most, so they can be checked up front
+                    if sum(member.file_size for member in members) > settings.INGEST_MAX_ARCHIVE_BYTES:
+                        raise ValueError(
+                            f"Archive {os.path.basename(source)} expands to more than "
+                            f"INGEST_MAX_ARCHIVE_BYTES ({settings.INGEST_MAX_ARCHIVE_BYTES} bytes)"
+                        )
+                    for member in members:
+                        ext = os.path.splitext(member.filename)[1].lower()
+                        job.files.append(IngestFile(
+                            doc_id=str(uuid.uuid4()),
+                            filename=member.filename,
+                            # Staged under a generated name, so member paths can't escape TEMP_DIR
+                            file_path=os.path.join(TEMP_DIR, f"{uuid.uuid4()}{ext}"),
+                            source_path=source,
+                            zip_member=member.filename
+                        ))
+        job.update()
+
+    def _stage(self, entry: IngestFile):
+        if entry.source_path is None:
+            return
+        limit = settings.INGEST_MAX_FILE_BYTES
+        if entry.zip_member is None:
+            if os.path.getsize(entry.source_path) > limit:
+                raise ValueError(f"File exceeds INGEST_MAX_FILE_BYTES ({limit} bytes)")
+            shutil.copyfile(entry.source_path, entry.file_path)
+        else:
+            with zipfile.ZipFile(entry.source_path) as archive:
+                if archive.getinfo(entry.zip_member).file_size > limit:
+                    raise ValueError(f"File exceeds INGEST_MAX_FILE_BYTES ({limit} bytes)")
+                with archive.open(entry.zip_member) as src, open(entry.file_path, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+
+    def _find_duplicate(self, entry: IngestFile, seen: Dict[str, str]) -> Optional[str]:
+        """
+        doc_id of an already indexed (or earlier in this job) file with identical content.
+        When replacing a document, only that document counts as a duplicate.
+        """
+        if entry.content_hash in seen:
+            return seen[entry.content_hash]
+        with Session(engine) as session:
+            statement = select(DBDocument.doc_id).where(DBDocument.content_hash == entry.content_hash)
+            if entry.replaces:
+                statement = statement.where(DBDocument.doc_id == entry.replaces)
+            return session.exec(statement).first()
+
+    def _prepare(self, entry: IngestFile, seen: Dict[str, str]) -> List[Window]:
+        """
+        Stage and hash the file, then plan its parse windows. Unchanged files
+        are marked skipped and get no windows.
+        """
+        self._stage(entry)
+        entry.content_hash = hash_file(entry.file_path)
+        duplicate = self._find_duplicate(entry, seen)
+        if duplicate:
+            os.remove(entry.file_path)
+            entry.doc_id, entry.status = duplicate, "skipped"
+            return []
+
+        seen[entry.content_hash] = entry.doc_id
+        return plan_windows(entry.file_path, entry.filename, self.page_window, self.byte_window)
+
+    def _iter_tasks(self, job: IngestJob) -> Iterator[Tuple[IngestFile, Future, bool]]:
+        """
+        Lazily submit parse windows for every file in the job, yielding
+        (entry, future, is_last_window). Files are staged only when reached.
+        """
+        seen: Dict[str, str] = {}  # content hash -> doc_id within this job
+        for entry in job.files:
+            try:
+                windows = self._prepare(entry, seen)
+            except Exception as e:
+                self._fail(job, entry, e)
+                continue
+            if not windows:
+                # Unchanged file; entry now points at the existing document
+                job.update(files_processed=job.files_processed + 1)
+                continue
+            for i, window in enumerate(windows):
+                future = self.parse_pool.submit(parse_window, entry.file_path, window, self.chunk_size, self.chunk_overlap)
+                yield entry, future, i == len(windows) - 1
+
+    def _fail(self, job: IngestJob, entry: IngestFile, error: Exception):
+        # One bad file shouldn't sink a bulk job
+        entry.status, entry.error = "failed", f"File processing failed: {str(error)}"
+        if os.path.exists(entry.file_path):
+            os.remove(entry.file_path)
+        job.update(files_processed=job.files_processed + 1)
+
+    def _flush(self, job: IngestJob, pending: List[Document]) -> List[Document]:
+        """
+        Embed and index one fixed-size batch: a single Chroma write and a
+        single BM25 update, regardless of how many files the batch spans.
+        """
+        batch, rest = pending[:self.embed_batch_size], pending[self.embed_batch_size:]
+        job.update(status="embedding")
+        start = time.perf_counter()
+        reused = vector_service.add_documents(batch)
+        elapsed = time.perf_counter() - start
+        INGEST_CHUNKS.inc(len(batch))
+        if elapsed > 0:
+            INGEST_BATCH_THROUGHPUT.observe(len(batch) / elapsed)
+        job.update(
+            status="parsing",
+            chunks_embedded=job.chunks_embedded + len(batch),
+            chunks_reused=job.chunks_reused + reused
+        )
+        return rest
+
+    def _should_flush(self, pending: List[Document]) -> bool:
+        return len(pending) >= self.embed_batch_size or \
+            sum(len(doc.page_content) for doc in pending) >= self.max_pending_bytes
+
+    def _run_job(self, job: IngestJob):
+        committed = False
+        try:
+            job.update(status="parsing")
+            self._expand_sources(job)
+
+            # 1. Stream parse windows (page ranges / byte ranges) through the parse pool.
+            # At most `window` results are in flight and at most one batch of chunks is
+            # pending, so peak memory is independent of document size.
+            window = max(1, settings.INGEST_PARSE_PROCESSES * 2)
+            tasks = self._iter_tasks(job)
+            in_flight = deque(itertools.islice(tasks, window))
+
+            pending: List[Document] = []
+            created_at = datetime.now(timezone.utc).isoformat()
+            while in_flight:
+                entry, future, last = in_flight.popleft()
+                in_flight.extend(itertools.islice(tasks, 1))
+                if entry.status == "failed":
+                    continue
+
+                try:
+                    page_count, parsed = future.result()
+                except Exception as e:
+                    # Drop whatever this file already contributed
+                    pending = [doc for doc in pending if doc.metadata["doc_id"] != entry.doc_id]
+                    vector_service.delete_document(entry.doc_id)
+                    self._fail(job, entry, e)
+                    continue
+
+                # 2. Add metadata
+                # Ensure metadata is safe. While Chroma supports UTF-8, some environments might trigger encoding errors.
+                # We keep original filename but ensure it's handled if it causes issues.
+                pending.extend(
+                    Document(page_content=text, metadata={
+                        **metadata,
+                        "doc_id": entry.doc_id,
+                        "filename": entry.filename,
+                        "created_at": created_at
+                    })
+                    for text, metadata in parsed
+                )
+                entry.pages += page_count
+                entry.chunk_count += len(parsed)
+                if last:
+                    entry.status = "completed"
+                job.update(
+                    files_processed=job.files_processed + int(last),
+                    pages_parsed=job.pages_parsed + page_count,
+                    chunks_total=job.chunks_total + len(parsed)
                 )
-                session.add(db_doc)
+
+                # 3. Embed & index in bounded batches that may span files
+                while pending and self._should_flush(pending):
+                    pending = self._flush(job, pending)
+
+            while pending:
+                pending = self._flush(job, pending)
+
+            # 4. Record every ingested file in SQL DB in one transaction
+            completed = [entry for entry in job.files if entry.status == "completed"]
+            with Session(engine) as session:
+                for entry in completed:
+                    session.add(DBDocument(
+                        doc_id=entry.doc_id,
+                        filename=entry.filename,
+                        chunk_count=entry.chunk_count,
+                        file_path=entry.file_path,  # Keep file for future reference or re-indexing
+                        content_hash=entry.content_hash
+                    ))
                 session.commit()
-            
-            # Clean up temp file? Maybe keep for re-indexing?
-            # os.remove(file_path) 
-            
-            return doc_id, len(chunks)
-            
+            committed = True
+
+            # 5. Retire documents superseded by a new revision. The new ones are already
+            # recorded, so a failure here leaves the old revision around, nothing more
+            for entry in completed:
+                if entry.replaces:
+                    try:
+                        self.delete_document(entry.replaces)
+                    except HTTPException:
+                        pass
+                    except Exception as e:
+                        print(f"Failed to retire {entry.replaces} (replaced by {entry.doc_id}): {e}")
+
+            if completed or not job.files or all(entry.status == "skipped" for entry in job.files):
+                job.update(status="completed")
+            else:
+                job.update(status="failed", error="No files could be processed")
+
         except Exception as e:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-            raise HTTPException(status_code=500, detail=f"File processing failed: {str(e)}")
-
-    def _load_file(self, file_path: str, filename: str) -> List[Document]:
-        ext = os.path.splitext(filename)[1].lower()
-        if ext == ".pdf":
-            loader = PyPDFLoader(file_path)
-        elif ext == ".md":
-            # 2/3. Ensure text loaders use UTF-8
-            loader = UnstructuredMarkdownLoader(file_path, mode="single", encoding="utf-8")
-        elif ext == ".txt":
-            # 2/3. Ensure text loaders use UTF-8
-            loader = TextLoader(file_path, encoding="utf-8")
-        else:
-            raise HTTPException(status_code=400, detail=f"Unsupported file type: {ext}")
-            
-        return loader.load()
+            # Roll back any batches that were already indexed, unless their rows are committed
+            for entry in job.files:
+                if entry.status == "skipped" or (committed and entry.status == "completed"):
+                    continue
+                try:
+                    vector_service.delete_document(entry.doc_id)
+                except Exception:
+                    pass
+                if os.path.exists(entry.file_path):
+                    os.remove(entry.file_path)
+            job.update(status="failed", error=f"File processing failed: {str(e)}")
+
+        finally:
+            INGEST_JOBS.inc(status=job.status)
+            # Uploaded archives are only needed until they've been expanded and staged
+            upload_dir = os.path.abspath(TEMP_DIR)
+            for source in job.sources:
+                if os.path.commonpath([upload_dir, os.path.abspath(source)]) == upload_dir and os.path.exists(source):
+                    os.remove(source)
+
+    def shutdown(self):
+        self.jobs.shutdown()
+        if self._parse_pool is not None:
+            self._parse_pool.shutdown(wait=False, cancel_futures=True)
 
     def delete_document(self, doc_id: str):
         # Remove from Vector Store
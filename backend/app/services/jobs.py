@@ -0,0 +1,133 @@
+import queue
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, List, Optional
+
+FINISHED_STATES = ("completed", "failed")
+
+
+@dataclass
+class IngestFile:
+    doc_id: str
+    filename: str
+    file_path: str                     # staged copy under the upload directory
+    source_path: Optional[str] = None  # server-side file or zip archive to stage from
+    zip_member: Optional[str] = None
+    replaces: Optional[str] = None     # doc_id superseded by this file once it is indexed
+    content_hash: Optional[str] = None
+    status: str = "pending"            # pending -> completed | skipped | failed
+    pages: int = 0
+    chunk_count: int = 0
+    error: Optional[str] = None
+
+
+@dataclass
+class IngestJob:
+    job_id: str
+    files: List[IngestFile] = field(default_factory=list)
+    sources: List[str] = field(default_factory=list)  # directories/archives expanded by the worker
+    status: str = "queued"  # queued -> parsing -> embedding -> completed | failed
+    files_processed: int = 0
+    pages_parsed: int = 0
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    chunks_reused: int = 0             # chunks whose embedding was already stored
+    error: Optional[str] = None
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+    @property
+    def doc_id(self) -> Optional[str]:
+        return self.files[0].doc_id if len(self.files) == 1 else None
+
+    @property
+    def filename(self) -> Optional[str]:
+        return self.files[0].filename if len(self.files) == 1 else None
+
+    @property
+    def files_total(self) -> int:
+        return len(self.files)
+
+    def update(self, **fields):
+        for key, value in fields.items():
+            setattr(self, key, value)
+        self.updated_at = datetime.now(timezone.utc)
+
+
+class JobQueue:
+    """
+    Bounded FIFO of ingest jobs drained by a fixed pool of worker threads.
+    `submit` raises queue.Full instead of blocking so callers can apply
+    backpressure. Finished jobs are kept for status lookups up to `retention`.
+    """
+
+    def __init__(self, handler: Callable[[IngestJob], None], workers: int, max_queue: int, retention: int):
+        self.handler = handler
+        self.workers = workers
+        self.retention = retention
+        self._queue: "queue.Queue[Optional[IngestJob]]" = queue.Queue(maxsize=max_queue)
+        self._jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"ingest-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, job: IngestJob):
+        self.start()
+        self._queue.put_nowait(job)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._prune()
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def active(self) -> List[IngestJob]:
+        """
+        Jobs queued or running, whose files and index writes are not committed yet.
+        """
+        with self._lock:
+            return [job for job in self._jobs.values() if job.status not in FINISHED_STATES]
+
+    def shutdown(self, timeout: float = 5.0):
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                break
+        for thread in threads:
+            thread.join(timeout=timeout)
+
+    def _prune(self):
+        excess = len(self._jobs) - self.retention
+        if excess <= 0:
+            return
+        for job_id in [j.job_id for j in self._jobs.values() if j.status in FINISHED_STATES][:excess]:
+            del self._jobs[job_id]
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                self.handler(job)
+            except Exception as e:
+                job.update(status="failed", error=str(e))
+            finally:
+                self._queue.task_done()
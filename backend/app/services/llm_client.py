@@ -0,0 +1,242 @@
+import time
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Optional
+import httpx
+import openai
+from openai import AsyncOpenAI
+from fastapi import HTTPException
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+from app.core.config import get_settings
+from app.core.metrics import registry, LLM_UPSTREAM_REQUESTS, LLM_QUEUE_WAIT
+
+settings = get_settings()
+
+DEFAULT_BASE_URLS = {"deepseek": "https://api.deepseek.com", "openai": None}
+DEFAULT_MODELS = {"deepseek": "deepseek-chat", "openai": "gpt-3.5-turbo"}
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Transient upstream failures: connection problems, timeouts, 429 and 5xx.
+    """
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError, openai.RateLimitError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+class LLMProvider:
+    """
+    One OpenAI-compatible upstream with its own pooled, keep-alive HTTP client.
+    """
+
+    def __init__(self, name: str, api_key: Optional[str], base_url: Optional[str] = None):
+        self.name = name
+        self.model = DEFAULT_MODELS[name]
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY_SECONDS
+            ),
+            # read is the longest gap between streamed chunks, not the whole answer
+            timeout=httpx.Timeout(
+                settings.LLM_READ_TIMEOUT_SECONDS,
+                connect=settings.LLM_CONNECT_TIMEOUT_SECONDS
+            )
+        )
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url or DEFAULT_BASE_URLS[name],
+            http_client=self.http_client,
+            # Retries are ours, so they can stop once tokens have been streamed
+            max_retries=0
+        )
+
+
+class CompletionLimiter:
+    """
+    Caps in-flight completions at `max_in_flight`, lets up to `max_queue`
+    requests wait (at most `queue_timeout` seconds) for a slot, and optionally
+    paces stream starts with a token bucket of `rate` requests per second.
+    """
+
+    def __init__(self, max_in_flight: int, max_queue: int, queue_timeout: float, rate: float = 0.0):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.rate = rate
+        self._semaphore: Optional[asyncio.Semaphore] = None  # bound to the serving loop on first use
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._tokens = float(max(1.0, rate))
+        self._refilled_at = time.monotonic()
+
+    def _reject(self, detail: str):
+        self.rejected += 1
+        raise HTTPException(status_code=429, detail=detail, headers={"Retry-After": "1"})
+
+    def check(self):
+        """
+        Fail fast when the queue is full, before a response has been started.
+        """
+        if self.in_flight >= self.max_in_flight and self.waiting >= self.max_queue:
+            self._reject("Too many chat requests in progress, please retry later")
+
+    async def _pace(self):
+        while True:
+            now = time.monotonic()
+            self._tokens = min(max(1.0, self.rate), self._tokens + (now - self._refilled_at) * self.rate)
+            self._refilled_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    async def acquire(self):
+        self.check()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        start = time.perf_counter()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._reject("Timed out waiting for an LLM slot, please retry later")
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            if self.rate > 0:
+                await self._pace()
+        except BaseException:
+            self.release()
+            raise
+        LLM_QUEUE_WAIT.observe(time.perf_counter() - start)
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+
+class LLMClient:
+    """
+    Upstream completion layer: the primary provider, an optional fallback,
+    a shared concurrency limiter and retries with backoff. A failure is
+    retried (and then failed over) only until the first token has been
+    received; after that the stream is committed and errors propagate.
+    """
+
+    def __init__(self):
+        self.providers: List[LLMProvider] = [self._create_provider(settings.LLM_PROVIDER, settings.LLM_BASE_URL)]
+        fallback = settings.LLM_FALLBACK_PROVIDER
+        if fallback and fallback != settings.LLM_PROVIDER:
+            self.providers.append(self._create_provider(fallback, settings.LLM_FALLBACK_BASE_URL))
+        self.limiter = CompletionLimiter(
+            max_in_flight=settings.LLM_MAX_CONCURRENCY,
+            max_queue=settings.LLM_MAX_QUEUE,
+            queue_timeout=settings.LLM_QUEUE_TIMEOUT_SECONDS,
+            rate=settings.LLM_RATE_LIMIT_PER_SECOND
+        )
+        registry.callback(
+            "retriv_llm_in_flight",
+            "Upstream completions in progress and waiting for a slot",
+            lambda: [({"state": "in_flight"}, self.limiter.in_flight), ({"state": "queued"}, self.limiter.waiting)]
+        )
+
+    @staticmethod
+    def _create_provider(name: str, base_url: Optional[str]) -> LLMProvider:
+        api_key = settings.DEEPSEEK_API_KEY if name == "deepseek" else settings.OPENAI_API_KEY
+        return LLMProvider(name, api_key, base_url)
+
+    @property
+    def model(self) -> str:
+        return self.providers[0].model
+
+    async def _open(self, provider: LLMProvider, messages: List[Dict[str, str]], **kwargs):
+        """
+        Start a stream and read up to the first content token (or the end).
+        Returns (stream, chunk_iterator, buffered_chunks).
+        """
+        stream = await provider.client.chat.completions.create(
+            model=provider.model,
+            messages=messages,
+            stream=True,
+            **kwargs
+        )
+        # One iterator throughout, so reading resumes where the probe stopped
+        chunks = stream.__aiter__()
+        buffered = []
+        try:
+            async for chunk in chunks:
+                buffered.append(chunk)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    break
+        except BaseException:
+            await stream.close()
+            raise
+        return stream, chunks, buffered
+
+    async def stream(self, messages: List[Dict[str, str]], meta: Optional[Dict[str, Any]] = None, **kwargs) -> AsyncIterator[Any]:
+        """
+        Yield completion chunks. `meta` is filled with the provider that served
+        the request and the number of attempts it took.
+        """
+        meta = meta if meta is not None else {}
+        await self.limiter.acquire()
+        stream = chunks = buffered = None
+        try:
+            # 1. Connect, retrying transient errors, then fail over to the next provider
+            attempts = 0
+            last_error: Optional[BaseException] = None
+            for index, provider in enumerate(self.providers):
+                try:
+                    async for attempt in AsyncRetrying(
+                        retry=retry_if_exception(is_retryable),
+                        stop=stop_after_attempt(settings.LLM_MAX_RETRIES + 1),
+                        wait=wait_exponential_jitter(initial=settings.LLM_RETRY_BACKOFF_SECONDS, max=8),
+                        reraise=True
+                    ):
+                        with attempt:
+                            attempts += 1
+                            try:
+                                stream, chunks, buffered = await self._open(provider, messages, **kwargs)
+                            except Exception as e:
+                                LLM_UPSTREAM_REQUESTS.inc(provider=provider.name, outcome="retryable" if is_retryable(e) else "error")
+                                raise
+                except Exception as e:
+                    last_error = e
+                    # A bad request would fail on the fallback too; outages and credentials are per provider
+                    if not is_retryable(e) and not isinstance(e, openai.AuthenticationError):
+                        raise
+                    if index + 1 < len(self.providers):
+                        print(f"LLM provider {provider.name} failed ({e}), failing over")
+                    continue
+                LLM_UPSTREAM_REQUESTS.inc(provider=provider.name, outcome="ok")
+                meta.update(provider=provider.name, model=provider.model, attempts=attempts)
+                break
+            if stream is None:
+                raise last_error
+
+            # 2. Committed: replay what was read while connecting, then pass through
+            for chunk in buffered:
+                yield chunk
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            # Also runs when the consumer stops early (client disconnect): free the upstream connection
+            if stream is not None:
+                await stream.close()
+            self.limiter.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "providers": [provider.name for provider in self.providers],
+            "in_flight": self.limiter.in_flight,
+            "queued": self.limiter.waiting,
+            "rejected": self.limiter.rejected,
+        }
+
+    async def aclose(self):
+        for provider in self.providers:
+            await provider.http_client.aclose()
@@ -0,0 +1,318 @@
+import os
+import time
+import asyncio
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+from fastapi import HTTPException
+from sqlmodel import Session, select
+from app.core.config import get_settings
+from app.core.metrics import registry, MAINTENANCE_RUNS, MAINTENANCE_REMOVED, MAINTENANCE_RECLAIMED_BYTES
+from app.models.db import Document as DBDocument, engine
+from app.services.ingestion import ingestion_service, TEMP_DIR
+from app.services.segments import directory_bytes
+from app.services.vector_store import vector_service
+
+settings = get_settings()
+
+# Document ids listed in a report; the counts are always complete
+REPORT_SAMPLE = 20
+# How long /metrics reuses measured index and upload directory sizes
+DISK_STATS_TTL_SECONDS = 60.0
+
+
+class MaintenanceService:
+    """
+    Reconciles the Document table with the vector/BM25 indexes and the
+    upload directory, removes what no document owns, and compacts indexes
+    that accumulated deletes.
+
+    Orphans are only removed after being seen in two runs at least
+    `orphan_grace` apart, and upload files only once they are that old, so
+    ingest jobs still running (in this or another worker) are never touched.
+    Runs are safe to repeat and to overlap across workers: deletes are
+    idempotent and compaction holds the index file lock.
+    """
+
+    def __init__(self):
+        self.interval = settings.MAINTENANCE_INTERVAL_SECONDS
+        self.orphan_grace = settings.MAINTENANCE_ORPHAN_GRACE_SECONDS
+        self.batch_size = max(1, settings.MAINTENANCE_BATCH_SIZE)
+        self.compact_ratio = settings.MAINTENANCE_COMPACT_TOMBSTONE_RATIO
+        self.upload_retention = settings.MAINTENANCE_UPLOAD_RETENTION_DAYS * 86400
+        self.last_report: Optional[Dict[str, Any]] = None
+        self.next_run_at: Optional[datetime] = None
+        # doc_id -> when it was first found without a Document row
+        self._suspects: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._disk_sizes: List[Tuple[Dict[str, str], int]] = []
+        self._disk_measured_at = float("-inf")
+        registry.callback(
+            "retriv_index_disk_bytes",
+            "On-disk size of the local indexes and stored uploads",
+            self._disk_samples
+        )
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def _measure_disk(self) -> List[Tuple[Dict[str, str], int]]:
+        samples = [({"index": "bm25"}, directory_bytes(vector_service.bm25_index.index_dir))]
+        if vector_service.ready:
+            samples.extend(
+                ({"index": f"vector/{shard.name}"}, shard.index.disk_bytes())
+                for shard in vector_service.vector_store.shards if shard.index is not None
+            )
+        samples.append(({"index": "uploads"}, directory_bytes(TEMP_DIR)))
+        self._disk_sizes, self._disk_measured_at = samples, time.monotonic()
+        return samples
+
+    def _disk_samples(self):
+        # Walking the directories costs O(files); scrapes reuse the last measurement
+        if time.monotonic() - self._disk_measured_at >= DISK_STATS_TTL_SECONDS:
+            return self._measure_disk()
+        return self._disk_sizes
+
+    def run(self, dry_run: bool = False, compact: bool = False, orphan_grace: Optional[float] = None) -> Dict[str, Any]:
+        """
+        One maintenance pass. With dry_run nothing is deleted or compacted and
+        the report shows what would be. `compact` forces compaction of every
+        local index; `orphan_grace` overrides the configured grace period.
+        Raises 409 while another run in this process is in progress.
+        """
+        if not self._lock.acquire(blocking=False):
+            raise HTTPException(status_code=409, detail="Maintenance is already running")
+        start = time.perf_counter()
+        report: Dict[str, Any] = {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "dry_run": dry_run,
+        }
+        try:
+            grace = self.orphan_grace if orphan_grace is None else orphan_grace
+            report["orphans"] = self._reconcile_indexes(grace, dry_run)
+            report["uploads"] = self._reconcile_uploads(grace, dry_run)
+            report["compaction"] = self._compact(compact, dry_run)
+            report["index"] = self._index_stats()
+            self._measure_disk()
+            report["bytes_reclaimed"] = report["uploads"]["bytes_reclaimed"] + \
+                sum(entry["bytes_reclaimed"] for entry in report["compaction"].values())
+            report["status"] = "ok"
+        except Exception as e:
+            report["status"] = "error"
+            report["error"] = str(e)
+            print(f"Maintenance failed: {e}")
+        finally:
+            report["duration_s"] = round(time.perf_counter() - start, 3)
+            self.last_report = report
+            self._lock.release()
+        MAINTENANCE_RUNS.inc(status=report["status"])
+        return report
+
+    def _active_jobs(self):
+        return ingestion_service.jobs.active()
+
+    def _reconcile_indexes(self, grace: float, dry_run: bool) -> Dict[str, Any]:
+        """
+        Delete index entries whose doc_id has no Document row (e.g. a job that
+        died between indexing and its database commit), and report documents
+        whose chunks are missing from the vector store.
+        """
+        # 1. Index contents first, then in-flight jobs, then the table: a job
+        # committing in between is either still active or already in the table
+        store = vector_service.vector_store
+        store.maybe_refresh()
+        vector_service.bm25_index.refresh()
+        vector_docs = store.doc_ids()
+        bm25_docs = vector_service.bm25_index.doc_ids()
+        in_flight = {entry.doc_id for job in self._active_jobs() for entry in job.files}
+        with Session(engine) as session:
+            rows = session.exec(select(DBDocument.doc_id, DBDocument.chunk_count)).all()
+        known = {doc_id for doc_id, _ in rows}
+
+        # 2. Orphans become deletable once they have stayed orphaned for the grace period
+        now = time.time()
+        orphans = (vector_docs | bm25_docs) - known - in_flight
+        self._suspects = {doc_id: self._suspects.get(doc_id, now) for doc_id in orphans}
+        expired = sorted(doc_id for doc_id, seen in self._suspects.items() if now - seen >= grace)
+
+        # 3. Delete in batches
+        deleted = 0
+        if not dry_run:
+            for start in range(0, len(expired), self.batch_size):
+                batch = expired[start:start + self.batch_size]
+                vector_service.delete_documents(batch)
+                deleted += len(batch)
+                for doc_id in batch:
+                    self._suspects.pop(doc_id, None)
+            MAINTENANCE_REMOVED.inc(deleted, kind="orphan_documents")
+
+        unindexed = sorted(doc_id for doc_id, chunk_count in rows if chunk_count and doc_id not in vector_docs)
+        return {
+            "documents": len(known),
+            "found": len(orphans),
+            "vector_only": len((vector_docs - bm25_docs) & orphans),
+            "bm25_only": len((bm25_docs - vector_docs) & orphans),
+            "pending": len(orphans) - len(expired),
+            "deleted": deleted,
+            "would_delete": len(expired) if dry_run else 0,
+            "sample": expired[:REPORT_SAMPLE],
+            # Listed for re-upload; removing them would lose the metadata row
+            "documents_without_vectors": len(unindexed),
+            "documents_without_vectors_sample": unindexed[:REPORT_SAMPLE],
+        }
+
+    def _reconcile_uploads(self, grace: float, dry_run: bool) -> Dict[str, Any]:
+        """
+        Remove upload files no document or job refers to, and with
+        MAINTENANCE_UPLOAD_RETENTION_DAYS the stored copies of old documents.
+        """
+        now = time.time()
+        files: Dict[str, os.stat_result] = {}
+        for entry in os.scandir(TEMP_DIR):
+            if entry.is_file():
+                files[os.path.abspath(entry.path)] = entry.stat()
+
+        in_use: Set[str] = set()
+        for job in self._active_jobs():
+            in_use.update(os.path.abspath(entry.file_path) for entry in job.files)
+            in_use.update(os.path.abspath(source) for source in job.sources)
+        with Session(engine) as session:
+            stored = session.exec(
+                select(DBDocument.doc_id, DBDocument.file_path, DBDocument.created_at)
+                .where(DBDocument.file_path.is_not(None))
+            ).all()
+        referenced = {os.path.abspath(file_path) for _, file_path, _ in stored}
+        missing = sum(1 for _, file_path, _ in stored if os.path.abspath(file_path) not in files)
+
+        unreferenced = [
+            path for path, stat in files.items()
+            if path not in referenced and path not in in_use and now - stat.st_mtime >= grace
+        ]
+        retired: Dict[str, str] = {}  # doc_id -> stored file
+        if self.upload_retention > 0:
+            cutoff = now - self.upload_retention
+            retired = {
+                doc_id: os.path.abspath(file_path) for doc_id, file_path, created_at in stored
+                if os.path.abspath(file_path) in files and _timestamp(created_at) < cutoff
+            }
+
+        reclaimed = sum(files[path].st_size for path in unreferenced + list(retired.values()))
+        if not dry_run:
+            for path in unreferenced:
+                _remove(path)
+            if retired:
+                # Clear the reference first so a crash never leaves a row pointing at nothing
+                with Session(engine) as session:
+                    for doc_id in retired:
+                        doc = session.get(DBDocument, doc_id)
+                        if doc:
+                            doc.file_path = None
+                            session.add(doc)
+                    session.commit()
+                for path in retired.values():
+                    _remove(path)
+            MAINTENANCE_REMOVED.inc(len(unreferenced) + len(retired), kind="uploads")
+            MAINTENANCE_RECLAIMED_BYTES.inc(reclaimed, source="uploads")
+
+        return {
+            "files": len(files),
+            "unreferenced": len(unreferenced),
+            "retired": len(retired),
+            "missing": missing,
+            "bytes_reclaimed": 0 if dry_run else reclaimed,
+            "would_reclaim": reclaimed if dry_run else 0,
+        }
+
+    def _compact(self, force: bool, dry_run: bool) -> Dict[str, Dict[str, Any]]:
+        """
+        Compact local indexes whose deleted share reached
+        MAINTENANCE_COMPACT_TOMBSTONE_RATIO (every one with `force`).
+        """
+        indexes = {"bm25": vector_service.bm25_index}
+        for shard in vector_service.vector_store.shards:
+            if shard.index is not None:
+                indexes[f"vector/{shard.name}"] = shard.index
+
+        results = {}
+        for name, index in indexes.items():
+            stats = index.get_stats()
+            live = stats.get("segment_chunks", stats.get("segment_rows", 0))
+            dead_ratio = stats["tombstones"] / (live + stats["tombstones"]) if stats["tombstones"] else 0.0
+            due = force or dead_ratio >= self.compact_ratio
+            entry = {
+                "tombstones": stats["tombstones"],
+                "dead_ratio": round(dead_ratio, 4),
+                "due": due,
+                "compacted": False,
+                "bytes_before": stats["disk_bytes"],
+                "bytes_after": stats["disk_bytes"],
+                "bytes_reclaimed": 0,
+            }
+            if due and not dry_run:
+                index.compact()
+                entry["compacted"] = True
+                entry["bytes_after"] = index.disk_bytes()
+                # The previous generation stays on disk until the next compaction
+                entry["bytes_reclaimed"] = max(0, entry["bytes_before"] - entry["bytes_after"])
+                MAINTENANCE_RECLAIMED_BYTES.inc(entry["bytes_reclaimed"], source="compaction")
+            results[name] = entry
+        return results
+
+    def _index_stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {
+            "bm25": vector_service.bm25_index.get_stats(),
+            "vector": {shard.name: shard.get_stats() for shard in vector_service.vector_store.shards},
+            "uploads_bytes": directory_bytes(TEMP_DIR),
+        }
+        if settings.VECTOR_BACKEND == "chroma" and not settings.CHROMA_HOST:
+            stats["chroma_bytes"] = directory_bytes(settings.CHROMA_PERSIST_DIRECTORY)
+        return stats
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "interval_seconds": self.interval,
+            "next_run_at": self.next_run_at.isoformat() if self.next_run_at else None,
+            "pending_orphans": len(self._suspects),
+            "last_report": self.last_report,
+        }
+
+    async def run_periodically(self):
+        """
+        Scheduler loop started by the app lifespan when MAINTENANCE_INTERVAL_SECONDS > 0.
+        The first run happens one interval after startup.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            self.next_run_at = datetime.fromtimestamp(time.time() + self.interval, timezone.utc)
+            await asyncio.sleep(self.interval)
+            if not vector_service.ready or self.running:
+                continue
+            try:
+                report = await loop.run_in_executor(None, lambda: self.run(dry_run=False))
+                print(
+                    f"Maintenance: {report['status']}, {report.get('orphans', {}).get('deleted', 0)} orphan documents, "
+                    f"{report.get('uploads', {}).get('unreferenced', 0)} upload files, "
+                    f"{report.get('bytes_reclaimed', 0)} bytes reclaimed in {report['duration_s']}s"
+                )
+            except HTTPException:
+                # An admin-triggered run got there first
+                pass
+
+
+def _timestamp(value: datetime) -> float:
+    # SQLite returns naive datetimes; they are stored in UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+maintenance_service = MaintenanceService()
@@ -0,0 +1,82 @@
+# Document parsing and splitting. Kept free of vector store and model imports
+# so it can run in worker processes without loading embeddings or opening Chroma.
+import os
+from typing import List, Dict, Any, Tuple
+from pypdf import PdfReader
+from langchain_core.documents import Document
+from langchain_community.document_loaders import UnstructuredMarkdownLoader
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+SUPPORTED_EXTENSIONS = {".pdf", ".md", ".txt"}
+
+# A window is the unit of work handed to a parse worker:
+# ("pages", start, stop) for PDFs, ("bytes", start, stop) for text, ("file", 0, 0) otherwise
+Window = Tuple[str, int, int]
+
+
+def plan_windows(file_path: str, filename: str, page_window: int, byte_window: int) -> List[Window]:
+    """
+    Cut a file into independently parseable windows so that only a bounded
+    slice of it is ever materialized. Cheap: reads the PDF page tree or seeks
+    through the text file, without extracting any content.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == ".pdf":
+        page_count = len(PdfReader(file_path).pages)
+        return [("pages", start, min(start + page_window, page_count)) for start in range(0, page_count, page_window)]
+    if ext == ".txt":
+        # Cut on line boundaries so windows never split a UTF-8 sequence or a line
+        windows = []
+        size = os.path.getsize(file_path)
+        with open(file_path, "rb") as f:
+            start = 0
+            while start < size:
+                f.seek(min(start + byte_window, size))
+                f.readline()
+                stop = min(f.tell(), size)
+                windows.append(("bytes", start, stop))
+                start = stop
+        return windows or [("bytes", 0, 0)]
+    if ext == ".md":
+        # Unstructured parses Markdown as a whole document
+        return [("file", 0, 0)]
+    raise ValueError(f"Unsupported file type: {ext}")
+
+
+def _load_window(file_path: str, window: Window) -> List[Document]:
+    kind, start, stop = window
+    if kind == "pages":
+        reader = PdfReader(file_path)
+        return [
+            Document(page_content=reader.pages[i].extract_text() or "", metadata={"source": file_path, "page": i})
+            for i in range(start, stop)
+        ]
+    if kind == "bytes":
+        with open(file_path, "rb") as f:
+            f.seek(start)
+            # Ensure text loaders use UTF-8
+            text = f.read(stop - start).decode("utf-8")
+        return [Document(page_content=text, metadata={"source": file_path})]
+    # Ensure text loaders use UTF-8
+    return UnstructuredMarkdownLoader(file_path, mode="single", encoding="utf-8").load()
+
+
+def parse_window(
+    file_path: str,
+    window: Window,
+    chunk_size: int,
+    chunk_overlap: int
+) -> Tuple[int, List[Tuple[str, Dict[str, Any]]]]:
+    """
+    Load and split one window. Returns (pages_parsed, [(text, metadata), ...]) as
+    plain tuples so the result pickles cheaply across process boundaries.
+    """
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=["\n\n", "\n", " ", ""]
+    )
+    documents = _load_window(file_path, window)
+    chunks = splitter.split_documents(documents)
+    pages = len(documents) if window[0] == "pages" else int(window[1] == 0)
+    return pages, [(chunk.page_content, chunk.metadata) for chunk in chunks]
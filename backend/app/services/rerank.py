@@ -0,0 +1,297 @@
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+from langchain_core.documents import Document
+from app.core.config import get_settings
+from app.core.metrics import STAGE_LATENCY
+from app.services.vector_store import vector_service
+
+settings = get_settings()
+
+
+def _doc_key(doc: Document) -> Tuple[Any, str]:
+    # Chunk ids are not always populated by LangChain retrievers, so fall back to content
+    return doc.id or (doc.metadata.get("doc_id"), doc.page_content)
+
+
+def reciprocal_rank_fusion(
+    ranked_lists: List[List[Document]],
+    weights: Optional[List[float]] = None,
+    k: int = 60
+) -> List[Document]:
+    """
+    Fuse several ranked lists with (weighted) Reciprocal Rank Fusion:
+    score(d) = sum_i w_i / (k + rank_i(d)). The fused score is stored in
+    metadata["rrf_score"] and metadata["score"] of new Document objects;
+    the input documents are left untouched.
+    """
+    weights = weights or [1.0] * len(ranked_lists)
+    scores: Dict[Any, float] = {}
+    docs: Dict[Any, Document] = {}
+    for weight, ranked in zip(weights, ranked_lists):
+        for rank, doc in enumerate(ranked, start=1):
+            key = _doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + weight / (k + rank)
+            docs.setdefault(key, doc)
+
+    fused = []
+    for key in sorted(scores, key=scores.get, reverse=True):
+        doc = docs[key]
+        # Inputs may be shared between retrievers and caches, so never mutate them
+        fused.append(Document(
+            page_content=doc.page_content,
+            metadata={**doc.metadata, "rrf_score": scores[key], "score": scores[key]},
+            id=doc.id
+        ))
+    return fused
+
+
+class Reranker:
+    """
+    Second-stage reranker interface. Implementations are synchronous and
+    CPU-bound; the pipeline runs them off the event loop in batches of
+    `batch_size` candidates.
+    """
+    batch_size: int = 16
+
+    def score(self, query: str, documents: List[Document]) -> List[float]:
+        raise NotImplementedError
+
+    def warmup(self):
+        """
+        Load model weights ahead of the first query. No-op by default.
+        """
+
+
+class CrossEncoderReranker(Reranker):
+    """
+    Local sentence-transformers cross-encoder, loaded on first use.
+    """
+
+    def __init__(self, model_name: str, batch_size: int = 16):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self._model = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import CrossEncoder
+            self._model = CrossEncoder(self.model_name, device="cpu")
+        return self._model
+
+    def warmup(self):
+        self.model.predict([("warmup", "warmup")], show_progress_bar=False)
+
+    def score(self, query: str, documents: List[Document]) -> List[float]:
+        pairs = [(query, doc.page_content) for doc in documents]
+        scores = self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+        return [float(s) for s in scores]
+
+
+def build_reranker() -> Optional[Reranker]:
+    if settings.RERANKER == "cross-encoder":
+        return CrossEncoderReranker(settings.RERANK_MODEL, batch_size=settings.RERANK_BATCH_SIZE)
+    return None
+
+
+class RetrievalPipeline:
+    """
+    Two-stage retrieval: recall RETRIEVAL_TOP_K candidates from the vector and
+    BM25 retrievers concurrently, fuse them with RRF, then optionally rerank
+    down to RERANK_TOP_N with a cross-encoder.
+    """
+
+    def __init__(self, reranker: Optional[Reranker] = None):
+        self.reranker = reranker
+        self.recall_k = settings.RETRIEVAL_TOP_K
+        self.top_n = settings.RERANK_TOP_N
+        self.rrf_k = settings.RRF_K
+        self.timeout = settings.RETRIEVAL_TIMEOUT_SECONDS
+        self.ready = False
+        self.startup_report: Dict[str, Any] = {}
+        self.warmup_error: Optional[str] = None
+        self.weights = [settings.VECTOR_WEIGHT, settings.BM25_WEIGHT]
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.RERANK_MAX_WORKERS,
+            thread_name_prefix="rerank"
+        )
+
+    async def _timed(self, coro, timings: Dict[str, float], name: str):
+        start = time.perf_counter()
+        try:
+            return await coro
+        finally:
+            elapsed = time.perf_counter() - start
+            timings[f"{name}_ms"] = round(elapsed * 1000, 2)
+            STAGE_LATENCY.observe(elapsed, stage=name)
+
+    async def _rerank(self, query: str, documents: List[Document]) -> List[Document]:
+        # Split candidates into batches and score them in parallel on the pool;
+        # the model releases the GIL during inference
+        loop = asyncio.get_running_loop()
+        batch_size = max(1, self.reranker.batch_size)
+        batches = [documents[i:i + batch_size] for i in range(0, len(documents), batch_size)]
+        results = await asyncio.gather(*[
+            loop.run_in_executor(self.executor, self.reranker.score, query, batch)
+            for batch in batches
+        ])
+        scores = [score for batch_scores in results for score in batch_scores]
+
+        for doc, score in zip(documents, scores):
+            doc.metadata["rerank_score"] = score
+            doc.metadata["score"] = score
+        return sorted(documents, key=lambda d: d.metadata["rerank_score"], reverse=True)
+
+    async def run(
+        self,
+        query: str,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[Document], Dict[str, float], List[str]]:
+        """
+        Returns the final documents, per-stage timings in milliseconds and the
+        stages that missed the deadline.
+
+        Everything runs within RETRIEVAL_TIMEOUT_SECONDS: a retriever that
+        misses the deadline is dropped (and listed in the timed-out stages),
+        and a rerank that would overrun falls back to the fused order. Only
+        if no retriever finishes in time does the request fail.
+        """
+        timings: Dict[str, float] = {}
+        timed_out: List[str] = []
+        start = time.perf_counter()
+        deadline = start + self.timeout
+
+        # 1. Recall, both retrievers concurrently
+        if not vector_service.ready:
+            # Wait for startup warmup so an early query doesn't skip the BM25 half
+            await asyncio.get_running_loop().run_in_executor(None, vector_service.warmup)
+        searches = [("vector", vector_service.avector_search)]
+        if len(vector_service.bm25_index):
+            searches.append(("bm25", vector_service.akeyword_search))
+        tasks = [
+            asyncio.ensure_future(self._timed(search(query, self.recall_k, filters), timings, name))
+            for name, search in searches
+        ]
+        done, pending = set(), set(tasks)
+        try:
+            done, pending = await asyncio.wait(tasks, timeout=max(0.0, deadline - time.perf_counter()))
+        finally:
+            # Also on cancellation (client gone): queued embedding/scoring work is skipped
+            for task in pending:
+                task.cancel()
+            # Let the cancellations land before reading anything
+            await asyncio.gather(*pending, return_exceptions=True)
+        ranked_lists, weights = [], []
+        for (name, _), task, weight in zip(searches, tasks, self.weights):
+            if task not in done:
+                timed_out.append(name)
+                continue
+            ranked_lists.append(task.result())
+            weights.append(weight)
+        if not ranked_lists:
+            raise TimeoutError(f"Retrieval exceeded {self.timeout:g}s")
+
+        # 2. Fuse
+        fusion_start = time.perf_counter()
+        candidates = reciprocal_rank_fusion(ranked_lists, weights=weights, k=self.rrf_k)[:self.recall_k]
+        fusion_elapsed = time.perf_counter() - fusion_start
+        timings["fusion_ms"] = round(fusion_elapsed * 1000, 2)
+        STAGE_LATENCY.observe(fusion_elapsed, stage="fusion")
+
+        # 3. Rerank with whatever time is left
+        if self.reranker and candidates:
+            try:
+                candidates = await asyncio.wait_for(
+                    self._timed(self._rerank(query, candidates), timings, "rerank"),
+                    timeout=max(0.0, deadline - time.perf_counter())
+                )
+            except asyncio.TimeoutError:
+                timed_out.append("rerank")
+
+        elapsed = time.perf_counter() - start
+        timings["retrieval_total_ms"] = round(elapsed * 1000, 2)
+        STAGE_LATENCY.observe(elapsed, stage="retrieval_total")
+        return candidates[:self.top_n], timings, timed_out
+
+    async def search_batch(
+        self,
+        queries: List[str],
+        ks: List[int],
+        filters: List[Optional[Dict[str, Any]]],
+        mode: str = "hybrid",
+        rerank: bool = False
+    ) -> Tuple[List[List[Document]], Dict[str, float]]:
+        """
+        Retrieval without generation for many queries at once. `mode` is
+        hybrid (vector + BM25 fused with RRF), vector or keyword; `rerank`
+        applies the cross-encoder, if one is configured, to each query's
+        candidates. Returns the top ks[i] documents per query and batch timings.
+
+        Unlike run() there is no deadline: this serves offline and bulk
+        callers, who want complete results rather than a fast partial answer.
+        """
+        timings: Dict[str, Any] = {}
+        start = time.perf_counter()
+        if not vector_service.ready:
+            await asyncio.get_running_loop().run_in_executor(None, vector_service.warmup)
+        rerank = rerank and self.reranker is not None
+        # Fusion and reranking need a deeper candidate list than the final k
+        recall = [max(k, self.recall_k) if mode == "hybrid" or rerank else k for k in ks]
+
+        # 1. Recall: every query against each index in one batched call
+        searches = []
+        if mode in ("hybrid", "vector"):
+            searches.append(("search_vector", vector_service.avector_search_batch))
+        if mode in ("hybrid", "keyword") and len(vector_service.bm25_index):
+            searches.append(("search_bm25", vector_service.akeyword_search_batch))
+        ranked = await asyncio.gather(*[
+            self._timed(search(queries, recall, filters), timings, name) for name, search in searches
+        ])
+
+        # 2. Fuse
+        if mode == "hybrid":
+            fusion_start = time.perf_counter()
+            weights = self.weights[:len(ranked)]
+            candidates = [
+                reciprocal_rank_fusion([lists[i] for lists in ranked], weights=weights, k=self.rrf_k)[:recall[i]]
+                for i in range(len(queries))
+            ]
+            timings["fusion_ms"] = round((time.perf_counter() - fusion_start) * 1000, 2)
+        else:
+            candidates = ranked[0] if ranked else [[] for _ in queries]
+
+        # 3. Rerank
+        if rerank:
+            candidates = await self._timed(
+                asyncio.gather(*[self._rerank(query, docs) for query, docs in zip(queries, candidates)]),
+                timings,
+                "search_rerank"
+            )
+
+        timings["search_total_ms"] = round((time.perf_counter() - start) * 1000, 2)
+        return [docs[:k] for docs, k in zip(candidates, ks)], timings
+
+    def warmup(self) -> Dict[str, Any]:
+        """
+        Load the retrieval models: embeddings, vector store, BM25 and the reranker.
+        Failures are recorded rather than raised so the app stays live.
+        """
+        try:
+            report = dict(vector_service.warmup())
+            if self.reranker:
+                start = time.perf_counter()
+                self.reranker.warmup()
+                report["reranker_s"] = round(time.perf_counter() - start, 3)
+        except Exception as e:
+            self.warmup_error = str(e)
+            print(f"Warmup failed: {e}")
+            return {}
+        self.startup_report = report
+        self.warmup_error = None
+        self.ready = True
+        return report
+
+
+retrieval_pipeline = RetrievalPipeline(reranker=build_reranker())
@@ -0,0 +1,95 @@
+import json
+import time
+from typing import Any, AsyncGenerator, Dict, List, Optional
+from langchain_core.documents import Document
+from app.core.config import get_settings
+from app.core.metrics import SEARCH_QUERIES
+from app.models.schemas import BatchSearchRequest, SearchHit, SearchQuery, SearchRequest, SearchResponse
+from app.services.rerank import retrieval_pipeline
+
+settings = get_settings()
+
+
+def _filters(query: SearchQuery) -> Optional[Dict[str, Any]]:
+    return {"doc_id": {"$in": query.doc_ids}} if query.doc_ids else None
+
+
+def to_hit(doc: Document) -> SearchHit:
+    metadata = dict(doc.metadata)
+    score = metadata.pop("score", 0.0) or 0.0
+    return SearchHit(
+        chunk_id=doc.id,
+        doc_id=metadata.get("doc_id"),
+        filename=metadata.get("filename"),
+        score=float(score),
+        text=doc.page_content,
+        metadata=metadata
+    )
+
+
+class SearchService:
+    """
+    Retrieval without generation, for evaluation jobs and services that need
+    ranked chunks rather than an answer. Batches go through the pipeline in
+    chunks: each chunk's queries are embedded together and scored as one
+    matrix product per filter, so throughput is bounded by compute instead
+    of per-request overhead.
+    """
+
+    def __init__(self):
+        self.chunk_size = max(1, settings.SEARCH_BATCH_CHUNK_SIZE)
+
+    async def _search(self, queries: List[SearchQuery], mode: str, rerank: bool):
+        results, timings = await retrieval_pipeline.search_batch(
+            [q.query for q in queries],
+            [q.k for q in queries],
+            [_filters(q) for q in queries],
+            mode=mode,
+            rerank=rerank
+        )
+        SEARCH_QUERIES.inc(len(queries), mode=mode)
+        return results, timings
+
+    async def search(self, request: SearchRequest) -> SearchResponse:
+        results, timings = await self._search([request], request.mode, request.rerank)
+        return SearchResponse(query=request.query, hits=[to_hit(doc) for doc in results[0]], timings=timings)
+
+    async def stream_batch(self, request: BatchSearchRequest) -> AsyncGenerator[str, None]:
+        """
+        NDJSON: one {"type": "result"} line per query in request order, then a
+        {"type": "done"} line with summed stage timings. Each chunk is written
+        as soon as it is scored, so clients can consume results while later
+        chunks are still being computed.
+        """
+        start = time.perf_counter()
+        totals: Dict[str, float] = {}
+        offset = 0
+        try:
+            for offset in range(0, len(request.queries), self.chunk_size):
+                chunk = request.queries[offset:offset + self.chunk_size]
+                results, timings = await self._search(chunk, request.mode, request.rerank)
+                for name, value in timings.items():
+                    totals[name] = round(totals.get(name, 0.0) + value, 2)
+                yield "".join(
+                    json.dumps({
+                        "type": "result",
+                        "index": offset + i,
+                        "query": query.query,
+                        "hits": [to_hit(doc).model_dump() for doc in docs]
+                    }) + "\n"
+                    for i, (query, docs) in enumerate(zip(chunk, results))
+                )
+            elapsed = time.perf_counter() - start
+            done = {
+                "type": "done",
+                "count": len(request.queries),
+                "timings": totals,
+                "queries_per_s": round(len(request.queries) / elapsed, 1) if elapsed > 0 else 0.0
+            }
+            yield json.dumps(done) + "\n"
+        except Exception as e:
+            # Results already streamed stay valid; report where the batch stopped
+            yield json.dumps({"type": "error", "index": offset, "message": str(e)}) + "\n"
+
+
+search_service = SearchService()
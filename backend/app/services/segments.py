@@ -0,0 +1,351 @@
+# Shared on-disk machinery for the local indexes (BM25, vectors): immutable
+# memory-mapped segments written by compaction, an append-only journal of
+# changes since then, and a generation counter that worker processes poll.
+import os
+import json
+import mmap
+import time
+import pickle
+import shutil
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process deployments only
+    fcntl = None
+
+CURRENT_FILE = "CURRENT"
+LOCK_FILE = "LOCK"
+SEGMENTS_DIR = "segments"
+
+
+def load_array(path: str) -> np.ndarray:
+    try:
+        return np.load(path, mmap_mode="r")
+    except ValueError:
+        # Empty arrays can't be memory-mapped
+        return np.load(path)
+
+
+def directory_bytes(path: str) -> int:
+    """
+    Total size of the files under path (0 if it doesn't exist).
+    """
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                # Removed by a concurrent compaction
+                pass
+    return total
+
+
+def encode_keys(keys: List[str]) -> np.ndarray:
+    return np.array([key.encode("utf-8") for key in keys], dtype="S") if keys else np.zeros(0, "S1")
+
+
+class Segment:
+    """
+    Base for an immutable segment directory: chunk ids with a sorted lookup,
+    a record file of (text, metadata) addressed by an offsets array, and a
+    pickled dict of small in-memory structures. Subclasses add their own arrays.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.pkl"), "rb") as f:
+            self.meta: Dict[str, Any] = pickle.load(f)
+        self.ids = load_array(os.path.join(path, "ids.npy"))
+        self.sorted_ids = load_array(os.path.join(path, "sorted_ids.npy"))
+        self.id_order = load_array(os.path.join(path, "id_order.npy"))
+        self.offsets = load_array(os.path.join(path, "offsets.npy"))
+        self._store_file = open(os.path.join(path, "records.bin"), "rb")
+        size = os.fstat(self._store_file.fileno()).st_size
+        self.store = mmap.mmap(self._store_file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def size_bytes(self) -> int:
+        return sum(os.path.getsize(os.path.join(self.path, name)) for name in os.listdir(self.path))
+
+    def chunk_id(self, position: int) -> str:
+        return self.ids[position].decode("utf-8")
+
+    def find(self, chunk_id: str) -> Optional[int]:
+        key = chunk_id.encode("utf-8")
+        i = int(np.searchsorted(self.sorted_ids, key))
+        if i < len(self.sorted_ids) and self.sorted_ids[i] == key:
+            return int(self.id_order[i])
+        return None
+
+    def raw_record(self, position: int) -> bytes:
+        return self.store[int(self.offsets[position]):int(self.offsets[position + 1])]
+
+    def record(self, position: int):
+        text, metadata = json.loads(self.raw_record(position))
+        return text, metadata
+
+    @staticmethod
+    def write_common(path: str, ids: List[str], records: Iterable[bytes], meta: Dict[str, Any]):
+        os.makedirs(path, exist_ok=True)
+        encoded = encode_keys(ids)
+        order = np.argsort(encoded, kind="stable")
+        np.save(os.path.join(path, "ids.npy"), encoded)
+        np.save(os.path.join(path, "sorted_ids.npy"), encoded[order])
+        np.save(os.path.join(path, "id_order.npy"), order.astype(np.int64))
+
+        offsets = [0]
+        with open(os.path.join(path, "records.bin"), "wb") as f:
+            for record in records:
+                f.write(record)
+                offsets.append(offsets[-1] + len(record))
+        np.save(os.path.join(path, "offsets.npy"), np.asarray(offsets, dtype=np.int64))
+
+        with open(os.path.join(path, "meta.pkl"), "wb") as f:
+            pickle.dump(meta, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def close(self):
+        if isinstance(self.store, mmap.mmap):
+            self.store.close()
+        self._store_file.close()
+
+
+class JournaledIndex:
+    """
+    Segment + journal persistence shared by the local indexes, safe to use
+    from several worker processes.
+
+    On disk: a generation counter (CURRENT), the segment written by the last
+    compaction and a JSON-lines journal of operations since then. Writers
+    serialize on a file lock and catch up with the journal before appending;
+    readers poll the generation and journal size (at most every
+    `refresh_interval` seconds) and replay what other processes wrote.
+
+    Subclasses implement _reset, _apply, _touched, _open_segment and
+    _write_segment, and may override _has_tombstones and _migrate_locked.
+    """
+
+    def __init__(self, index_dir: str, compact_bytes: int, refresh_interval: float):
+        self.index_dir = index_dir
+        self.compact_bytes = compact_bytes
+        self.refresh_interval = refresh_interval
+        # Called with the doc_ids touched by other processes' writes (None: everything)
+        self.on_change: Optional[Callable[[Optional[Set[str]]], None]] = None
+        self._lock = threading.RLock()
+        self._segment: Optional[Segment] = None
+        self.generation = 0
+        self._journal_offset = 0
+        self._last_refresh = 0.0
+        self._reset()
+
+    # Subclass hooks
+
+    def _reset(self):
+        raise NotImplementedError
+
+    def _apply(self, entry: Dict[str, Any]):
+        raise NotImplementedError
+
+    def _touched(self, entry: Dict[str, Any]) -> Iterable[str]:
+        raise NotImplementedError
+
+    def _open_segment(self, path: str) -> Segment:
+        raise NotImplementedError
+
+    def _write_segment(self, path: str):
+        raise NotImplementedError
+
+    def _has_tombstones(self) -> bool:
+        return False
+
+    def _migrate_locked(self):
+        pass
+
+    # Paths and locking
+
+    @property
+    def current_path(self) -> str:
+        return os.path.join(self.index_dir, CURRENT_FILE)
+
+    def _journal_path(self, generation: int) -> str:
+        return os.path.join(self.index_dir, f"journal.{generation}")
+
+    def _segment_path(self, generation: int) -> str:
+        return os.path.join(self.index_dir, SEGMENTS_DIR, str(generation))
+
+    @property
+    def journal_path(self) -> str:
+        return self._journal_path(self.generation)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.current_path)
+
+    def disk_bytes(self) -> int:
+        """
+        Segments and journals on disk, including the previous generation kept
+        for readers that are switching over.
+        """
+        return directory_bytes(self.index_dir)
+
+    @contextmanager
+    def _file_lock(self):
+        """
+        Exclusive lock across processes. Never nested: callers hold self._lock
+        first, so threads of one process queue up before reaching flock.
+        """
+        os.makedirs(self.index_dir, exist_ok=True)
+        with open(os.path.join(self.index_dir, LOCK_FILE), "a") as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _writing(self):
+        """
+        Hold both locks and catch up with other writers before mutating.
+        """
+        with self._lock, self._file_lock():
+            self._refresh_locked()
+            yield
+
+    # Generations and journal
+
+    def _read_generation(self) -> int:
+        try:
+            with open(self.current_path, "r") as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _write_generation(self, generation: int):
+        tmp_path = self.current_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(generation))
+        os.replace(tmp_path, self.current_path)
+
+    def _load_generation(self, generation: int):
+        # The old segment isn't closed: searches score outside the lock and may
+        # still read it. Its maps are released with the last reference.
+        segment_path = self._segment_path(generation)
+        self._segment = self._open_segment(segment_path) if os.path.isdir(segment_path) else None
+        self.generation = generation
+        self._journal_offset = 0
+        self._reset()
+        self._replay()
+
+    def _replay(self) -> Set[str]:
+        """
+        Apply journal entries appended since the last read. Only complete lines
+        are consumed, so a write in progress is picked up on the next refresh.
+        Returns the doc_ids touched.
+        """
+        touched: Set[str] = set()
+        try:
+            with open(self.journal_path, "rb") as f:
+                f.seek(self._journal_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return touched
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn write from a crash; writers truncate it before appending
+                continue
+            self._apply(entry)
+            touched.update(doc_id for doc_id in self._touched(entry) if doc_id)
+        self._journal_offset += end
+        return touched
+
+    def _refresh_locked(self):
+        generation = self._read_generation()
+        if generation != self.generation:
+            self._load_generation(generation)
+            changed = None
+        else:
+            changed = self._replay()
+            if not changed:
+                return
+        if self.on_change:
+            self.on_change(changed)
+
+    def refresh(self):
+        """
+        Pick up writes made by other processes: reload if another process
+        compacted, otherwise replay the new tail of the journal.
+        """
+        with self._lock:
+            self._last_refresh = time.monotonic()
+            self._refresh_locked()
+
+    def maybe_refresh(self):
+        if time.monotonic() - self._last_refresh >= self.refresh_interval:
+            self.refresh()
+
+    def load(self):
+        """
+        Map the current segment and replay the journal written after it.
+        """
+        with self._lock, self._file_lock():
+            self._migrate_locked()
+            self._load_generation(self._read_generation())
+            self._last_refresh = time.monotonic()
+
+    def compact(self):
+        """
+        Fold the journal and tombstones into a new segment and bump the generation.
+        """
+        with self._writing():
+            if self._journal_offset or self._has_tombstones():
+                self._compact_locked()
+
+    def _compact_locked(self):
+        generation = self.generation + 1
+        final_path = self._segment_path(generation)
+        tmp_path = final_path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        self._write_segment(tmp_path)
+        shutil.rmtree(final_path, ignore_errors=True)
+        os.replace(tmp_path, final_path)
+        open(self._journal_path(generation), "ab").close()
+        self._write_generation(generation)
+        self._load_generation(generation)
+
+        # Keep the previous generation for readers that are switching over right now
+        segments_dir = os.path.join(self.index_dir, SEGMENTS_DIR)
+        for name in os.listdir(segments_dir):
+            if name.isdigit() and int(name) < generation - 1:
+                shutil.rmtree(os.path.join(segments_dir, name), ignore_errors=True)
+        for name in os.listdir(self.index_dir):
+            suffix = name[len("journal."):]
+            if name.startswith("journal.") and suffix.isdigit() and int(suffix) < generation - 1:
+                os.remove(os.path.join(self.index_dir, name))
+
+    def _append_journal(self, entry: Dict[str, Any]):
+        if not os.path.exists(self.current_path):
+            self._write_generation(self.generation)
+        with open(self.journal_path, "ab") as f:
+            # Drop a torn tail left by a crashed writer; everything before it was replayed
+            if f.tell() > self._journal_offset:
+                f.truncate(self._journal_offset)
+            f.write((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+            size = f.tell()
+        self._journal_offset = size
+
+        # Compact once the journal outgrows both the threshold and the segment,
+        # which keeps segment rewrites amortized over many small updates
+        segment_size = self._segment.size_bytes if self._segment is not None else 0
+        if size > max(self.compact_bytes, segment_size):
+            self._compact_locked()
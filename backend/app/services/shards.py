@@ -0,0 +1,337 @@
+import uuid
+import heapq
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from app.services.bm25_index import split_doc_filter
+from app.services.hashing import hash_text
+from app.services.vector_index import LocalVectorIndex, delete_filter_doc_ids
+
+
+def shard_of(doc_id: Optional[str], count: int) -> int:
+    """
+    Stable shard number for a document. All chunks of a document share one
+    shard, so doc_id filters are routed without a lookup table.
+    """
+    if count <= 1:
+        return 0
+    return int(hash_text(doc_id or "")[:8], 16) % count
+
+
+def _score(doc: Document) -> float:
+    return doc.metadata.get("score", 0.0)
+
+
+class VectorShard:
+    """
+    One partition of the vector corpus: a Chroma collection, or a
+    LocalVectorIndex (with the LangChain store wrapping it) for
+    VECTOR_BACKEND=local.
+    """
+
+    def __init__(self, name: str, store: VectorStore, index: Optional[LocalVectorIndex] = None):
+        self.name = name
+        self.store = store
+        self.index = index
+
+    def count(self) -> int:
+        return len(self.index) if self.index is not None else self.store._collection.count()
+
+    def add(self, ids: List[str], embeddings: List[List[float]], texts: List[str], metadatas: List[Dict[str, Any]]):
+        if self.index is not None:
+            self.index.add(ids, embeddings, texts, metadatas)
+        else:
+            self.store._collection.add(ids=ids, embeddings=embeddings, documents=texts, metadatas=metadatas)
+
+    def delete_document(self, doc_id: str):
+        if self.index is not None:
+            self.index.delete_document(doc_id)
+        else:
+            # Chroma requires filtering by metadata
+            self.store._collection.delete(where={"doc_id": doc_id})
+
+    def delete_documents(self, doc_ids: List[str]):
+        if self.index is not None:
+            for doc_id in doc_ids:
+                self.index.delete_document(doc_id)
+        elif doc_ids:
+            self.store._collection.delete(where={"doc_id": {"$in": doc_ids}})
+
+    def delete_chunks(self, chunk_ids: List[str]):
+        if self.index is not None:
+            self.index.delete_chunks(chunk_ids)
+        elif chunk_ids:
+            self.store._collection.delete(ids=chunk_ids)
+
+    def doc_ids(self, batch_size: int = 5000) -> Set[str]:
+        """
+        doc_ids with at least one chunk in this shard. Chroma is paged through
+        metadata only, so no documents or embeddings are loaded.
+        """
+        if self.index is not None:
+            return self.index.doc_ids()
+        docs: Set[str] = set()
+        offset = 0
+        while True:
+            result = self.store._collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+            metadatas = result.get("metadatas") or []
+            docs.update(metadata["doc_id"] for metadata in metadatas if metadata and metadata.get("doc_id"))
+            if len(metadatas) < batch_size:
+                return docs
+            offset += batch_size
+
+    def get_stats(self) -> Dict[str, Any]:
+        if self.index is not None:
+            return self.index.get_stats()
+        return {"rows": self.store._collection.count()}
+
+    def lookup_hashes(self, hashes: List[str]) -> Dict[str, Any]:
+        """
+        Map chunk hashes to embeddings already stored in this shard.
+        """
+        if self.index is not None:
+            return self.index.lookup_hashes(hashes)
+        result = self.store._collection.get(
+            where={"chunk_hash": {"$in": hashes}},
+            include=["embeddings", "metadatas"]
+        )
+        vectors = {}
+        embeddings = result.get("embeddings")
+        if embeddings is None:
+            return vectors
+        for metadata, embedding in zip(result["metadatas"], embeddings):
+            if metadata and metadata.get("chunk_hash"):
+                vectors.setdefault(metadata["chunk_hash"], embedding)
+        return vectors
+
+    def search_by_vectors(self, vectors: List[List[float]], k: int, filters: Optional[Dict[str, Any]]) -> List[List[Document]]:
+        """
+        Top-k documents per query vector, best first, with metadata["score"]
+        set (cosine similarity for the local index, Chroma's relevance score
+        otherwise). One matrix product per block locally, one query call for Chroma.
+        """
+        if self.index is not None:
+            return [self.index.get_documents(hits) for hits in self.index.search_batch(vectors, k=k, filters=filters)]
+        result = self.store._collection.query(
+            query_embeddings=vectors,
+            n_results=k,
+            where=filters or None,
+            include=["documents", "metadatas", "distances"]
+        )
+        relevance = self.store._select_relevance_score_fn()
+        return [
+            [
+                Document(page_content=text, metadata={**(metadata or {}), "score": relevance(distance)}, id=chunk_id)
+                for chunk_id, text, metadata, distance in zip(ids, texts, metadatas, distances)
+            ]
+            for ids, texts, metadatas, distances in zip(
+                result["ids"], result["documents"], result["metadatas"], result["distances"]
+            )
+        ]
+
+    def dump(self) -> Dict[str, List[Any]]:
+        return self.store.get()
+
+    def maybe_refresh(self):
+        if self.index is not None:
+            self.index.maybe_refresh()
+
+    def compact(self):
+        if self.index is not None:
+            self.index.compact()
+
+
+class ShardedVectorStore(VectorStore):
+    """
+    The vector corpus split into shards by doc_id hash. Writes go to the
+    shard owning the document, so ingest only locks that shard's index.
+    Searches go to the shards a doc_id filter routes to (all shards when
+    unfiltered), run concurrently on `executor`, and the per-shard top-k
+    lists are merged with a heap. Scores are comparable across shards:
+    every shard uses the same embedding and similarity function.
+
+    With a single shard everything is a direct call, so the unsharded
+    layout pays nothing for this layer.
+    """
+
+    def __init__(self, shards: List[VectorShard], embedding: Embeddings, executor: Optional[ThreadPoolExecutor] = None):
+        self.shards = shards
+        self._embedding = embedding
+        self.executor = executor
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def shard_for(self, doc_id: Optional[str]) -> VectorShard:
+        return self.shards[shard_of(doc_id, len(self.shards))]
+
+    def route(self, filters: Optional[Dict[str, Any]]) -> List[VectorShard]:
+        """
+        The shards that can hold matches for `filters`.
+        """
+        doc_ids, _ = split_doc_filter(filters)
+        if doc_ids is None:
+            return self.shards
+        numbers = sorted({shard_of(doc_id, len(self.shards)) for doc_id in doc_ids})
+        return [self.shards[number] for number in numbers]
+
+    def _fan_out(self, shards: List[VectorShard], call: Callable[[VectorShard], Any]) -> List[Any]:
+        if len(shards) == 1 or self.executor is None:
+            return [call(shard) for shard in shards]
+        return list(self.executor.map(call, shards))
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def add(self, ids: List[str], embeddings: List[List[float]], texts: List[str], metadatas: List[Dict[str, Any]]):
+        groups: Dict[int, List[int]] = {}
+        for i, metadata in enumerate(metadatas):
+            groups.setdefault(shard_of((metadata or {}).get("doc_id"), len(self.shards)), []).append(i)
+        for number, rows in groups.items():
+            self.shards[number].add(
+                [ids[i] for i in rows],
+                [embeddings[i] for i in rows],
+                [texts[i] for i in rows],
+                [metadatas[i] for i in rows]
+            )
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> List[str]:
+        texts = list(texts)
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+        self.add(ids, self._embedding.embed_documents(texts), texts, metadatas)
+        return ids
+
+    def delete_document(self, doc_id: str):
+        self.shard_for(doc_id).delete_document(doc_id)
+
+    def delete_documents(self, doc_ids: List[str]):
+        groups: Dict[int, List[str]] = {}
+        for doc_id in doc_ids:
+            groups.setdefault(shard_of(doc_id, len(self.shards)), []).append(doc_id)
+        for number, members in groups.items():
+            self.shards[number].delete_documents(members)
+
+    def delete(
+        self, ids: Optional[List[str]] = None, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> Optional[bool]:
+        """
+        Delete chunks by id and/or whole documents by a doc_id filter. Chunk
+        ids carry no shard, so they go to every shard; doc_ids are routed.
+        Only the vector shards are touched: VectorService.delete_document also
+        updates BM25 and the caches.
+        """
+        doc_ids = delete_filter_doc_ids(ids, filter)
+        if ids:
+            self._fan_out(self.shards, lambda shard: shard.delete_chunks(ids))
+        if doc_ids:
+            self.delete_documents(doc_ids)
+        return True
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def lookup_hashes(self, hashes: List[str]) -> Dict[str, Any]:
+        # Identical chunks can belong to documents in any shard
+        vectors: Dict[str, Any] = {}
+        for found in self._fan_out(self.shards, lambda shard: shard.lookup_hashes(hashes)):
+            for chunk_hash, vector in found.items():
+                vectors.setdefault(chunk_hash, vector)
+        return vectors
+
+    def search_by_vectors(self, vectors: List[List[float]], k: int, filters: Optional[Dict[str, Any]] = None) -> List[List[Document]]:
+        """
+        Top-k documents per query vector across the routed shards.
+        """
+        shards = self.route(filters)
+        if not shards:
+            return [[] for _ in vectors]
+        per_shard = self._fan_out(shards, lambda shard: shard.search_by_vectors(vectors, k, filters))
+        if len(per_shard) == 1:
+            return per_shard[0]
+        # Each shard's list is sorted best first, so a k-way heap merge suffices
+        return [
+            list(itertools.islice(heapq.merge(*lists, key=_score, reverse=True), k))
+            for lists in zip(*per_shard)
+        ]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        docs = self.similarity_search(query, k=k, filter=filter)
+        return [(doc, _score(doc)) for doc in docs]
+
+    def similarity_search(
+        self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Document]:
+        return self.similarity_search_by_vector(self._embedding.embed_query(query), k=k, filter=filter)
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Document]:
+        return self.search_by_vectors([embedding], k, filter)[0]
+
+    def _select_relevance_score_fn(self):
+        return self.shards[0].store._select_relevance_score_fn()
+
+    def get(self) -> Dict[str, List[Any]]:
+        """
+        Chroma-compatible full dump (ids, documents, metadatas) over all shards.
+        """
+        result: Dict[str, List[Any]] = {"ids": [], "documents": [], "metadatas": []}
+        for dump in self._fan_out(self.shards, lambda shard: shard.dump()):
+            for field in result:
+                result[field].extend(dump.get(field) or [])
+        return result
+
+    def count(self) -> int:
+        return sum(self._fan_out(self.shards, lambda shard: shard.count()))
+
+    def doc_ids(self) -> Set[str]:
+        docs: Set[str] = set()
+        for found in self._fan_out(self.shards, lambda shard: shard.doc_ids()):
+            docs.update(found)
+        return docs
+
+    def maybe_refresh(self):
+        for shard in self.shards:
+            shard.maybe_refresh()
+
+    def compact(self):
+        for shard in self.shards:
+            shard.compact()
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        shards: Optional[List[VectorShard]] = None,
+        executor: Optional[ThreadPoolExecutor] = None,
+        **kwargs: Any
+    ) -> "ShardedVectorStore":
+        """
+        Add texts to `shards`, by default the shards configured in settings
+        (VECTOR_BACKEND, VECTOR_SHARDS), as opened by the vector service.
+        """
+        if shards is None:
+            # Imported here: vector_store builds on this module
+            from app.services.vector_store import vector_service
+            shards = vector_service.vector_store.shards
+            executor = executor or vector_service.shard_executor
+        store = cls(shards, embedding, executor)
+        store.add_texts(texts, metadatas=metadatas, ids=kwargs.get("ids"))
+        return store
@@ -0,0 +1,301 @@
+import json
+import time
+import uuid
+import zlib
+import asyncio
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from fastapi.responses import StreamingResponse
+from app.core.config import get_settings
+from app.core.metrics import registry, CHAT_STREAM_FRAMES
+
+try:
+    import brotli
+except ImportError:  # optional: br is only offered when installed
+    brotli = None
+
+settings = get_settings()
+
+# SSE comment line: keeps proxies and load balancers from timing out idle streams
+HEARTBEAT_FRAME = ": ping\n\n"
+# How often an idle producer checks whether its clients are gone
+ABANDON_CHECK_SECONDS = 1.0
+
+
+def format_event(event: Dict[str, Any], event_id: Optional[int] = None) -> str:
+    frame = f"data: {json.dumps(event)}\n\n"
+    return frame if event_id is None else f"id: {event_id}\n{frame}"
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Pick br or gzip from an Accept-Encoding header, or None for identity.
+    """
+    if not settings.SSE_COMPRESSION:
+        return None
+    offered: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        offered[name.strip().lower()] = quality
+    for encoding in ("br", "gzip"):
+        if offered.get(encoding, 0) > 0 and (encoding != "br" or brotli is not None):
+            return encoding
+    return None
+
+
+async def encode_frames(frames: AsyncIterator[str], encoding: Optional[str]) -> AsyncIterator[bytes]:
+    """
+    Encode and (optionally) compress frames, flushing the compressor after
+    each write so every frame reaches the client immediately.
+    """
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=5)
+        compress = lambda data: compressor.process(data) + compressor.flush()
+        finish = compressor.finish
+    elif encoding == "gzip":
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        compress = lambda data: compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        finish = compressor.flush
+    else:
+        compress, finish = None, None
+    try:
+        async for chunk in frames:
+            data = chunk.encode("utf-8")
+            yield compress(data) if compress else data
+        if finish:
+            yield finish()
+    finally:
+        # Detach from the stream right away when the client goes
+        await frames.aclose()
+
+
+class ChatStream:
+    """
+    One chat answer, generated independently of the connections reading it.
+
+    Consecutive token events are coalesced into one frame per `coalesce_ms`
+    window or `coalesce_bytes` of text, whichever fills first. Frames get
+    sequential SSE ids and are kept, so a client reconnecting with
+    Last-Event-ID receives what it missed and then follows the live stream
+    rather than starting a new retrieval and completion. Generation is
+    cancelled once no client has been attached for `grace` seconds.
+    """
+
+    def __init__(self, stream_id: str, coalesce_ms: float, coalesce_bytes: int, grace: float):
+        self.stream_id = stream_id
+        self.coalesce = coalesce_ms / 1000
+        self.coalesce_bytes = coalesce_bytes
+        self.grace = grace
+        self.frames: List[str] = []
+        self.token_events = 0
+        self.subscribers = 0
+        self.detached_at: Optional[float] = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    def abandoned(self) -> bool:
+        return not self.subscribers and time.monotonic() - self.detached_at > self.grace
+
+    async def is_abandoned(self) -> bool:
+        # Shaped like Request.is_disconnected, which ChatService polls during retrieval
+        return self.abandoned()
+
+    def _notify(self):
+        wakeup, self._wakeup = self._wakeup, asyncio.Event()
+        wakeup.set()
+
+    def _emit(self, event: Dict[str, Any]):
+        self.frames.append(format_event(event, len(self.frames) + 1))
+        CHAT_STREAM_FRAMES.inc(type=event.get("type", "unknown"))
+        self._notify()
+
+    async def produce(self, events: AsyncIterator[Dict[str, Any]]):
+        pending: List[str] = []
+        pending_bytes = 0
+        flush_at = 0.0
+        next_event: Optional[asyncio.Future] = None
+
+        def flush():
+            nonlocal pending, pending_bytes
+            if pending:
+                self._emit({"type": "token", "content": "".join(pending)})
+                pending, pending_bytes = [], 0
+
+        try:
+            while True:
+                # Checked every iteration: a fast token stream never hits the timeout below
+                if self.abandoned():
+                    break
+                if next_event is None:
+                    next_event = asyncio.ensure_future(events.__anext__())
+                # Wait for the next delta, but no longer than the open coalescing window
+                timeout = max(0.0, flush_at - time.monotonic()) if pending else ABANDON_CHECK_SECONDS
+                done, _ = await asyncio.wait({next_event}, timeout=timeout)
+                if not done:
+                    if pending and time.monotonic() >= flush_at:
+                        flush()
+                    continue
+
+                future, next_event = next_event, None
+                try:
+                    event = future.result()
+                except StopAsyncIteration:
+                    break
+                if event.get("type") == "token":
+                    self.token_events += 1
+                    if not pending:
+                        flush_at = time.monotonic() + self.coalesce
+                    pending.append(event["content"])
+                    pending_bytes += len(event["content"].encode("utf-8"))
+                    if pending_bytes >= self.coalesce_bytes or self.coalesce <= 0:
+                        flush()
+                    continue
+
+                flush()
+                if event.get("type") == "done":
+                    event["stream"] = {
+                        "id": self.stream_id,
+                        "frames": len(self.frames) + 1,
+                        "token_events": self.token_events,
+                    }
+                self._emit(event)
+            flush()
+        finally:
+            if next_event is not None:
+                # Abandoned mid-generation: stop retrieval/upstream work
+                next_event.cancel()
+                try:
+                    await next_event
+                except BaseException:
+                    pass
+            await events.aclose()
+            self.finished_at = time.monotonic()
+            self._notify()
+
+    async def subscribe(self, after: int = 0, heartbeat: float = 0.0) -> AsyncIterator[str]:
+        """
+        Frames after event id `after`, then live ones until the stream ends.
+        Frames that piled up while the client was slow are sent in one write.
+        """
+        self.subscribers += 1
+        position = max(0, after)
+        try:
+            while True:
+                if position < len(self.frames):
+                    chunk = "".join(self.frames[position:])
+                    position = len(self.frames)
+                    yield chunk
+                    continue
+                if self.finished:
+                    return
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=heartbeat if heartbeat > 0 else None)
+                except asyncio.TimeoutError:
+                    CHAT_STREAM_FRAMES.inc(type="heartbeat")
+                    yield HEARTBEAT_FRAME
+        finally:
+            self.subscribers -= 1
+            if not self.subscribers:
+                self.detached_at = time.monotonic()
+
+
+class ChatStreamRegistry:
+    """
+    Chat streams of this worker by stream id. Finished streams stay
+    replayable for `ttl` seconds after their last client left, and at most
+    `max_streams` of them are kept. With several workers, resume requests
+    must reach the worker that started the stream (sticky sessions).
+    """
+
+    def __init__(self, ttl: float, max_streams: int, coalesce_ms: float, coalesce_bytes: int, grace: float):
+        self.ttl = ttl
+        self.max_streams = max_streams
+        self.coalesce_ms = coalesce_ms
+        self.coalesce_bytes = coalesce_bytes
+        self.grace = grace
+        self.streams: "OrderedDict[str, ChatStream]" = OrderedDict()
+        registry.callback(
+            "retriv_chat_streams",
+            "Chat streams held for delivery and replay",
+            lambda: [
+                ({"state": "generating"}, sum(1 for s in self.streams.values() if not s.finished)),
+                ({"state": "finished"}, sum(1 for s in self.streams.values() if s.finished)),
+            ]
+        )
+
+    def start(self, events: Callable[[Callable[[], Awaitable[bool]]], AsyncIterator[Dict[str, Any]]]) -> ChatStream:
+        """
+        Start producing `events(is_abandoned)` in the background.
+        """
+        self._prune()
+        stream = ChatStream(uuid.uuid4().hex, self.coalesce_ms, self.coalesce_bytes, self.grace)
+        stream.task = asyncio.ensure_future(stream.produce(events(stream.is_abandoned)))
+        self.streams[stream.stream_id] = stream
+        return stream
+
+    def get(self, stream_id: str) -> Optional[ChatStream]:
+        self._prune()
+        return self.streams.get(stream_id)
+
+    def _prune(self):
+        now = time.monotonic()
+        idle = [
+            stream_id for stream_id, stream in self.streams.items()
+            if stream.finished and not stream.subscribers
+        ]
+        expired = {
+            stream_id for stream_id in idle
+            if now - max(self.streams[stream_id].finished_at, self.streams[stream_id].detached_at) > self.ttl
+        }
+        # Over the cap, drop the oldest finished streams as well
+        overflow = len(self.streams) - len(expired) - self.max_streams
+        if overflow > 0:
+            expired.update([stream_id for stream_id in idle if stream_id not in expired][:overflow])
+        for stream_id in expired:
+            del self.streams[stream_id]
+
+    async def aclose(self):
+        tasks = [stream.task for stream in self.streams.values() if stream.task and not stream.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def sse_response(stream: ChatStream, accept_encoding: str, after: int = 0) -> StreamingResponse:
+    encoding = negotiate_encoding(accept_encoding)
+    headers = {
+        # no-transform: proxies must not buffer or re-encode the stream
+        "Cache-Control": "no-cache, no-transform",
+        "X-Accel-Buffering": "no",
+        "Connection": "keep-alive",
+        "X-Stream-Id": stream.stream_id,
+        "Vary": "Accept-Encoding",
+    }
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return StreamingResponse(
+        encode_frames(stream.subscribe(after, settings.SSE_HEARTBEAT_SECONDS), encoding),
+        media_type="text/event-stream",
+        headers=headers
+    )
+
+
+chat_streams = ChatStreamRegistry(
+    ttl=settings.SSE_RESUME_TTL_SECONDS,
+    max_streams=settings.SSE_RESUME_MAX_STREAMS,
+    coalesce_ms=settings.SSE_COALESCE_MS,
+    coalesce_bytes=settings.SSE_COALESCE_BYTES,
+    grace=settings.SSE_RESUME_GRACE_SECONDS
+)
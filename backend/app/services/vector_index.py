@@ -0,0 +1,717 @@
+# Built-in vector backend: quantized embeddings in memory-mapped segments,
+# an alternative to Chroma for large collections (VECTOR_BACKEND=local).
+import os
+import json
+import uuid
+import base64
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from app.services.bm25_index import matches_filter, split_doc_filter
+from app.services.segments import JournaledIndex, Segment, encode_keys, load_array
+
+BLOCK_ROWS = 65536  # rows scored per matrix product during a scan
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+def quantize(vectors: np.ndarray, dtype: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns (codes, scales). int8 uses a symmetric per-row scale, float16 a scale of 1.
+    """
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales
+    return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+
+
+def dequantize(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    return codes.astype(np.float32) * np.asarray(scales, dtype=np.float32)[:, None]
+
+
+class VectorSegment(Segment):
+    """
+    Rows are grouped by doc_id, so every document is one contiguous row range
+    and a doc_id-filtered search only reads those rows. With enough rows an
+    IVF partition (k-means centroids plus row lists) is stored alongside.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.doc_ranges: Dict[str, Tuple[int, int]] = self.meta["doc_ranges"]
+        self.dtype: str = self.meta["dtype"]
+        self.codes = load_array(os.path.join(path, "codes.npy"))
+        self.scales = load_array(os.path.join(path, "scales.npy"))
+        self.hashes = load_array(os.path.join(path, "hashes.npy"))
+        self.sorted_hashes = load_array(os.path.join(path, "sorted_hashes.npy"))
+        self.hash_order = load_array(os.path.join(path, "hash_order.npy"))
+        self.centroids = None
+        if os.path.exists(os.path.join(path, "centroids.npy")):
+            self.centroids = np.load(os.path.join(path, "centroids.npy"))
+            self.list_offsets = np.load(os.path.join(path, "list_offsets.npy"))
+            self.list_rows = load_array(os.path.join(path, "list_rows.npy"))
+
+    def find_hash(self, chunk_hash: str) -> List[int]:
+        key = chunk_hash.encode("utf-8")
+        start = int(np.searchsorted(self.sorted_hashes, key, side="left"))
+        stop = int(np.searchsorted(self.sorted_hashes, key, side="right"))
+        return [int(i) for i in self.hash_order[start:stop]]
+
+    def vectors(self, rows) -> np.ndarray:
+        return dequantize(self.codes[rows], self.scales[rows])
+
+
+def delete_filter_doc_ids(ids: Optional[List[str]], where: Optional[Dict[str, Any]]) -> Optional[List[str]]:
+    """
+    doc_ids targeted by a VectorStore.delete filter. Only doc_id constraints
+    are supported, since they map onto the doc_id -> rows index.
+    """
+    doc_ids, rest = split_doc_filter(where)
+    if rest:
+        raise ValueError("delete only supports doc_id filters")
+    if not ids and doc_ids is None:
+        raise ValueError("delete needs ids or a doc_id filter")
+    return doc_ids
+
+
+def _train_ivf(sample: np.ndarray, lists: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """
+    Spherical k-means on a sample of normalized vectors.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), lists, replace=False)]
+    for _ in range(iterations):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        empty = np.bincount(assignment, minlength=lists) == 0
+        # Re-seed empty lists so every centroid stays useful
+        sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+        centroids = normalize(sums)
+    return centroids
+
+
+class LocalVectorIndex(JournaledIndex):
+    """
+    Cosine-similarity vector index over quantized (int8 or float16) embeddings
+    in memory-mapped segments, with a float32 in-memory delta for rows added
+    since the last compaction. Deletes are tombstones until compaction.
+
+    Search is exact over doc_id row ranges and small segments, and IVF
+    (probing `nprobe` of ~sqrt(n) k-means lists) once a segment has
+    `ivf_min_rows` rows. Queries are scored in batches as matrix products.
+    """
+
+    def __init__(
+        self,
+        index_dir: str,
+        dtype: str = "int8",
+        ivf_min_rows: int = 100_000,
+        nprobe: int = 16,
+        compact_bytes: int = 256 * 1024 * 1024,
+        refresh_interval: float = 1.0
+    ):
+        self.dtype = dtype
+        self.ivf_min_rows = ivf_min_rows
+        self.nprobe = nprobe
+        super().__init__(index_dir, compact_bytes, refresh_interval)
+
+    def _reset(self):
+        self._alive = np.ones(len(self._segment) if self._segment else 0, dtype=bool)
+        self._base_live = len(self._alive)
+        # Delta: rows journaled since the segment was written
+        self.rows: Dict[str, Tuple[np.ndarray, str, Dict[str, Any]]] = {}  # chunk_id -> (vector, text, metadata)
+        self.doc_chunks: Dict[str, List[str]] = {}   # doc_id -> [chunk_id]
+        self.hash_chunks: Dict[str, str] = {}        # chunk_hash -> chunk_id
+        self._delta_matrix: Optional[Tuple[List[str], np.ndarray]] = None
+
+    def _open_segment(self, path: str) -> VectorSegment:
+        return VectorSegment(path)
+
+    def _has_tombstones(self) -> bool:
+        return self._base_live < len(self._alive)
+
+    def _touched(self, entry: Dict[str, Any]) -> Iterable[str]:
+        if entry["op"] == "delete":
+            return [entry["doc_id"]]
+        if entry["op"] == "delete_chunks":
+            return entry["doc_ids"]
+        return [metadata.get("doc_id") for _, _, metadata, _ in entry["rows"]]
+
+    def __len__(self) -> int:
+        return self._base_live + len(self.rows)
+
+    # ------------------------------------------------------------------
+    # In-memory mutations
+    # ------------------------------------------------------------------
+
+    def _add_row(self, chunk_id: str, text: str, metadata: Dict[str, Any], vector: np.ndarray):
+        if chunk_id in self.rows:
+            self._remove_row(chunk_id)
+        elif self._segment is not None:
+            position = self._segment.find(chunk_id)
+            if position is not None and self._alive[position]:
+                self._alive[position] = False
+                self._base_live -= 1
+        self.rows[chunk_id] = (vector, text, metadata)
+        self.doc_chunks.setdefault(metadata.get("doc_id") or "", []).append(chunk_id)
+        if metadata.get("chunk_hash"):
+            self.hash_chunks[metadata["chunk_hash"]] = chunk_id
+        self._delta_matrix = None
+
+    def _remove_row(self, chunk_id: str):
+        _, _, metadata = self.rows.pop(chunk_id)
+        chunk_ids = self.doc_chunks.get(metadata.get("doc_id") or "")
+        if chunk_ids and chunk_id in chunk_ids:
+            chunk_ids.remove(chunk_id)
+        if self.hash_chunks.get(metadata.get("chunk_hash")) == chunk_id:
+            del self.hash_chunks[metadata["chunk_hash"]]
+        self._delta_matrix = None
+
+    def _delete_doc(self, doc_id: str) -> int:
+        removed = 0
+        if self._segment is not None and doc_id in self._segment.doc_ranges:
+            start, stop = self._segment.doc_ranges[doc_id]
+            removed += int(np.count_nonzero(self._alive[start:stop]))
+            self._alive[start:stop] = False
+            self._base_live -= removed
+        for chunk_id in self.doc_chunks.pop(doc_id, []):
+            self._remove_row(chunk_id)
+            removed += 1
+        return removed
+
+    def _chunk_doc_id(self, chunk_id: str) -> Optional[str]:
+        if chunk_id in self.rows:
+            return self.rows[chunk_id][2].get("doc_id")
+        if self._segment is not None:
+            position = self._segment.find(chunk_id)
+            if position is not None and self._alive[position]:
+                return self._segment.record(position)[1].get("doc_id")
+        return None
+
+    def _delete_chunk(self, chunk_id: str) -> int:
+        if chunk_id in self.rows:
+            self._remove_row(chunk_id)
+            return 1
+        if self._segment is not None:
+            position = self._segment.find(chunk_id)
+            if position is not None and self._alive[position]:
+                self._alive[position] = False
+                self._base_live -= 1
+                return 1
+        return 0
+
+    def _apply(self, entry: Dict[str, Any]):
+        if entry["op"] == "add":
+            for chunk_id, text, metadata, encoded in entry["rows"]:
+                vector = np.frombuffer(base64.b64decode(encoded), dtype=np.float32)
+                self._add_row(chunk_id, text, metadata, vector)
+        elif entry["op"] == "delete":
+            self._delete_doc(entry["doc_id"])
+        elif entry["op"] == "delete_chunks":
+            for chunk_id in entry["ids"]:
+                self._delete_chunk(chunk_id)
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def add(self, ids: List[str], vectors: List[List[float]], texts: List[str], metadatas: List[Dict[str, Any]]):
+        if not ids:
+            return
+        vectors = normalize(np.asarray(vectors, dtype=np.float32))
+        entry = {
+            "op": "add",
+            "rows": [
+                [chunk_id, text, dict(metadata or {}), base64.b64encode(vector.tobytes()).decode("ascii")]
+                for chunk_id, text, metadata, vector in zip(ids, texts, metadatas, vectors)
+            ]
+        }
+        with self._writing():
+            self._apply(entry)
+            self._append_journal(entry)
+
+    def delete_document(self, doc_id: str) -> int:
+        entry = {"op": "delete", "doc_id": doc_id}
+        with self._writing():
+            removed = self._delete_doc(doc_id)
+            if removed:
+                self._append_journal(entry)
+        return removed
+
+    def delete_chunks(self, chunk_ids: List[str]) -> int:
+        """
+        Remove individual chunks by id (segment rows become tombstones).
+        Returns the number of chunks removed.
+        """
+        with self._writing():
+            doc_ids = sorted({doc_id for doc_id in map(self._chunk_doc_id, chunk_ids) if doc_id})
+            removed = sum(self._delete_chunk(chunk_id) for chunk_id in chunk_ids)
+            if removed:
+                self._append_journal({"op": "delete_chunks", "ids": list(chunk_ids), "doc_ids": doc_ids})
+        return removed
+
+    def doc_ids(self) -> Set[str]:
+        """
+        doc_ids with at least one live row.
+        """
+        with self._lock:
+            docs = {doc_id for doc_id, chunk_ids in self.doc_chunks.items() if chunk_ids}
+            if self._segment is not None:
+                docs.update(
+                    doc_id for doc_id, (start, stop) in self._segment.doc_ranges.items()
+                    if self._alive[start:stop].any()
+                )
+            docs.discard("")
+            return docs
+
+    def lookup_hashes(self, hashes: Iterable[str]) -> Dict[str, List[float]]:
+        """
+        Stored (normalized) embeddings for chunk hashes, for reuse on ingest.
+        """
+        self.maybe_refresh()
+        vectors = {}
+        with self._lock:
+            for chunk_hash in set(hashes):
+                chunk_id = self.hash_chunks.get(chunk_hash)
+                if chunk_id is not None:
+                    vectors[chunk_hash] = self.rows[chunk_id][0].tolist()
+                    continue
+                if self._segment is None:
+                    continue
+                for position in self._segment.find_hash(chunk_hash):
+                    if self._alive[position]:
+                        vectors[chunk_hash] = self._segment.vectors([position])[0].tolist()
+                        break
+        return vectors
+
+    def _delta(self) -> Tuple[List[str], np.ndarray]:
+        if self._delta_matrix is None:
+            ids = list(self.rows)
+            dim = len(next(iter(self.rows.values()))[0]) if ids else 0
+            matrix = np.stack([self.rows[c][0] for c in ids]) if ids else np.zeros((0, dim), dtype=np.float32)
+            self._delta_matrix = (ids, matrix)
+        return self._delta_matrix
+
+    def _segment_candidates(
+        self,
+        segment: VectorSegment,
+        alive: Optional[np.ndarray],
+        live: int,
+        queries: np.ndarray,
+        doc_ids: Optional[List[str]],
+        keep: int
+    ) -> List[Tuple[np.ndarray, np.ndarray, bool]]:
+        """
+        For each query, (rows, scores, complete) over the segment rows it
+        should consider. `alive` is the tombstone mask (None without
+        tombstones) and `live` the live row count. The exact scan only returns
+        each query's best `keep` rows; complete is False when rows beyond
+        those were left out.
+        """
+        if doc_ids is not None:
+            ranges = [segment.doc_ranges[d] for d in doc_ids if d in segment.doc_ranges]
+            rows = np.concatenate([np.arange(s, e) for s, e in ranges]) if ranges else np.zeros(0, dtype=np.int64)
+            if alive is not None:
+                rows = rows[alive[rows]]
+            scores = segment.vectors(rows) @ queries.T if len(rows) else np.zeros((0, len(queries)))
+            return [(rows, scores[:, i], True) for i in range(len(queries))]
+
+        if segment.centroids is not None:
+            # IVF: score only the rows of the closest lists
+            probes = np.argsort(-(queries @ segment.centroids.T), axis=1)[:, :self.nprobe]
+            results = []
+            for query, lists in zip(queries, probes):
+                rows = np.sort(np.concatenate([
+                    segment.list_rows[segment.list_offsets[l]:segment.list_offsets[l + 1]] for l in lists
+                ]))
+                if alive is not None:
+                    rows = rows[alive[rows]]
+                results.append((rows, segment.vectors(rows) @ query, True))
+            return results
+
+        return self._exact_top(segment, alive, live, queries, keep)
+
+    @staticmethod
+    def _exact_top(
+        segment: VectorSegment,
+        alive: Optional[np.ndarray],
+        live: int,
+        queries: np.ndarray,
+        keep: int
+    ) -> List[Tuple[np.ndarray, np.ndarray, bool]]:
+        """
+        Exact scan in row blocks, one matrix product per block for the whole
+        batch, keeping a running top-`keep` per query. Memory is bounded by
+        the block and `keep`, not by the segment size.
+        """
+        keep = max(1, min(keep, live))
+        # Fewer rows per block for large batches keeps the block score matrix small
+        block_rows = max(1024, BLOCK_ROWS // len(queries))
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+        for start in range(0, len(segment), block_rows):
+            stop = min(start + block_rows, len(segment))
+            rows = np.arange(start, stop)
+            scores = queries @ segment.vectors(slice(start, stop)).T
+            if alive is not None:
+                mask = alive[start:stop]
+                rows, scores = rows[mask], scores[:, mask]
+            scores = np.concatenate([best_scores, scores], axis=1)
+            rows = np.concatenate([best_rows, np.broadcast_to(rows, (len(queries), len(rows)))], axis=1)
+            if scores.shape[1] > keep:
+                top = np.argpartition(-scores, keep - 1, axis=1)[:, :keep]
+                scores = np.take_along_axis(scores, top, axis=1)
+                rows = np.take_along_axis(rows, top, axis=1)
+            best_rows, best_scores = rows, scores
+        complete = keep >= live
+        return [(best_rows[i], best_scores[i], complete) for i in range(len(queries))]
+
+    def search_batch(
+        self,
+        queries: List[List[float]],
+        k: int = 5,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> List[List[Tuple[str, float]]]:
+        """
+        Top-k (chunk_id, cosine similarity) per query. A doc_id constraint in
+        `filters` restricts scoring to those documents' row ranges; any other
+        metadata conditions are checked on candidates in rank order.
+
+        Only the inputs are captured under the lock; scoring runs without it,
+        so concurrent searches and writers don't queue behind each other.
+        """
+        self.maybe_refresh()
+        queries = normalize(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        doc_ids, remaining = split_doc_filter(filters)
+        with self._lock:
+            segment = self._segment if self._segment is not None and len(self._segment) else None
+            # Writers flip tombstones in place, so searches get their own copy; the
+            # delta matrix and segments are replaced rather than modified
+            alive = self._alive.copy() if self._has_tombstones() else None
+            live = self._base_live
+            delta_ids, matrix = self._delta()
+            delta_rows = np.arange(len(delta_ids))
+            if doc_ids is not None:
+                wanted = {c for d in doc_ids for c in self.doc_chunks.get(d, ())}
+                delta_rows = np.array([i for i, c in enumerate(delta_ids) if c in wanted], dtype=np.int64)
+            delta_metadata = {delta_ids[r]: self.rows[delta_ids[r]][2] for r in delta_rows} if remaining else {}
+
+        window = k if not remaining else max(k * 10, 256)
+        base = self._segment_candidates(segment, alive, live, queries, doc_ids, window) if segment is not None else None
+        delta_scores = matrix[delta_rows] @ queries.T if len(delta_rows) else None
+
+        results = []
+        for i in range(len(queries)):
+            rows, scores, complete = base[i] if base is not None else (np.zeros(0, dtype=np.int64), np.zeros(0), True)
+            delta = [] if delta_scores is None else [
+                (float(delta_scores[j, i]), delta_ids[r], None) for j, r in enumerate(delta_rows)
+            ]
+            # Without a metadata filter the top k segment rows suffice; with one,
+            # widen the candidate window until k rows pass or none are left
+            limit, keep = min(len(rows), window), window
+            while True:
+                hits = self._select(segment, rows, scores, limit, delta, k, remaining, delta_metadata)
+                if len(hits) == k or (limit >= len(rows) and complete):
+                    break
+                if limit >= len(rows):
+                    # The exact scan kept too few rows for this filter: rescan wider
+                    keep *= 4
+                    rows, scores, complete = self._exact_top(segment, alive, live, queries[i:i + 1], keep)[0]
+                limit = min(len(rows), limit * 4)
+            results.append(hits)
+        return results
+
+    @staticmethod
+    def _select(
+        segment: Optional[VectorSegment],
+        rows: np.ndarray,
+        scores: np.ndarray,
+        limit: int,
+        delta: List[Tuple[float, str, None]],
+        k: int,
+        remaining: Optional[Dict[str, Any]],
+        delta_metadata: Dict[str, Dict[str, Any]]
+    ) -> List[Tuple[str, float]]:
+        top = np.argpartition(-scores, limit - 1)[:limit] if 0 < limit < len(rows) else np.arange(limit)
+        # Candidates as (score, chunk_id, segment position or None)
+        candidates = [(float(scores[t]), segment.chunk_id(int(rows[t])), int(rows[t])) for t in top]
+        candidates.extend(delta)
+        candidates.sort(key=lambda c: c[0], reverse=True)
+
+        hits = []
+        for score, chunk_id, position in candidates:
+            if remaining:
+                metadata = delta_metadata[chunk_id] if position is None else segment.record(position)[1]
+                if not matches_filter(metadata, remaining):
+                    continue
+            hits.append((chunk_id, score))
+            if len(hits) == k:
+                break
+        return hits
+
+    def search(self, query: List[float], k: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        return self.search_batch([query], k=k, filters=filters)[0]
+
+    def get_documents(self, hits: List[Tuple[str, float]]) -> List[Document]:
+        documents = []
+        with self._lock:
+            for chunk_id, score in hits:
+                if chunk_id in self.rows:
+                    _, text, metadata = self.rows[chunk_id]
+                elif self._segment is not None:
+                    position = self._segment.find(chunk_id)
+                    if position is None or not self._alive[position]:
+                        continue
+                    text, metadata = self._segment.record(position)
+                else:
+                    continue
+                documents.append(Document(page_content=text, metadata={**metadata, "score": score}, id=chunk_id))
+        return documents
+
+    def iter_records(self, batch_size: int = 1000) -> Iterable[Tuple[List[str], List[str], List[Dict[str, Any]]]]:
+        """
+        Yield (ids, texts, metadatas) batches over every live row.
+        """
+        with self._lock:
+            ids, texts, metadatas = [], [], []
+            positions = np.nonzero(self._alive)[0] if self._segment is not None else []
+            for position in positions:
+                text, metadata = self._segment.record(int(position))
+                ids.append(self._segment.chunk_id(int(position)))
+                texts.append(text)
+                metadatas.append(metadata)
+                if len(ids) == batch_size:
+                    yield ids, texts, metadatas
+                    ids, texts, metadatas = [], [], []
+            for chunk_id, (_, text, metadata) in self.rows.items():
+                ids.append(chunk_id)
+                texts.append(text)
+                metadatas.append(metadata)
+            if ids:
+                yield ids, texts, metadatas
+
+    def export(self, batch_size: int = 1000) -> Iterable[Tuple[List[str], List[List[float]], List[str], List[Dict[str, Any]]]]:
+        """
+        Yield (ids, vectors, texts, metadatas) batches over every live row, in
+        add() argument order, for copying into another index. Segment vectors
+        come back dequantized.
+        """
+        with self._lock:
+            positions = np.nonzero(self._alive)[0] if self._segment is not None else np.zeros(0, dtype=np.int64)
+            for start in range(0, len(positions), batch_size):
+                batch = positions[start:start + batch_size]
+                records = [self._segment.record(int(p)) for p in batch]
+                yield (
+                    [self._segment.chunk_id(int(p)) for p in batch],
+                    self._segment.vectors(batch).tolist(),
+                    [text for text, _ in records],
+                    [metadata for _, metadata in records]
+                )
+            chunk_ids = list(self.rows)
+            for start in range(0, len(chunk_ids), batch_size):
+                batch = chunk_ids[start:start + batch_size]
+                yield (
+                    batch,
+                    [self.rows[c][0].tolist() for c in batch],
+                    [self.rows[c][1] for c in batch],
+                    [self.rows[c][2] for c in batch]
+                )
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            segment = self._segment
+            return {
+                "rows": len(self),
+                "generation": self.generation,
+                "segment_rows": self._base_live,
+                "journal_rows": len(self.rows),
+                "tombstones": len(self._alive) - self._base_live,
+                "disk_bytes": self.disk_bytes(),
+                "dtype": segment.dtype if segment is not None else self.dtype,
+                "ivf_lists": len(segment.centroids) if segment is not None and segment.centroids is not None else 0,
+            }
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def _write_segment(self, path: str):
+        segment = self._segment
+        os.makedirs(path, exist_ok=True)
+
+        # 1. Plan the new row order: grouped by doc_id, segment rows before delta rows
+        plan: List[Tuple[str, Any]] = []  # ("segment", positions) or ("delta", chunk_ids)
+        doc_ranges: Dict[str, Tuple[int, int]] = {}
+        segment_docs = segment.doc_ranges if segment is not None else {}
+        row = 0
+        for doc_id in sorted(set(segment_docs) | set(self.doc_chunks)):
+            start = row
+            if doc_id in segment_docs:
+                s, e = segment_docs[doc_id]
+                positions = s + np.nonzero(self._alive[s:e])[0]
+                if len(positions):
+                    plan.append(("segment", positions))
+                    row += len(positions)
+            chunk_ids = self.doc_chunks.get(doc_id)
+            if chunk_ids:
+                plan.append(("delta", list(chunk_ids)))
+                row += len(chunk_ids)
+            if row > start:
+                doc_ranges[doc_id] = (start, row)
+        total = row
+
+        dim = segment.codes.shape[1] if segment is not None else \
+            (len(next(iter(self.rows.values()))[0]) if self.rows else 0)
+        code_dtype = np.int8 if self.dtype == "int8" else np.float16
+        codes = np.lib.format.open_memmap(os.path.join(path, "codes.npy"), mode="w+", dtype=code_dtype, shape=(total, dim)) \
+            if total else np.zeros((0, dim), dtype=code_dtype)
+        scales = np.zeros(total, dtype=np.float32)
+
+        # 2. Copy segment rows as stored (re-quantizing only if the dtype changed) and quantize the delta
+        ids: List[str] = []
+        hashes: List[str] = []
+        records: List[bytes] = []
+        row = 0
+        for kind, items in plan:
+            if kind == "segment":
+                n = len(items)
+                if segment.dtype == self.dtype:
+                    codes[row:row + n] = segment.codes[items]
+                    scales[row:row + n] = segment.scales[items]
+                else:
+                    codes[row:row + n], scales[row:row + n] = quantize(segment.vectors(items), self.dtype)
+                for position in items:
+                    ids.append(segment.chunk_id(int(position)))
+                    hashes.append(segment.hashes[position].decode("utf-8"))
+                    records.append(segment.raw_record(int(position)))
+            else:
+                n = len(items)
+                codes[row:row + n], scales[row:row + n] = quantize(np.stack([self.rows[c][0] for c in items]), self.dtype)
+                for chunk_id in items:
+                    _, text, metadata = self.rows[chunk_id]
+                    ids.append(chunk_id)
+                    hashes.append(metadata.get("chunk_hash") or "")
+                    records.append(json.dumps([text, metadata], ensure_ascii=False).encode("utf-8"))
+            row += n
+        if isinstance(codes, np.memmap):
+            codes.flush()
+        np.save(os.path.join(path, "scales.npy"), scales)
+
+        encoded = encode_keys(hashes)
+        order = np.argsort(encoded, kind="stable")
+        np.save(os.path.join(path, "hashes.npy"), encoded)
+        np.save(os.path.join(path, "sorted_hashes.npy"), encoded[order])
+        np.save(os.path.join(path, "hash_order.npy"), order.astype(np.int64))
+
+        # 3. IVF partition for large segments
+        if total >= self.ivf_min_rows:
+            lists = int(min(4096, max(16, np.sqrt(total))))
+            rng = np.random.default_rng(0)
+            sample_rows = np.sort(rng.choice(total, min(total, lists * 64), replace=False))
+            centroids = _train_ivf(normalize(dequantize(codes[sample_rows], scales[sample_rows])), lists)
+            assignment = np.empty(total, dtype=np.int32)
+            for start in range(0, total, BLOCK_ROWS):
+                stop = min(start + BLOCK_ROWS, total)
+                block = dequantize(codes[start:stop], scales[start:stop])
+                assignment[start:stop] = np.argmax(block @ centroids.T, axis=1)
+            list_rows = np.argsort(assignment, kind="stable").astype(np.int64)
+            list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=lists))]).astype(np.int64)
+            np.save(os.path.join(path, "centroids.npy"), centroids)
+            np.save(os.path.join(path, "list_rows.npy"), list_rows)
+            np.save(os.path.join(path, "list_offsets.npy"), list_offsets)
+
+        del codes
+        Segment.write_common(path, ids, records, {"doc_ranges": doc_ranges, "dtype": self.dtype})
+
+
+class LocalVectorStore(VectorStore):
+    """
+    LangChain VectorStore over a LocalVectorIndex, so as_retriever() and the
+    ensemble retriever work the same as with Chroma.
+    """
+
+    def __init__(self, index: LocalVectorIndex, embedding: Embeddings):
+        self.index = index
+        self._embedding = embedding
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> List[str]:
+        texts = list(texts)
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+        self.index.add(ids, self._embedding.embed_documents(texts), texts, metadatas)
+        return ids
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        hits = self.index.search(self._embedding.embed_query(query), k=k, filters=filter)
+        return [(doc, doc.metadata["score"]) for doc in self.index.get_documents(hits)]
+
+    def similarity_search(
+        self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> List[Document]:
+        return self.index.get_documents(self.index.search(embedding, k=k, filters=filter))
+
+    def _select_relevance_score_fn(self):
+        # Scores are cosine similarities in [-1, 1]
+        return lambda score: (score + 1.0) / 2.0
+
+    def delete(
+        self, ids: Optional[List[str]] = None, filter: Optional[Dict[str, Any]] = None, **kwargs: Any
+    ) -> Optional[bool]:
+        """
+        Delete chunks by id and/or whole documents by a doc_id filter.
+        """
+        doc_ids = delete_filter_doc_ids(ids, filter)
+        if ids:
+            self.index.delete_chunks(ids)
+        for doc_id in doc_ids or []:
+            self.index.delete_document(doc_id)
+        return True
+
+    def get(self) -> Dict[str, List[Any]]:
+        """
+        Chroma-compatible full dump (ids, documents, metadatas), used to bootstrap BM25.
+        """
+        result: Dict[str, List[Any]] = {"ids": [], "documents": [], "metadatas": []}
+        for ids, texts, metadatas in self.index.iter_records():
+            result["ids"].extend(ids)
+            result["documents"].extend(texts)
+            result["metadatas"].extend(metadatas)
+        return result
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        index_dir: str = "./data/vector_index",
+        **kwargs: Any
+    ) -> "LocalVectorStore":
+        store = cls(LocalVectorIndex(index_dir), embedding)
+        store.add_texts(texts, metadatas=metadatas, ids=kwargs.get("ids"))
+        return store
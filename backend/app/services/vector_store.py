@@ -1,102 +1,552 @@
 import os
-from typing import List, Dict, Any
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.retrievers import BM25Retriever
-from langchain.retrievers import EnsembleRetriever
+import time
+import uuid
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Callable, Hashable, Iterable, Optional, Set
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from app.core.config import get_settings
+from app.services.bm25_index import BM25Index, BM25IndexRetriever, split_doc_filter
+from app.services.hashing import hash_text
+from app.services.vector_index import LocalVectorIndex, LocalVectorStore
+from app.services.shards import ShardedVectorStore, VectorShard
+from app.services.embedding_service import build_embedding_service
+from app.services.cache import TTLCache, CachedQueryEmbeddings, GLOBAL_SCOPE, normalize_query, freeze
+from app.core.metrics import registry
 
 settings = get_settings()
 
 class VectorService:
+    """
+    Construction is cheap: the embedding model, Chroma and the BM25 index are
+    loaded by warmup(), which the app runs in the background at startup and
+    which any first use triggers (and waits for) otherwise.
+    """
+
     def __init__(self):
-        if settings.EMBEDDING_PROVIDER == "huggingface":
-            self.embeddings = HuggingFaceEmbeddings(
-                model_name="all-MiniLM-L6-v2"
+        # Query embeddings and top-k results are cached separately: embeddings
+        # never go stale, results are invalidated per doc_id on ingest/delete
+        self.embedding_cache = TTLCache(
+            max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.QUERY_CACHE_TTL_SECONDS,
+            max_bytes=settings.EMBEDDING_CACHE_MAX_BYTES,
+            sizeof=lambda vector: 64 + 8 * len(vector)
+        )
+        self.result_cache = TTLCache(
+            max_entries=settings.RESULT_CACHE_MAX_ENTRIES,
+            ttl_seconds=settings.QUERY_CACHE_TTL_SECONDS,
+            max_bytes=settings.RESULT_CACHE_MAX_BYTES,
+            sizeof=lambda docs: sum(256 + len(d.page_content) for d in docs)
+        )
+        self.bm25_index = BM25Index(
+            settings.BM25_INDEX_DIRECTORY,
+            refresh_interval=settings.BM25_REFRESH_INTERVAL_SECONDS
+        )
+        # Other workers' writes show up in the shared BM25 journal; drop results they affect
+        self.bm25_index.on_change = self._on_external_change
+        # Other caches keyed on document content (e.g. chat answers), called with
+        # the doc_ids that changed, or None when everything may have
+        self.change_listeners: List[Callable[[Optional[Set[str]]], None]] = []
+
+        # Batches concurrent query embeddings and keeps bulk ingest from starving them
+        self.embedding_service = build_embedding_service()
+        self._embeddings: Optional[Embeddings] = None
+        self._vector_store: Optional[ShardedVectorStore] = None
+        self._chroma_client = None
+        # Search scoring runs here rather than on the default pool, which sync
+        # endpoints (uploads, document listing) share
+        self.search_executor = ThreadPoolExecutor(
+            max_workers=settings.SEARCH_MAX_WORKERS,
+            thread_name_prefix="search"
+        )
+        # Per-shard work fanned out from a search thread; a separate pool so
+        # searches never wait on their own executor
+        self.shard_executor = ThreadPoolExecutor(
+            max_workers=max(1, min(settings.VECTOR_SHARD_MAX_WORKERS, settings.VECTOR_SHARDS)),
+            thread_name_prefix="shard"
+        )
+        self._warmup_lock = threading.Lock()
+        self.ready = False
+        self.startup_report: Dict[str, Any] = {}
+        self._register_metrics()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        self.warmup()
+        return self._embeddings
+
+    @property
+    def vector_store(self) -> ShardedVectorStore:
+        self.warmup()
+        return self._vector_store
+
+    def warmup(self) -> Dict[str, Any]:
+        """
+        Load the embedding model, open Chroma and load the BM25 snapshot.
+        Idempotent and thread-safe; returns per-step timings in seconds.
+        """
+        if self.ready:
+            return self.startup_report
+        with self._warmup_lock:
+            if self.ready:
+                return self.startup_report
+            report: Dict[str, Any] = {}
+            start = time.perf_counter()
+
+            # 1. Embedding model (plus one inference so the first query doesn't pay for lazy init)
+            step = time.perf_counter()
+            if settings.EMBEDDING_PROVIDER == "huggingface":
+                self.embedding_service.warmup()
+            self._embeddings = CachedQueryEmbeddings(self.embedding_service, self.embedding_cache)
+            report["embedding_model_s"] = round(time.perf_counter() - step, 3)
+            report["embedding_backend"] = self.embedding_service.backend
+
+            # 2. Vector store: VECTOR_SHARDS partitions (one is the unsharded layout)
+            step = time.perf_counter()
+            opened = [self._open_shard(number) for number in range(max(1, settings.VECTOR_SHARDS))]
+            self._vector_store = ShardedVectorStore(
+                [shard for shard, _ in opened], self._embeddings, self.shard_executor
             )
-        else:
-            self.embeddings = OpenAIEmbeddings(
-                model="text-embedding-3-small",
-                openai_api_key=settings.OPENAI_API_KEY
+            if not any(existed for _, existed in opened):
+                report["vector_imported"] = self._import_unsharded(self._vector_store)
+            report["vector_shards"] = len(opened)
+            report["vector_store_s"] = round(time.perf_counter() - step, 3)
+
+            # 3. Lexical index
+            step = time.perf_counter()
+            report["bm25_source"] = self._initialize_bm25()
+            report["bm25_s"] = round(time.perf_counter() - step, 3)
+            report["bm25_chunks"] = len(self.bm25_index)
+
+            report["total_s"] = round(time.perf_counter() - start, 3)
+            self.startup_report = report
+            self.ready = True
+            print(f"Vector service ready: {report}")
+            return report
+
+    def _open_shard(self, number: int):
+        """
+        Open shard `number`. Returns (shard, whether it already existed).
+        A single shard keeps the unsharded names, so existing data is used as is.
+        """
+        sharded = settings.VECTOR_SHARDS > 1
+        name = f"{settings.COLLECTION_NAME}_shard{number}" if sharded else settings.COLLECTION_NAME
+        if settings.VECTOR_BACKEND == "local":
+            index = self._create_local_index(
+                os.path.join(settings.VECTOR_INDEX_DIRECTORY, "shards", str(number))
+                if sharded else settings.VECTOR_INDEX_DIRECTORY
             )
-            
-        self.vector_store = Chroma(
-            collection_name=settings.COLLECTION_NAME,
-            embedding_function=self.embeddings,
-            persist_directory=settings.CHROMA_PERSIST_DIRECTORY
+            index.on_change = self._on_external_change
+            existed = index.exists()
+            if existed:
+                index.load()
+            return VectorShard(name, LocalVectorStore(index, self._embeddings), index), existed
+        existed = self._chroma_exists(name)
+        return VectorShard(name, self._create_chroma(name)), existed
+
+    @staticmethod
+    def _create_local_index(index_dir: str) -> LocalVectorIndex:
+        return LocalVectorIndex(
+            index_dir,
+            dtype=settings.VECTOR_QUANTIZATION,
+            ivf_min_rows=settings.VECTOR_IVF_MIN_ROWS,
+            nprobe=settings.VECTOR_IVF_NPROBE,
+            refresh_interval=settings.BM25_REFRESH_INTERVAL_SECONDS
         )
-        self.bm25_retriever = None
-        self._initialize_bm25()
 
-    def _initialize_bm25(self):
+    def _get_chroma_client(self):
+        if self._chroma_client is None:
+            import chromadb
+            if settings.CHROMA_HOST:
+                self._chroma_client = chromadb.HttpClient(host=settings.CHROMA_HOST, port=settings.CHROMA_PORT)
+            else:
+                self._chroma_client = chromadb.PersistentClient(path=settings.CHROMA_PERSIST_DIRECTORY)
+        return self._chroma_client
+
+    def _chroma_exists(self, name: str) -> bool:
+        if not settings.CHROMA_HOST and not os.path.isdir(settings.CHROMA_PERSIST_DIRECTORY):
+            return False
+        # list_collections returns names on Chroma >= 0.6 and collection objects before
+        return name in [getattr(c, "name", c) for c in self._get_chroma_client().list_collections()]
+
+    def _create_chroma(self, name: str):
+        from langchain_chroma import Chroma
+        return Chroma(
+            collection_name=name,
+            embedding_function=self._embeddings,
+            client=self._get_chroma_client()
+        )
+
+    def _unsharded_batches(self, batch_size: int):
         """
-        Initialize BM25 retriever from existing documents in Chroma.
-        This is a heavy operation for large datasets but necessary for local hybrid search without external engines.
+        (ids, embeddings, texts, metadatas) batches of the unsharded corpus:
+        the local index at VECTOR_INDEX_DIRECTORY when sharding a local
+        corpus, otherwise the COLLECTION_NAME Chroma collection.
+        """
+        sharded = settings.VECTOR_SHARDS > 1
+        if settings.VECTOR_BACKEND == "local" and sharded:
+            index = self._create_local_index(settings.VECTOR_INDEX_DIRECTORY)
+            if index.exists():
+                index.load()
+                yield from index.export(batch_size)
+                return
+        if (settings.VECTOR_BACKEND == "chroma" and not sharded) or not self._chroma_exists(settings.COLLECTION_NAME):
+            return
+        collection = self._create_chroma(settings.COLLECTION_NAME)._collection
+        offset = 0
+        while True:
+            batch = collection.get(
+                include=["embeddings", "documents", "metadatas"],
+                limit=batch_size,
+                offset=offset
+            )
+            if not batch["ids"]:
+                break
+            yield batch["ids"], batch["embeddings"], batch["documents"], batch["metadatas"]
+            offset += len(batch["ids"])
+
+    def _import_unsharded(self, store: ShardedVectorStore, batch_size: int = 1000) -> int:
+        """
+        Copy an existing unsharded corpus (text, metadata and stored embeddings)
+        into newly created shards, so switching backends or turning sharding on
+        needs no re-embedding. The source is left untouched.
+        """
+        imported = 0
+        for ids, embeddings, texts, metadatas in self._unsharded_batches(batch_size):
+            store.add(ids, embeddings, texts, metadatas)
+            imported += len(ids)
+        if imported:
+            store.compact()
+        return imported
+
+    def shutdown(self):
+        """
+        Fold the journals into segments so the next start only has to map them
+        instead of replaying every change since the last compaction.
+        """
+        if self.ready:
+            self.compact()
+        self.embedding_service.shutdown()
+        self.search_executor.shutdown(wait=False, cancel_futures=True)
+        self.shard_executor.shutdown(wait=False, cancel_futures=True)
+
+    def _register_metrics(self):
+        caches = {"embeddings": self.embedding_cache, "results": self.result_cache}
+
+        def cache_stat(field: str):
+            return lambda: [({"cache": name}, cache.stats()[field]) for name, cache in caches.items()]
+
+        registry.callback("retriv_cache_hits_total", "Cache hits", cache_stat("hits"), "counter")
+        registry.callback("retriv_cache_misses_total", "Cache misses", cache_stat("misses"), "counter")
+        registry.callback("retriv_cache_entries", "Entries currently cached", cache_stat("entries"))
+        registry.callback("retriv_cache_bytes", "Approximate cache memory use", cache_stat("bytes"))
+        registry.callback(
+            "retriv_bm25_chunks",
+            "Chunks in the BM25 index",
+            lambda: [({}, len(self.bm25_index))]
+        )
+        registry.callback(
+            "retriv_vector_shard_chunks",
+            "Chunks per vector shard",
+            lambda: [({"shard": shard.name}, shard.count()) for shard in self._vector_store.shards] if self.ready else []
+        )
+
+    def _initialize_bm25(self) -> str:
+        """
+        Load the persisted BM25 index. The full Chroma scan only happens once,
+        to bootstrap an index for a collection created before it existed.
+        Returns where the index came from.
         """
         try:
-            # Fetch all documents from Chroma to build BM25 index
-            # Chroma get() without ids returns all
-            result = self.vector_store.get()
+            if self.bm25_index.exists():
+                self.bm25_index.load()
+                return "snapshot"
+
+            result = self._vector_store.get()
             documents = []
             if result['documents']:
                 for i, text in enumerate(result['documents']):
                     metadata = result['metadatas'][i] if result['metadatas'] else {}
-                    documents.append(Document(page_content=text, metadata=metadata))
-            
+                    documents.append(Document(page_content=text, metadata=metadata or {}))
             if documents:
-                self.bm25_retriever = BM25Retriever.from_documents(documents)
-                self.bm25_retriever.k = 20  # Default retrieval count
-            else:
-                self.bm25_retriever = None
+                self.bm25_index.rebuild(result['ids'], documents)
+                return "rebuilt"
+            return "empty"
         except Exception as e:
             print(f"Failed to initialize BM25: {e}")
-            self.bm25_retriever = None
+            return "failed"
 
-    def add_documents(self, documents: List[Document]):
+    def add_documents(self, documents: List[Document]) -> int:
         """
         Add documents to Chroma and update BM25 index.
+        Chunks are content-hashed; embeddings already stored for the same hash
+        are reused and identical chunks within the batch are embedded once.
+        Returns the number of chunks that did not need a new embedding.
         """
         if not documents:
-            return
-            
-        self.vector_store.add_documents(documents)
-        # Re-initialize BM25 to include new documents
-        # In production, this should be optimized or handled asynchronously
-        self._initialize_bm25()
+            return 0
+
+        for doc in documents:
+            doc.metadata.setdefault("chunk_hash", hash_text(doc.page_content))
+        hashes = [doc.metadata["chunk_hash"] for doc in documents]
+
+        vectors = self._lookup_embeddings(hashes)
+        texts_by_hash = {doc.metadata["chunk_hash"]: doc.page_content for doc in documents}
+        missing = [h for h in texts_by_hash if h not in vectors]
+        if missing:
+            vectors.update(zip(missing, self.embeddings.embed_documents([texts_by_hash[h] for h in missing])))
+
+        ids = [str(uuid.uuid4()) for _ in documents]
+        embeddings = [vectors[h] for h in hashes]
+        texts = [doc.page_content for doc in documents]
+        metadatas = [doc.metadata for doc in documents]
+        self.vector_store.add(ids, embeddings, texts, metadatas)
+        # Index only the new chunks; cost is independent of collection size
+        self.bm25_index.add_documents(ids, documents)
+        self._invalidate({d.metadata.get("doc_id") for d in documents})
+        return len(documents) - len(missing)
+
+    def _lookup_embeddings(self, hashes: List[str]) -> Dict[str, Any]:
+        """
+        Map chunk hashes to embeddings already stored in any shard.
+        """
+        unique = list(set(hashes))
+        if not unique:
+            return {}
+        return self.vector_store.lookup_hashes(unique)
 
     def delete_document(self, doc_id: str):
         """
         Delete documents by doc_id metadata.
         """
-        # Chroma requires filtering by metadata
-        self.vector_store._collection.delete(where={"doc_id": doc_id})
-        self._initialize_bm25()
+        self.vector_store.delete_document(doc_id)
+        self.bm25_index.delete_document(doc_id)
+        self._invalidate([doc_id])
 
-    def get_retriever(self, k: int = 5, filters: Dict[str, Any] = None):
+    def delete_documents(self, doc_ids: List[str]):
         """
-        Get an EnsembleRetriever (Vector + BM25) or just Vector if BM25 is empty.
+        Delete several documents, with one Chroma call per shard.
         """
-        chroma_retriever = self.vector_store.as_retriever(
+        if not doc_ids:
+            return
+        self.vector_store.delete_documents(doc_ids)
+        for doc_id in doc_ids:
+            self.bm25_index.delete_document(doc_id)
+        self._invalidate(doc_ids)
+
+    def compact(self):
+        """
+        Fold journals and tombstones into new segments (local indexes only;
+        Chroma manages its own storage).
+        """
+        self.bm25_index.compact()
+        self.vector_store.compact()
+
+    def _invalidate(self, doc_ids: Iterable[Optional[str]]):
+        """
+        Drop cached results that could include the given documents: every
+        unfiltered result plus results scoped to those doc_ids. Results scoped
+        to other documents are kept; their BM25 scores may drift slightly as
+        corpus statistics change, bounded by QUERY_CACHE_TTL_SECONDS.
+        """
+        doc_ids = {d for d in doc_ids if d}
+        self.result_cache.invalidate_tags([GLOBAL_SCOPE, *doc_ids])
+        for listener in self.change_listeners:
+            listener(doc_ids)
+
+    def _on_external_change(self, doc_ids: Optional[Iterable[str]]):
+        if doc_ids is None:
+            self.result_cache.clear()
+            for listener in self.change_listeners:
+                listener(None)
+        else:
+            self._invalidate(doc_ids)
+
+    def _cached_batch(
+        self,
+        kind: str,
+        queries: List[str],
+        ks: List[int],
+        filters: List[Optional[Dict[str, Any]]]
+    ):
+        """
+        Refresh the shared indexes once, then look up cached results for each
+        query. Returns (keys, docs or None per query).
+        """
+        self.warmup()
+        self.bm25_index.maybe_refresh()
+        self._vector_store.maybe_refresh()
+        keys = [(kind, normalize_query(query), k, freeze(f)) for query, k, f in zip(queries, ks, filters)]
+        return keys, [self.result_cache.get(key) for key in keys]
+
+    def _cached_results(self, kind: str, query: str, k: int, filters: Optional[Dict[str, Any]]):
+        """
+        Refresh the shared indexes, then look up cached results. Returns (key, docs or None).
+        """
+        keys, docs = self._cached_batch(kind, [query], [k], [filters])
+        return keys[0], docs[0]
+
+    def _store_results(self, key, filters: Optional[Dict[str, Any]], docs: List[Document]) -> List[Document]:
+        doc_ids, _ = split_doc_filter(filters)
+        self.result_cache.set(key, docs, tags=doc_ids if doc_ids is not None else [GLOBAL_SCOPE])
+        return docs
+
+    @staticmethod
+    def _copy(docs: List[Document]) -> List[Document]:
+        # Callers annotate metadata (scores), so never hand out the cached objects
+        return [Document(page_content=d.page_content, metadata=dict(d.metadata), id=d.id) for d in docs]
+
+    def _cached_search(self, kind: str, query: str, k: int, filters: Optional[Dict[str, Any]], search) -> List[Document]:
+        key, docs = self._cached_results(kind, query, k, filters)
+        if docs is None:
+            docs = self._store_results(key, filters, search())
+        return self._copy(docs)
+
+    def vector_search(self, query: str, k: int = 5, filters: Dict[str, Any] = None) -> List[Document]:
+        """
+        Top-k chunks by embedding similarity, served from the result cache when possible.
+        """
+        return self._cached_search(
+            "vector", query, k, filters,
+            lambda: self.vector_store.similarity_search(query, k=k, filter=filters)
+        )
+
+    def keyword_search(self, query: str, k: int = 5, filters: Dict[str, Any] = None) -> List[Document]:
+        """
+        Top-k chunks by BM25, served from the result cache when possible.
+        """
+        return self._cached_search(
+            "bm25", query, k, filters,
+            lambda: self.bm25_index.get_documents(self.bm25_index.search(query, k=k, filters=filters))
+        )
+
+    async def avector_search(self, query: str, k: int = 5, filters: Dict[str, Any] = None) -> List[Document]:
+        """
+        Async vector_search: the query embedding is awaited on the embedding
+        engine and scoring runs on the search pool, so no event loop or
+        default-pool thread is held. Cancelling it skips work not yet started.
+        """
+        loop = asyncio.get_running_loop()
+        key, docs = await loop.run_in_executor(self.search_executor, self._cached_results, "vector", query, k, filters)
+        if docs is None:
+            vector = await self._embeddings.aembed_query(query)
+            docs = await loop.run_in_executor(
+                self.search_executor,
+                lambda: self._store_results(key, filters, self._vector_store.similarity_search_by_vector(vector, k=k, filter=filters))
+            )
+        return self._copy(docs)
+
+    async def akeyword_search(self, query: str, k: int = 5, filters: Dict[str, Any] = None) -> List[Document]:
+        """
+        Async keyword_search, scored on the search pool.
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.search_executor, self.keyword_search, query, k, filters)
+
+    async def avector_search_batch(
+        self,
+        queries: List[str],
+        ks: List[int],
+        filters: List[Optional[Dict[str, Any]]]
+    ) -> List[List[Document]]:
+        """
+        vector_search for many queries at once: uncached queries are embedded
+        as one batch, then scored together per distinct filter on the search pool.
+        """
+        loop = asyncio.get_running_loop()
+        keys, results = await loop.run_in_executor(self.search_executor, self._cached_batch, "vector", queries, ks, filters)
+        missing = [i for i, docs in enumerate(results) if docs is None]
+        if missing:
+            vectors = dict(zip(missing, await self._embeddings.aembed_queries([queries[i] for i in missing])))
+            groups: Dict[Hashable, List[int]] = {}
+            for i in missing:
+                groups.setdefault(freeze(filters[i]), []).append(i)
+
+            def score(members: List[int]):
+                found = self._vector_store.search_by_vectors(
+                    [vectors[i] for i in members], max(ks[i] for i in members), filters[members[0]]
+                )
+                for i, docs in zip(members, found):
+                    results[i] = self._store_results(keys[i], filters[i], docs[:ks[i]])
+
+            # Groups are independent; NumPy releases the GIL in the matrix products
+            await asyncio.gather(*[
+                loop.run_in_executor(self.search_executor, score, members) for members in groups.values()
+            ])
+        return [self._copy(docs) for docs in results]
+
+    async def akeyword_search_batch(
+        self,
+        queries: List[str],
+        ks: List[int],
+        filters: List[Optional[Dict[str, Any]]]
+    ) -> List[List[Document]]:
+        """
+        keyword_search for many queries. BM25 walks each query's own postings,
+        so there is no shared product to batch; queries are split into one
+        slice per search thread instead of one executor hop each.
+        """
+        loop = asyncio.get_running_loop()
+        size = max(1, -(-len(queries) // settings.SEARCH_MAX_WORKERS))
+
+        def search(start: int) -> List[List[Document]]:
+            return [
+                self.keyword_search(queries[i], ks[i], filters[i])
+                for i in range(start, min(start + size, len(queries)))
+            ]
+
+        parts = await asyncio.gather(*[
+            loop.run_in_executor(self.search_executor, search, start) for start in range(0, len(queries), size)
+        ])
+        return [docs for part in parts for docs in part]
+
+    def get_vector_retriever(self, k: int = 5, filters: Dict[str, Any] = None):
+        return self.vector_store.as_retriever(
             search_kwargs={"k": k, "filter": filters}
         )
+
+    def get_bm25_retriever(self, k: int = 5, filters: Dict[str, Any] = None):
+        """
+        BM25 retriever over the lexical index, or None if the index is empty.
+        The index applies the same Chroma-style filter natively.
+        """
+        self.warmup()
+        if not len(self.bm25_index):
+            return None
+        return BM25IndexRetriever(index=self.bm25_index, k=k, filters=filters)
+
+    def get_retriever(self, k: int = 5, filters: Dict[str, Any] = None):
+        """
+        Get an EnsembleRetriever (Vector + BM25) or just Vector if BM25 is empty.
+        Filters apply to both halves, so doc_id-scoped queries stay hybrid.
+        """
+        chroma_retriever = self.get_vector_retriever(k=k, filters=filters)
+        bm25_retriever = self.get_bm25_retriever(k=k, filters=filters)
         
-        if self.bm25_retriever and not filters:
-            self.bm25_retriever.k = k
-            # Note: BM25Retriever doesn't support metadata filters natively in LangChain easily
-            # We might need to post-filter or just rely on the ensemble
+        if bm25_retriever:
+            from langchain.retrievers import EnsembleRetriever
             ensemble_retriever = EnsembleRetriever(
-                retrievers=[chroma_retriever, self.bm25_retriever],
-                weights=[0.5, 0.5]
+                retrievers=[chroma_retriever, bm25_retriever],
+                weights=[settings.VECTOR_WEIGHT, settings.BM25_WEIGHT]
             )
             return ensemble_retriever
         
         return chroma_retriever
 
     def get_stats(self):
+        if not self.ready:
+            return {"count": 0, "ready": False}
+        shards = {shard.name: shard.count() for shard in self._vector_store.shards}
         return {
-            "count": self.vector_store._collection.count()
+            "ready": True,
+            "count": sum(shards.values()),
+            "shards": shards,
+            "cache": {
+                "embeddings": self.embedding_cache.stats(),
+                "results": self.result_cache.stats(),
+            },
+            "embeddings": self.embedding_service.get_stats()
         }
 
 # Singleton instance
@@ -0,0 +1,60 @@
+import random
+from typing import List, Tuple
+from langchain_core.documents import Document
+
+SYLLABLES = [
+    "ka", "lo", "mi", "ne", "ra", "tu", "vo", "shi", "den", "mar",
+    "pel", "quo", "rin", "sa", "tor", "ul", "ve", "xan", "yo", "zu",
+]
+
+
+def build_vocabulary(size: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def generate_corpus(
+    num_docs: int,
+    chunks_per_doc: int,
+    words_per_chunk: int,
+    vocab_size: int = 20000,
+    seed: int = 13
+) -> List[Document]:
+    """
+    Deterministic synthetic chunks with a Zipfian term distribution, shaped
+    like the splitter output (doc_id/filename metadata, ~512-char chunks).
+    """
+    rng = random.Random(seed)
+    vocab = build_vocabulary(vocab_size, seed)
+    weights = [1.0 / (rank + 1) ** 1.1 for rank in range(len(vocab))]
+
+    chunks = []
+    for d in range(num_docs):
+        doc_id = f"doc-{d:06d}"
+        # Each document leans on its own topic words so filtered queries are meaningful
+        topic = rng.sample(vocab, 20)
+        for c in range(chunks_per_doc):
+            words = rng.choices(vocab, weights=weights, k=words_per_chunk)
+            for i in rng.sample(range(words_per_chunk), min(5, words_per_chunk)):
+                words[i] = rng.choice(topic)
+            chunks.append(Document(
+                page_content=" ".join(words),
+                metadata={"doc_id": doc_id, "filename": f"{doc_id}.txt", "chunk": c}
+            ))
+    return chunks
+
+
+def generate_queries(chunks: List[Document], count: int, seed: int = 29) -> List[Tuple[str, str]]:
+    """
+    Queries built from words of a random chunk. Returns (query, source doc_id).
+    """
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        chunk = rng.choice(chunks)
+        words = chunk.page_content.split()
+        queries.append((" ".join(rng.sample(words, min(len(words), rng.randint(3, 6)))), chunk.metadata["doc_id"]))
+    return queries
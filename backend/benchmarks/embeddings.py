@@ -0,0 +1,118 @@
+"""
+Embedding engine benchmark.
+
+For each backend, reports bulk throughput (texts/s through embed_documents)
+and query embedding latency percentiles under concurrency, both on an idle
+engine and while a bulk ingest is running, which is the case the priority
+queues exist for. Backends that fail to load (e.g. ONNX Runtime not
+installed) are reported with their error and skipped.
+
+Usage (from backend/):
+    python -m benchmarks.embeddings --backends torch onnx onnx-int8
+    python -m benchmarks.embeddings --backends hash --bulk-texts 20000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.corpus import generate_corpus, generate_queries
+from benchmarks.run import HashingEmbeddings, summarize, git_commit, peak_rss_mb
+
+
+def measure_queries(service, queries: List[str], concurrency: int) -> List[float]:
+    def one(query: str) -> float:
+        start = time.perf_counter()
+        service.embed_query(query)
+        return (time.perf_counter() - start) * 1000
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(one, queries))
+
+
+def bench_backend(backend: str, args, texts: List[str], queries: List[str]) -> Dict[str, Any]:
+    from app.services import embedding_service
+
+    if backend == "hash":
+        factory = lambda: embedding_service.LangChainEncoder(HashingEmbeddings(), "hash")
+    else:
+        factory = lambda: embedding_service.create_encoder("huggingface", backend)
+    service = embedding_service.EmbeddingService(
+        encoder_factory=factory,
+        workers=args.workers,
+        query_batch_size=args.query_batch_size,
+        batch_wait_ms=args.batch_wait_ms,
+        bulk_batch_size=args.bulk_batch_size
+    )
+    result: Dict[str, Any] = {}
+    try:
+        # 1. Model load + first inference
+        start = time.perf_counter()
+        service.warmup()
+        result["load_s"] = round(time.perf_counter() - start, 3)
+
+        # 2. Bulk throughput
+        start = time.perf_counter()
+        service.embed_documents(texts)
+        elapsed = time.perf_counter() - start
+        result["bulk"] = {"texts": len(texts), "seconds": round(elapsed, 3), "texts_per_s": round(len(texts) / elapsed, 1)}
+
+        # 3. Query latency on an idle engine
+        result["query_idle"] = summarize(measure_queries(service, queries, args.concurrency))
+
+        # 4. Query latency while a bulk ingest runs
+        ingest = threading.Thread(target=service.embed_documents, args=(texts,))
+        ingest.start()
+        result["query_under_ingest"] = summarize(measure_queries(service, queries, args.concurrency))
+        ingest.join()
+
+        result["engine"] = service.get_stats()
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        service.shutdown()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", choices=["hash", "torch", "onnx", "onnx-int8"], default=["torch", "onnx", "onnx-int8"])
+    parser.add_argument("--bulk-texts", type=int, default=2000)
+    parser.add_argument("--words-per-chunk", type=int, default=80)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent query callers")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=0, help="intra-op threads per model call (0: runtime default)")
+    parser.add_argument("--query-batch-size", type=int, default=32)
+    parser.add_argument("--batch-wait-ms", type=float, default=2.0)
+    parser.add_argument("--bulk-batch-size", type=int, default=64)
+    parser.add_argument("--output", help="write results as JSON to this path")
+    args = parser.parse_args()
+
+    # Read by create_encoder; must be set before app settings are first loaded
+    os.environ["EMBEDDING_THREADS"] = str(args.threads)
+
+    chunks = generate_corpus(max(1, args.bulk_texts // 20), 20, args.words_per_chunk)
+    texts = [c.page_content for c in chunks[:args.bulk_texts]]
+    queries = [query for query, _ in generate_queries(chunks, args.queries)]
+
+    results: Dict[str, Any] = {"commit": git_commit(), "config": vars(args), "backends": {}}
+    for backend in args.backends:
+        results["backends"][backend] = bench_backend(backend, args, texts, queries)
+        print(f"{backend}: {json.dumps(results['backends'][backend])}", file=sys.stderr)
+    results["peak_rss_mb"] = peak_rss_mb()
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+"""
+Retrieval benchmark for the hybrid search path.
+
+Builds a synthetic corpus in a throwaway data directory and reports ingest
+throughput, index load time, per-path retrieval latency percentiles,
+recall@k against brute-force search, chat time-to-first-token against a
+local stub LLM, and peak RSS. Runs fully offline with --embeddings hash.
+
+Usage (from backend/):
+    python -m benchmarks.run --docs 500 --chunks-per-doc 20 --queries 200
+    python -m benchmarks.run --embeddings huggingface --output bench.json
+"""
+import os
+import sys
+import json
+import time
+import math
+import zlib
+import shutil
+import random
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+from collections import Counter
+from typing import Dict, List, Any
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.corpus import generate_corpus, generate_queries
+from benchmarks.stub_llm import start_stub_server
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Deterministic feature-hashing embeddings. No model download, so runs are
+    offline and comparable; vector latency then reflects the index, not the model.
+    """
+
+    def __init__(self, dims: int = 384):
+        self.dims = dims
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dims, dtype=np.float32)
+        for word in text.lower().split():
+            h = zlib.crc32(word.encode("utf-8"))
+            vector[h % self.dims] += 1.0 if (h >> 16) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pct(p):
+        return round(ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)], 3)
+
+    return {
+        "n": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered), 3),
+        "p50_ms": pct(50),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+    }
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    return round(rss / (1024 * 1024) if platform.system() == "Darwin" else rss / 1024, 1)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def chunk_key(doc) -> tuple:
+    return doc.metadata.get("doc_id"), doc.metadata.get("chunk")
+
+
+def configure_environment(args, data_dir: str, llm_url: str):
+    # Must run before any app module is imported: settings are read once at import
+    os.environ.update({
+        "CHROMA_PERSIST_DIRECTORY": os.path.join(data_dir, "chroma_db"),
+        "BM25_INDEX_DIRECTORY": os.path.join(data_dir, "bm25_index"),
+        "VECTOR_INDEX_DIRECTORY": os.path.join(data_dir, "vector_index"),
+        "VECTOR_BACKEND": args.vector_backend,
+        "VECTOR_SHARDS": str(args.vector_shards),
+        "EMBEDDING_BACKEND": args.embedding_backend,
+        "SQLITE_URL": f"sqlite:///{os.path.join(data_dir, 'metadata.db')}",
+        "COLLECTION_NAME": "benchmark",
+        "EMBEDDING_PROVIDER": "huggingface",
+        "LLM_PROVIDER": "openai",
+        "OPENAI_API_KEY": "benchmark",
+        "LLM_BASE_URL": llm_url,
+        "RETRIEVAL_TOP_K": str(args.k),
+    })
+    if not args.with_cache:
+        os.environ["EMBEDDING_CACHE_MAX_ENTRIES"] = "0"
+        os.environ["RESULT_CACHE_MAX_ENTRIES"] = "0"
+    if args.embeddings == "hash":
+        from app.services import embedding_service
+        embedding_service.create_encoder = lambda *a, **kw: embedding_service.LangChainEncoder(HashingEmbeddings(), "hash")
+
+
+def brute_force_vector(matrix: np.ndarray, keys: List[tuple], query: List[float], k: int, allowed=None) -> set:
+    # Embeddings are unit-length, so cosine order equals Chroma's squared-L2 order
+    q = np.asarray(query, dtype=np.float32)
+    scores = matrix @ q
+    if allowed is not None:
+        scores = np.where(allowed, scores, -np.inf)
+    top = np.argsort(-scores)[:k]
+    return {keys[i] for i in top if np.isfinite(scores[i])}
+
+
+def brute_force_bm25(index, term_counts: List[Counter], keys: List[tuple], query: str, k: int, allowed=None) -> set:
+    from app.services.bm25_index import tokenize
+    n = len(term_counts)
+    lengths = [sum(c.values()) for c in term_counts]
+    avgdl = sum(lengths) / n
+    df = Counter(term for counts in term_counts for term in counts)
+    scores = []
+    for i, counts in enumerate(term_counts):
+        if allowed is not None and not allowed[i]:
+            continue
+        score = 0.0
+        for term, qtf in Counter(tokenize(query)).items():
+            tf = counts.get(term)
+            if not tf:
+                continue
+            idf = math.log(1 + (n - df[term] + 0.5) / (df[term] + 0.5)) * qtf
+            score += idf * tf * (index.k1 + 1) / (tf + index.k1 * (1 - index.b + index.b * lengths[i] / avgdl))
+        if score > 0:
+            scores.append((score, i))
+    scores.sort(reverse=True)
+    return {keys[i] for _, i in scores[:k]}
+
+
+def recall(found: set, expected: set) -> float:
+    return len(found & expected) / len(expected) if expected else 1.0
+
+
+async def run_async_benchmarks(args, queries, filter_sets, results):
+    from app.services.rerank import retrieval_pipeline
+    from app.services.chat_service import chat_service
+    from app.services.search_service import search_service
+
+    hybrid, filtered = [], []
+    for (query, _), doc_ids in zip(queries, filter_sets):
+        start = time.perf_counter()
+        await retrieval_pipeline.run(query)
+        hybrid.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await retrieval_pipeline.run(query, filters={"doc_id": {"$in": doc_ids}})
+        filtered.append((time.perf_counter() - start) * 1000)
+    results["latency"]["hybrid"] = summarize(hybrid)
+    results["latency"]["hybrid_filtered"] = summarize(filtered)
+
+    # Concurrent sessions: throughput should grow with SEARCH_MAX_WORKERS instead of serializing
+    semaphore = asyncio.Semaphore(args.concurrency)
+    concurrent = []
+
+    async def one(query):
+        async with semaphore:
+            start = time.perf_counter()
+            await retrieval_pipeline.run(query)
+            concurrent.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(query) for query, _ in queries])
+    elapsed = time.perf_counter() - start
+    results["latency"]["hybrid_concurrent"] = summarize(concurrent)
+    results["hybrid_concurrent_qps"] = round(len(queries) / elapsed, 1)
+
+    # Batched retrieval (the /api/search/batch path): each chunk embedded and scored together
+    texts = [query for query, _ in queries]
+    size = search_service.chunk_size
+    start = time.perf_counter()
+    for offset in range(0, len(texts), size):
+        chunk = texts[offset:offset + size]
+        await retrieval_pipeline.search_batch(chunk, [args.k] * len(chunk), [None] * len(chunk))
+    results["hybrid_batch_qps"] = round(len(texts) / (time.perf_counter() - start), 1)
+
+    ttft, total = [], []
+    for query, _ in queries[:args.chat_queries]:
+        start = time.perf_counter()
+        first = None
+        async for event in chat_service.stream_chat(query=query, doc_ids=[], history=[]):
+            if first is None and '"type": "token"' in event:
+                first = time.perf_counter()
+            if '"type": "error"' in event:
+                raise RuntimeError(event)
+        end = time.perf_counter()
+        ttft.append(((first or end) - start) * 1000)
+        total.append((end - start) * 1000)
+    results["chat"] = {"ttft": summarize(ttft), "total": summarize(total)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--chunks-per-doc", type=int, default=20)
+    parser.add_argument("--words-per-chunk", type=int, default=80)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--chat-queries", type=int, default=20)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8, help="parallel hybrid queries")
+    parser.add_argument("--filter-docs", type=int, default=10, help="doc_ids per filtered query")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--embeddings", choices=["hash", "huggingface"], default="hash")
+    parser.add_argument("--embedding-backend", choices=["torch", "onnx", "onnx-int8"], default="torch")
+    parser.add_argument("--vector-backend", choices=["chroma", "local"], default="chroma")
+    parser.add_argument("--vector-shards", type=int, default=1)
+    parser.add_argument("--with-cache", action="store_true", help="leave query/result caches enabled")
+    parser.add_argument("--llm-tokens", type=int, default=64)
+    parser.add_argument("--llm-ttft-ms", type=float, default=50.0)
+    parser.add_argument("--llm-token-interval-ms", type=float, default=5.0)
+    parser.add_argument("--output", help="write results as JSON to this path")
+    parser.add_argument("--keep-data", action="store_true")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="retriv-bench-")
+    server = start_stub_server(args.llm_tokens, args.llm_ttft_ms, args.llm_token_interval_ms)
+    configure_environment(args, data_dir, f"http://127.0.0.1:{server.server_address[1]}/v1")
+
+    results: Dict[str, Any] = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "latency": {},
+        "recall": {},
+    }
+
+    try:
+        start = time.perf_counter()
+        from app.services.vector_store import vector_service, VectorService
+        vector_service.warmup()
+        results["startup_empty_s"] = round(time.perf_counter() - start, 3)
+
+        chunks = generate_corpus(args.docs, args.chunks_per_doc, args.words_per_chunk)
+        queries = generate_queries(chunks, args.queries)
+        doc_ids = sorted({c.metadata["doc_id"] for c in chunks})
+        rng = random.Random(7)
+        filter_sets = [
+            [source] + rng.sample(doc_ids, min(len(doc_ids), args.filter_docs) - 1)
+            for _, source in queries
+        ]
+
+        # 1. Ingest (embed + Chroma write + BM25 update)
+        start = time.perf_counter()
+        for i in range(0, len(chunks), args.batch_size):
+            vector_service.add_documents([
+                Document(page_content=c.page_content, metadata=dict(c.metadata)) for c in chunks[i:i + args.batch_size]
+            ])
+        elapsed = time.perf_counter() - start
+        results["ingest"] = {
+            "chunks": len(chunks),
+            "seconds": round(elapsed, 3),
+            "chunks_per_s": round(len(chunks) / elapsed, 1),
+        }
+
+        # 2. Index load, as on a restart
+        start = time.perf_counter()
+        restarted = VectorService()
+        results["startup_construct_s"] = round(time.perf_counter() - start, 3)
+        restarted.warmup()
+        results["startup_loaded_s"] = round(time.perf_counter() - start, 3)
+
+        # 3. Synchronous retrieval paths
+        vector, bm25, bm25_filtered = [], [], []
+        for (query, _), ids in zip(queries, filter_sets):
+            start = time.perf_counter()
+            vector_service.vector_search(query, k=args.k)
+            vector.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            vector_service.keyword_search(query, k=args.k)
+            bm25.append((time.perf_counter() - start) * 1000)
+
+            start = time.perf_counter()
+            vector_service.keyword_search(query, k=args.k, filters={"doc_id": {"$in": ids}})
+            bm25_filtered.append((time.perf_counter() - start) * 1000)
+        results["latency"]["vector"] = summarize(vector)
+        results["latency"]["bm25"] = summarize(bm25)
+        results["latency"]["bm25_filtered"] = summarize(bm25_filtered)
+
+        # 4. Hybrid pipeline and end-to-end chat against the stub LLM
+        asyncio.run(run_async_benchmarks(args, queries, filter_sets, results))
+
+        # 5. Recall@k against brute force
+        from app.services.bm25_index import tokenize
+        keys = [(c.metadata.get("doc_id"), c.metadata.get("chunk")) for c in chunks]
+        matrix = np.asarray(vector_service.embeddings.embed_documents([c.page_content for c in chunks]), dtype=np.float32)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        term_counts = [Counter(tokenize(c.page_content)) for c in chunks]
+        stored_doc_ids = np.array([c.metadata.get("doc_id") for c in chunks])
+
+        sample = list(zip(queries, filter_sets))[:min(len(queries), 50)]
+        vector_recall, bm25_recall, filtered_recall = [], [], []
+        for (query, _), ids in sample:
+            allowed = np.isin(stored_doc_ids, ids)
+            found = {chunk_key(d) for d in vector_service.vector_search(query, k=args.k)}
+            expected = brute_force_vector(matrix, keys, vector_service.embeddings.embed_query(query), args.k)
+            vector_recall.append(recall(found, expected))
+
+            found = {chunk_key(d) for d in vector_service.keyword_search(query, k=args.k)}
+            bm25_recall.append(recall(found, brute_force_bm25(vector_service.bm25_index, term_counts, keys, query, args.k)))
+
+            found = {chunk_key(d) for d in vector_service.keyword_search(query, k=args.k, filters={"doc_id": {"$in": ids}})}
+            expected = brute_force_bm25(vector_service.bm25_index, term_counts, keys, query, args.k, allowed)
+            filtered_recall.append(recall(found, expected))
+        results["recall"] = {
+            f"vector@{args.k}": round(sum(vector_recall) / len(vector_recall), 4),
+            f"bm25@{args.k}": round(sum(bm25_recall) / len(bm25_recall), 4),
+            f"bm25_filtered@{args.k}": round(sum(filtered_recall) / len(filtered_recall), 4),
+        }
+
+        results["embeddings"] = vector_service.embedding_service.get_stats()
+        results["peak_rss_mb"] = peak_rss_mb()
+    finally:
+        server.shutdown()
+        if not args.keep_data:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    """
+    Minimal OpenAI-compatible /chat/completions endpoint that streams a fixed
+    number of tokens with configurable latency, so chat benchmarks run offline
+    and measure only this service's overhead.
+    """
+    tokens = 64
+    ttft_ms = 50.0
+    token_interval_ms = 5.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_chunk(self, payload):
+        self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def do_POST(self):
+        if not self.path.endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        model = body.get("model", "stub")
+        prompt_chars = sum(len(m.get("content", "")) for m in body.get("messages", []))
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        time.sleep(self.ttft_ms / 1000)
+        base = {"id": "stub", "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+        for i in range(self.tokens):
+            self._send_chunk({**base, "choices": [{"index": 0, "delta": {"content": f"tok{i} "}, "finish_reason": None}]})
+            time.sleep(self.token_interval_ms / 1000)
+        self._send_chunk({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        self._send_chunk({**base, "choices": [], "usage": {
+            "prompt_tokens": prompt_chars // 4,
+            "completion_tokens": self.tokens,
+            "total_tokens": prompt_chars // 4 + self.tokens
+        }})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def start_stub_server(tokens: int, ttft_ms: float, token_interval_ms: float) -> ThreadingHTTPServer:
+    handler = type("ConfiguredStubLLMHandler", (StubLLMHandler,), {
+        "tokens": tokens,
+        "ttft_ms": ttft_ms,
+        "token_interval_ms": token_interval_ms,
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,18 @@
+import os
+import sys
+import tempfile
+
+# Settings are read when app modules are imported: point every store at a
+# scratch directory first so tests never touch ./data
+SCRATCH_DIR = tempfile.mkdtemp(prefix="retriv-tests-")
+os.environ.update({
+    "SQLITE_URL": f"sqlite:///{os.path.join(SCRATCH_DIR, 'metadata.db')}",
+    "VECTOR_BACKEND": "local",
+    "VECTOR_INDEX_DIRECTORY": os.path.join(SCRATCH_DIR, "vector_index"),
+    "BM25_INDEX_DIRECTORY": os.path.join(SCRATCH_DIR, "bm25_index"),
+    "CHROMA_PERSIST_DIRECTORY": os.path.join(SCRATCH_DIR, "chroma_db"),
+    "ANSWER_CACHE_ENABLED": "false",
+    "MAINTENANCE_INTERVAL_SECONDS": "0",
+})
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,80 @@
+import pytest
+from langchain_core.documents import Document
+from app.services.bm25_index import BM25Index, matches_filter, split_doc_filter
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = BM25Index(str(tmp_path))
+    index.load()
+    chunks = [
+        ("a-0", "the quick brown fox", {"doc_id": "a", "lang": "en"}),
+        ("a-1", "a lazy dog sleeps", {"doc_id": "a", "lang": "en"}),
+        ("b-0", "fox and dog together", {"doc_id": "b", "lang": "de"}),
+        ("c-0", "brown bread recipe", {"doc_id": "c", "lang": "en"}),
+    ]
+    index.add_documents([c for c, _, _ in chunks], [Document(page_content=t, metadata=m) for _, t, m in chunks])
+    return index
+
+
+def ids(hits):
+    return [chunk_id for chunk_id, _ in hits]
+
+
+@pytest.mark.parametrize("compacted", [False, True])
+def test_search_ranks_matching_chunks(index, compacted):
+    if compacted:
+        index.compact()
+    hits = index.search("brown fox", k=10)
+    assert ids(hits)[0] == "a-0"
+    assert set(ids(hits)) == {"a-0", "b-0", "c-0"}
+    assert hits == sorted(hits, key=lambda h: h[1], reverse=True)
+
+
+@pytest.mark.parametrize("compacted", [False, True])
+def test_deleted_documents_are_not_returned(index, compacted):
+    if compacted:
+        index.compact()
+    assert index.delete_document("a") == 2
+    assert "a-0" not in ids(index.search("brown fox", k=10))
+    assert index.delete_document("a") == 0
+    assert len(index) == 2
+    if compacted:
+        assert index.get_stats()["tombstones"] == 2
+
+
+@pytest.mark.parametrize("compacted", [False, True])
+def test_doc_id_and_metadata_filters(index, compacted):
+    if compacted:
+        index.compact()
+    assert ids(index.search("fox dog", k=10, filters={"doc_id": "b"})) == ["b-0"]
+    assert set(ids(index.search("fox dog", k=10, filters={"doc_id": {"$in": ["a", "c"]}}))) == {"a-0", "a-1"}
+    assert set(ids(index.search("fox dog brown", k=10, filters={"lang": "en"}))) == {"a-0", "a-1", "c-0"}
+    both = {"$and": [{"doc_id": {"$in": ["a", "b"]}}, {"lang": "de"}]}
+    assert ids(index.search("fox", k=10, filters=both)) == ["b-0"]
+
+
+def test_filters_see_rows_in_both_segment_and_journal(index):
+    index.compact()
+    index.add_documents(["d-0"], [Document(page_content="fox in the journal", metadata={"doc_id": "d", "lang": "en"})])
+    index.delete_document("b")
+    assert set(ids(index.search("fox", k=10, filters={"lang": "en"}))) == {"a-0", "d-0"}
+    assert ids(index.search("fox", k=10, filters={"doc_id": {"$in": ["b", "d"]}})) == ["d-0"]
+
+
+def test_replacing_a_chunk_id_tombstones_the_old_row(index):
+    index.compact()
+    index.add_documents(["a-0"], [Document(page_content="completely new text", metadata={"doc_id": "a"})])
+    assert "a-0" not in ids(index.search("quick brown fox", k=10))
+    assert ids(index.search("completely new", k=1)) == ["a-0"]
+    assert len(index) == 4
+
+
+def test_split_doc_filter():
+    assert split_doc_filter(None) == (None, None)
+    assert split_doc_filter({"doc_id": "a"}) == (["a"], None)
+    assert split_doc_filter({"doc_id": {"$in": ["a", "b"]}}) == (["a", "b"], None)
+    doc_ids, remaining = split_doc_filter({"$and": [{"doc_id": {"$eq": "a"}}, {"lang": "en"}]})
+    assert doc_ids == ["a"]
+    assert matches_filter({"lang": "en"}, remaining)
+    assert not matches_filter({"lang": "de"}, remaining)
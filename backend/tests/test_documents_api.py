@@ -0,0 +1,82 @@
+import base64
+import json
+from datetime import datetime, timedelta, timezone
+import pytest
+from fastapi import HTTPException, Response
+from sqlmodel import Session, delete
+from app.api.endpoints import _as_utc, _decode_cursor, _encode_cursor, list_documents
+from app.models.db import Document as DBDocument, create_db_and_tables, engine
+
+BASE = datetime(2026, 1, 1, 12, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def session():
+    create_db_and_tables()
+    with Session(engine) as session:
+        session.exec(delete(DBDocument))
+        for i in range(10):
+            session.add(DBDocument(
+                doc_id=f"d{i}",
+                filename=f"file-{9 - i}.pdf",
+                chunk_count=1,
+                created_at=BASE + timedelta(hours=i // 2)  # pairs share a timestamp
+            ))
+        session.commit()
+        yield session
+
+
+def page(session, **params):
+    response = Response()
+    options = dict(limit=100, cursor=None, sort="created_at", order="desc", filename=None,
+                   created_after=None, created_before=None)
+    options.update(params)
+    documents = list_documents(response, session=session, **options)
+    return [d.doc_id for d in documents], response.headers.get("x-next-cursor")
+
+
+def walk(session, **params):
+    seen, cursor = [], None
+    while True:
+        doc_ids, cursor = page(session, cursor=cursor, **params)
+        seen += doc_ids
+        if not cursor:
+            return seen
+
+
+@pytest.mark.parametrize("sort", ["created_at", "filename"])
+@pytest.mark.parametrize("order", ["asc", "desc"])
+def test_keyset_pages_cover_every_document_once(session, sort, order):
+    everything, _ = page(session, sort=sort, order=order)
+    assert len(everything) == 10
+    assert walk(session, sort=sort, order=order, limit=3) == everything
+
+
+def test_aware_filters_are_compared_in_utc(session):
+    # 15:00+02:00 is 13:00 UTC: d2..d9
+    after = datetime(2026, 1, 1, 15, tzinfo=timezone(timedelta(hours=2)))
+    assert sorted(walk(session, created_after=after, limit=4)) == [f"d{i}" for i in range(2, 10)]
+    # Naive values are taken as UTC
+    doc_ids, _ = page(session, created_after=datetime(2026, 1, 1, 14), created_before=datetime(2026, 1, 1, 15))
+    assert sorted(doc_ids) == ["d4", "d5"]
+
+
+def test_as_utc_drops_the_offset():
+    assert _as_utc(datetime(2026, 1, 1, 15, tzinfo=timezone(timedelta(hours=2)))) == datetime(2026, 1, 1, 13)
+    assert _as_utc(datetime(2026, 1, 1, 13)) == datetime(2026, 1, 1, 13)
+
+
+def test_cursor_round_trip():
+    cursor = _encode_cursor("file-1.pdf", "d8")
+    assert _decode_cursor(cursor, "filename") == ("file-1.pdf", "d8")
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    base64.urlsafe_b64encode(b"[1, 2, 3]").decode(),
+    base64.urlsafe_b64encode(json.dumps(["not a date", "d1"]).encode()).decode(),
+])
+def test_invalid_cursors_are_rejected(cursor):
+    with pytest.raises(HTTPException) as error:
+        _decode_cursor(cursor, "created_at")
+    assert error.value.status_code == 400
@@ -0,0 +1,37 @@
+import asyncio
+import time
+from app.services.embedding_service import EmbeddingService, Encoder
+
+
+class SlowEncoder(Encoder):
+    name = "slow"
+
+    def encode(self, texts):
+        time.sleep(0.02)
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+def test_cancelled_requests_do_not_stop_the_workers():
+    service = EmbeddingService(workers=1, query_batch_size=4, batch_wait_ms=1, bulk_batch_size=2,
+                               encoder_factory=SlowEncoder)
+
+    async def run():
+        # Cancel at every stage: queued, being encoded, about to be resolved
+        for delay in (0.0, 0.005, 0.015, 0.025):
+            query = asyncio.ensure_future(service.aembed_query("q"))
+            bulk = asyncio.ensure_future(service.aembed_documents(["a", "bb", "ccc", "dddd", "e"]))
+            await asyncio.sleep(delay)
+            query.cancel()
+            bulk.cancel()
+            await asyncio.gather(query, bulk, return_exceptions=True)
+        return (
+            await asyncio.wait_for(service.aembed_query("four"), timeout=5),
+            await asyncio.wait_for(service.aembed_documents(["a", "bb", "ccc"]), timeout=5),
+        )
+
+    try:
+        query, documents = asyncio.run(run())
+    finally:
+        service.shutdown()
+    assert query == [4.0, 1.0]
+    assert [vector[0] for vector in documents] == [1.0, 2.0, 3.0]
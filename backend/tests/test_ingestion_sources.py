@@ -0,0 +1,100 @@
+import os
+import zipfile
+import pytest
+from fastapi import HTTPException
+import app.services.ingestion as ingestion
+from app.services.ingestion import ingestion_service
+from app.services.jobs import IngestJob
+
+
+@pytest.fixture
+def root(tmp_path, monkeypatch):
+    root = tmp_path / "root"
+    (root / "sub").mkdir(parents=True)
+    staging = tmp_path / "staging"
+    staging.mkdir()
+    monkeypatch.setattr(ingestion, "TEMP_DIR", str(staging))
+    monkeypatch.setattr(ingestion.settings, "BULK_INGEST_ROOT", str(root))
+    monkeypatch.setattr(ingestion.settings, "INGEST_MAX_FILE_BYTES", 1000)
+    monkeypatch.setattr(ingestion.settings, "INGEST_MAX_ARCHIVE_BYTES", 2500)
+    return root
+
+
+def expand(source) -> IngestJob:
+    job = IngestJob(job_id="test", sources=[str(source)])
+    ingestion_service._expand_sources(job)
+    return job
+
+
+def test_symlinks_out_of_the_root_are_skipped(root, tmp_path):
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    (outside / "secret.txt").write_text("secret")
+    (root / "a.txt").write_text("hello")
+    (root / "notes.bin").write_text("unsupported")
+    os.symlink(outside / "secret.txt", root / "sub" / "leak.txt")
+    os.symlink(outside, root / "sub" / "linked_dir")
+    os.symlink(root / "a.txt", root / "sub" / "alias.txt")
+
+    job = expand(root)
+    assert sorted((f.filename, f.source_path) for f in job.files) == [
+        ("a.txt", os.path.realpath(root / "a.txt")),
+        (os.path.join("sub", "alias.txt"), os.path.realpath(root / "a.txt")),
+    ]
+
+
+def test_oversized_files_fail_when_staged(root):
+    (root / "small.txt").write_text("x" * 10)
+    (root / "big.txt").write_text("x" * 1001)
+    entries = {f.filename: f for f in expand(root).files}
+
+    ingestion_service._stage(entries["small.txt"])
+    assert os.path.getsize(entries["small.txt"].file_path) == 10
+    with pytest.raises(ValueError, match="INGEST_MAX_FILE_BYTES"):
+        ingestion_service._stage(entries["big.txt"])
+    assert not os.path.exists(entries["big.txt"].file_path)
+
+
+def test_zip_members_are_capped_individually(root):
+    archive = root / "docs.zip"
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("ok.txt", "x" * 100)
+        z.writestr("huge.txt", "x" * 2000)
+        z.writestr("ignored.exe", "x" * 10)
+    entries = {f.filename: f for f in expand(archive).files}
+    assert set(entries) == {"ok.txt", "huge.txt"}
+
+    ingestion_service._stage(entries["ok.txt"])
+    with pytest.raises(ValueError, match="INGEST_MAX_FILE_BYTES"):
+        ingestion_service._stage(entries["huge.txt"])
+
+
+def test_archives_over_the_total_cap_fail_before_extraction(root):
+    archive = root / "bomb.zip"
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as z:
+        for i in range(3):
+            z.writestr(f"part{i}.txt", "x" * 900)
+    with pytest.raises(ValueError, match="INGEST_MAX_ARCHIVE_BYTES"):
+        expand(archive)
+    assert os.listdir(ingestion.TEMP_DIR) == []
+
+
+def test_process_path_only_accepts_paths_under_the_root(root, tmp_path, monkeypatch):
+    with pytest.raises(HTTPException) as error:
+        ingestion_service.process_path(str(tmp_path))
+    assert error.value.status_code == 403
+
+    os.symlink(tmp_path, root / "escape")
+    with pytest.raises(HTTPException) as error:
+        ingestion_service.process_path(str(root / "escape"))
+    assert error.value.status_code == 403
+
+    (root / "a.txt").write_text("hello")
+    with pytest.raises(HTTPException) as error:
+        ingestion_service.process_path(str(root / "a.txt"))
+    assert error.value.status_code == 400
+
+    monkeypatch.setattr(ingestion.settings, "BULK_INGEST_ROOT", None)
+    with pytest.raises(HTTPException) as error:
+        ingestion_service.process_path(str(root))
+    assert error.value.status_code == 403
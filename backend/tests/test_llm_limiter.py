@@ -0,0 +1,72 @@
+import asyncio
+import time
+import pytest
+from fastapi import HTTPException
+from app.services.llm_client import CompletionLimiter
+
+
+def test_check_rejects_only_when_slots_and_queue_are_full():
+    async def run():
+        limiter = CompletionLimiter(max_in_flight=1, max_queue=1, queue_timeout=1)
+        await limiter.acquire()
+        limiter.check()  # a slot is taken but the queue has room
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as error:
+            limiter.check()
+        limiter.release()
+        await waiter
+        limiter.release()
+        return limiter, error.value
+
+    limiter, error = asyncio.run(run())
+    assert error.status_code == 429
+    assert error.headers["Retry-After"] == "1"
+    assert limiter.rejected == 1
+    assert (limiter.in_flight, limiter.waiting) == (0, 0)
+
+
+def test_waiting_past_the_queue_timeout_is_rejected():
+    async def run():
+        limiter = CompletionLimiter(max_in_flight=1, max_queue=5, queue_timeout=0.05)
+        await limiter.acquire()
+        with pytest.raises(HTTPException) as error:
+            await limiter.acquire()
+        return limiter, error.value
+
+    limiter, error = asyncio.run(run())
+    assert error.status_code == 429
+    assert (limiter.in_flight, limiter.waiting) == (1, 0)
+
+
+def test_cancelled_waiters_do_not_leak_slots():
+    async def run():
+        limiter = CompletionLimiter(max_in_flight=1, max_queue=5, queue_timeout=5)
+        await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        limiter.release()
+        await asyncio.wait_for(limiter.acquire(), timeout=1)
+        return limiter
+
+    limiter = asyncio.run(run())
+    assert (limiter.in_flight, limiter.waiting) == (1, 0)
+
+
+def test_rate_paces_stream_starts_after_the_burst():
+    async def run():
+        limiter = CompletionLimiter(max_in_flight=20, max_queue=0, queue_timeout=5, rate=10)
+        start = time.perf_counter()
+        for _ in range(10):
+            await limiter.acquire()
+        burst = time.perf_counter() - start
+        for _ in range(2):
+            await limiter.acquire()
+        return burst, time.perf_counter() - start
+
+    # The bucket holds one second of starts; the next two wait ~0.1s each
+    burst, total = asyncio.run(run())
+    assert burst < 0.05
+    assert 0.15 < total < 1
@@ -0,0 +1,42 @@
+import pytest
+from langchain_core.documents import Document
+from app.services.rerank import reciprocal_rank_fusion
+
+
+def doc(chunk_id, **metadata):
+    return Document(page_content=f"text of {chunk_id}", metadata={"doc_id": "d", **metadata}, id=chunk_id)
+
+
+def test_fuses_by_reciprocal_rank():
+    vector = [doc("a"), doc("b"), doc("c")]
+    keyword = [doc("b"), doc("c")]
+    fused = reciprocal_rank_fusion([vector, keyword], k=60)
+    assert [d.id for d in fused] == ["b", "c", "a"]
+    assert fused[0].metadata["rrf_score"] == pytest.approx(1 / 62 + 1 / 61)
+    assert fused[0].metadata["score"] == fused[0].metadata["rrf_score"]
+
+
+def test_weights_shift_the_order():
+    vector = [doc("a"), doc("b")]
+    keyword = [doc("b"), doc("a")]
+    assert [d.id for d in reciprocal_rank_fusion([vector, keyword], weights=[2.0, 1.0])] == ["a", "b"]
+    assert [d.id for d in reciprocal_rank_fusion([vector, keyword], weights=[1.0, 2.0])] == ["b", "a"]
+
+
+def test_inputs_are_not_mutated():
+    shared = doc("a", score=0.87)
+    vector, keyword = [shared, doc("b")], [shared]
+    fused = reciprocal_rank_fusion([vector, keyword])
+    assert shared.metadata == {"doc_id": "d", "score": 0.87}
+    assert fused[0] is not shared
+    assert fused[0].id == "a"
+    assert fused[0].page_content == shared.page_content
+
+
+def test_documents_without_ids_are_matched_by_content():
+    first = Document(page_content="same", metadata={"doc_id": "d"})
+    second = Document(page_content="same", metadata={"doc_id": "d"})
+    other = Document(page_content="same", metadata={"doc_id": "e"})
+    fused = reciprocal_rank_fusion([[first, other], [second]])
+    assert len(fused) == 2
+    assert fused[0].metadata["doc_id"] == "d"
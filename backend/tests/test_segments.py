@@ -0,0 +1,102 @@
+import os
+from langchain_core.documents import Document
+from app.services.bm25_index import BM25Index
+from app.services.segments import SEGMENTS_DIR
+
+
+def make_index(path, **kwargs) -> BM25Index:
+    index = BM25Index(str(path), **kwargs)
+    index.load()
+    return index
+
+
+def add(index: BM25Index, doc_id: str, texts):
+    ids = [f"{doc_id}-{i}" for i in range(len(texts))]
+    index.add_documents(ids, [Document(page_content=t, metadata={"doc_id": doc_id}) for t in texts])
+    return ids
+
+
+def test_journal_is_replayed_on_reload(tmp_path):
+    index = make_index(tmp_path)
+    add(index, "a", ["apples and pears", "more apples"])
+    add(index, "b", ["bananas"])
+    index.delete_document("b")
+
+    reloaded = make_index(tmp_path)
+    assert len(reloaded) == 2
+    assert [chunk_id for chunk_id, _ in reloaded.search("apples")] == [chunk_id for chunk_id, _ in index.search("apples")]
+    assert reloaded.search("bananas") == []
+
+
+def test_torn_journal_tail_is_skipped_then_truncated(tmp_path):
+    index = make_index(tmp_path)
+    add(index, "a", ["apples"])
+    # A crashed writer left half a line behind
+    with open(index.journal_path, "ab") as f:
+        f.write(b'{"op": "add", "chunks": [["x", "tor')
+
+    reloaded = make_index(tmp_path)
+    assert len(reloaded) == 1
+    add(reloaded, "b", ["bananas"])
+
+    again = make_index(tmp_path)
+    assert len(again) == 2
+    assert again.search("bananas")[0][0] == "b-0"
+
+
+def test_compaction_bumps_generation_and_keeps_results(tmp_path):
+    index = make_index(tmp_path)
+    add(index, "a", ["apples and pears", "pears only"])
+    add(index, "b", ["apples again"])
+    index.delete_document("b")
+    before = index.search("apples pears")
+
+    index.compact()
+    assert index.generation == 1
+    assert open(index.current_path).read() == "1"
+    assert os.path.getsize(index.journal_path) == 0
+    assert index.search("apples pears") == before
+    assert make_index(tmp_path).search("apples pears") == before
+
+
+def test_unfinished_segment_write_is_ignored(tmp_path):
+    index = make_index(tmp_path)
+    add(index, "a", ["apples"])
+    index.compact()
+    # Crash during the next compaction: the segment never got renamed into place
+    os.makedirs(os.path.join(str(tmp_path), SEGMENTS_DIR, "2.tmp"))
+
+    reloaded = make_index(tmp_path)
+    assert reloaded.generation == 1
+    assert reloaded.search("apples")[0][0] == "a-0"
+    add(reloaded, "b", ["bananas"])
+    reloaded.compact()
+    assert make_index(tmp_path).generation == 2
+
+
+def test_other_instances_pick_up_writes_on_refresh(tmp_path):
+    writer = make_index(tmp_path)
+    reader = make_index(tmp_path)
+    changes = []
+    reader.on_change = changes.append
+
+    add(writer, "a", ["apples"])
+    reader.refresh()
+    assert reader.search("apples")[0][0] == "a-0"
+    assert changes == [{"a"}]
+
+    # After another process compacts, the reader switches to the new generation
+    writer.compact()
+    add(writer, "b", ["bananas"])
+    reader.refresh()
+    assert reader.generation == 1
+    assert changes[-1] is None
+    assert reader.search("bananas")[0][0] == "b-0"
+
+
+def test_journal_over_threshold_compacts_automatically(tmp_path):
+    index = make_index(tmp_path, compact_bytes=1024)
+    for i in range(20):
+        add(index, f"d{i}", [f"document number {i} " * 5])
+    assert index.generation > 0
+    assert len(make_index(tmp_path)) == 20
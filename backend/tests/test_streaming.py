@@ -0,0 +1,88 @@
+import asyncio
+import json
+from app.services.streaming import ChatStream
+
+
+def parse(frames):
+    """
+    (id, event) pairs from concatenated SSE frames.
+    """
+    events = []
+    for frame in "".join(frames).split("\n\n"):
+        if not frame or frame.startswith(":"):
+            continue
+        lines = dict(line.split(": ", 1) for line in frame.split("\n"))
+        events.append((int(lines["id"]), json.loads(lines["data"])))
+    return events
+
+
+async def answer(tokens, delay=0.0):
+    yield {"type": "sources", "sources": []}
+    for token in tokens:
+        if delay:
+            await asyncio.sleep(delay)
+        yield {"type": "token", "content": token}
+    yield {"type": "done"}
+
+
+def test_tokens_are_coalesced_into_numbered_frames():
+    async def run():
+        stream = ChatStream("s", coalesce_ms=1000, coalesce_bytes=4, grace=5)
+        await stream.produce(answer(["ab", "cd", "ef", "g"]))
+        return stream
+
+    stream = asyncio.run(run())
+    events = parse(stream.frames)
+    assert [i for i, _ in events] == list(range(1, len(events) + 1))
+    assert [e["content"] for _, e in events if e["type"] == "token"] == ["abcd", "efg"]
+    done = events[-1][1]
+    assert done["type"] == "done"
+    assert done["stream"] == {"id": "s", "frames": len(events), "token_events": 4}
+
+
+def test_subscribers_replay_missed_frames_then_follow_live():
+    async def run():
+        stream = ChatStream("s", coalesce_ms=0, coalesce_bytes=1, grace=5)
+        producer = asyncio.ensure_future(stream.produce(answer(["a", "b", "c", "d"], delay=0.01)))
+        await asyncio.sleep(0.025)
+        resumed = [chunk async for chunk in stream.subscribe(after=2)]
+        await producer
+        full = [chunk async for chunk in stream.subscribe()]
+        return parse(resumed), parse(full)
+
+    resumed, full = asyncio.run(run())
+    assert [i for i, _ in resumed] == list(range(3, len(full) + 1))
+    assert [e for _, e in resumed] == [e for _, e in full[2:]]
+
+
+def test_heartbeats_while_idle():
+    async def run():
+        stream = ChatStream("s", coalesce_ms=0, coalesce_bytes=1, grace=5)
+        producer = asyncio.ensure_future(stream.produce(answer(["a"], delay=0.12)))
+        chunks = [chunk async for chunk in stream.subscribe(heartbeat=0.05)]
+        await producer
+        return chunks
+
+    assert ": ping\n\n" in asyncio.run(run())
+
+
+def test_abandoned_stream_stops_generation_mid_answer():
+    closed = []
+
+    async def endless():
+        try:
+            while True:
+                await asyncio.sleep(0.001)
+                yield {"type": "token", "content": "x"}
+        finally:
+            closed.append(True)
+
+    async def run():
+        # No coalescing and tokens far faster than the idle check
+        stream = ChatStream("s", coalesce_ms=0, coalesce_bytes=1, grace=0.05)
+        await asyncio.wait_for(stream.produce(endless()), timeout=5)
+        return stream
+
+    stream = asyncio.run(run())
+    assert stream.finished
+    assert closed == [True]
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+import app.services.vector_index as vector_index
+from app.services.vector_index import LocalVectorIndex, delete_filter_doc_ids
+
+DIM = 16
+
+
+def build(path, n=600, compact=True, **kwargs):
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(n, DIM)).astype(np.float32)
+    ids = [f"c{i}" for i in range(n)]
+    metadatas = [{"doc_id": f"d{i // 10}", "tag": "rare" if i % 37 == 0 else "common"} for i in range(n)]
+    index = LocalVectorIndex(str(path), dtype="float16", **kwargs)
+    index.load()
+    index.add(ids, vectors.tolist(), [f"text {i}" for i in range(n)], metadatas)
+    if compact:
+        index.compact()
+    return index, vectors, metadatas
+
+
+def brute_force(vectors, query, k, keep):
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    order = np.argsort(-(unit @ (query / np.linalg.norm(query))))
+    return [f"c{i}" for i in order if keep(i)][:k]
+
+
+def ids(hits):
+    return [chunk_id for chunk_id, _ in hits]
+
+
+@pytest.fixture(autouse=True)
+def small_blocks(monkeypatch):
+    # Several blocks even for small test segments
+    monkeypatch.setattr(vector_index, "BLOCK_ROWS", 128)
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_exact_search_matches_brute_force(tmp_path, compact):
+    index, vectors, _ = build(tmp_path, compact=compact)
+    queries = np.random.default_rng(1).normal(size=(8, DIM))
+    for query, hits in zip(queries, index.search_batch(queries.tolist(), k=5)):
+        assert ids(hits) == brute_force(vectors, query, 5, lambda i: True)
+
+
+def test_tombstones_and_selective_filters(tmp_path):
+    index, vectors, metadatas = build(tmp_path)
+    for doc in range(0, 30, 2):
+        index.delete_document(f"d{doc}")
+    index.delete_chunks(["c301", "c302"])
+    alive = lambda i: (i // 10) % 2 == 1 or i // 10 >= 30
+    alive_chunk = lambda i: alive(i) and i not in (301, 302)
+
+    queries = np.random.default_rng(2).normal(size=(6, DIM))
+    # "rare" matches ~1 in 37 rows: the candidate window has to widen past the first top-k
+    rare = index.search_batch(queries.tolist(), k=5, filters={"tag": "rare"})
+    plain = index.search_batch(queries.tolist(), k=5)
+    for query, rare_hits, plain_hits in zip(queries, rare, plain):
+        assert ids(rare_hits) == brute_force(vectors, query, 5, lambda i: alive_chunk(i) and metadatas[i]["tag"] == "rare")
+        assert ids(plain_hits) == brute_force(vectors, query, 5, alive_chunk)
+    assert index.search(queries[0].tolist(), k=5, filters={"tag": "missing"}) == []
+
+
+def test_doc_id_filter_scores_only_those_documents(tmp_path):
+    index, vectors, _ = build(tmp_path)
+    index.add(["new"], [vectors[0].tolist()], ["journaled"], [{"doc_id": "d3"}])
+    query = vectors[0]
+    hits = index.search(query.tolist(), k=50, filters={"doc_id": {"$in": ["d3", "d7"]}})
+    assert set(ids(hits)) == {f"c{i}" for i in list(range(30, 40)) + list(range(70, 80))} | {"new"}
+    assert ids(hits)[0] == "new"
+
+
+def test_deletes_survive_reload(tmp_path):
+    index, _, _ = build(tmp_path)
+    index.delete_document("d1")
+    index.delete_chunks(["c50"])
+    reloaded = LocalVectorIndex(str(tmp_path), dtype="float16")
+    reloaded.load()
+    assert len(reloaded) == len(index) == 600 - 11
+    assert "d1" not in reloaded.doc_ids()
+    assert reloaded.get_documents([("c50", 1.0), ("c51", 1.0)])[0].id == "c51"
+
+
+def test_ivf_finds_exact_neighbours_of_stored_vectors(tmp_path):
+    index, vectors, _ = build(tmp_path, n=1200, ivf_min_rows=500, nprobe=4)
+    assert index._segment.centroids is not None
+    hits = index.search_batch(vectors[:5].tolist(), k=1)
+    assert [h[0][0] for h in hits] == [f"c{i}" for i in range(5)]
+
+
+def test_delete_filter_doc_ids():
+    assert delete_filter_doc_ids(None, {"doc_id": "a"}) == ["a"]
+    assert delete_filter_doc_ids(["c1"], None) is None
+    with pytest.raises(ValueError):
+        delete_filter_doc_ids(None, {"lang": "en"})
+    with pytest.raises(ValueError):
+        delete_filter_doc_ids(None, None)
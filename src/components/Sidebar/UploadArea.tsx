@@ -6,6 +6,7 @@ export function UploadArea() {
   const [isDragging, setIsDragging] = useState(false);
   const [isUploading, setIsUploading] = useState(false);
   const [error, setError] = useState<string | null>(null);
+  const [progress, setProgress] = useState<string | null>(null);
   const fileInputRef = useRef<HTMLInputElement>(null);
   const { addDocument } = useChatStore();
 
@@ -18,9 +19,25 @@ export function UploadArea() {
     setIsDragging(false);
   };
 
+  // Upload returns immediately with a job id; poll until indexing finishes
+  const waitForJob = async (jobId: string) => {
+    while (true) {
+      const response = await fetch(`http://localhost:8000/api/documents/jobs/${jobId}`);
+      if (!response.ok) {
+        throw new Error(`Failed to fetch job status: ${response.statusText}`);
+      }
+      const job = await response.json();
+      if (job.status === 'completed') return job;
+      if (job.status === 'failed') throw new Error(job.error || 'Indexing failed');
+      setProgress(job.chunks_total ? `${job.chunks_embedded}/${job.chunks_total} chunks` : null);
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+    }
+  };
+
   const uploadFile = async (file: File) => {
     setIsUploading(true);
     setError(null);
+    setProgress(null);
     
     const formData = new FormData();
     formData.append('file', file);
@@ -37,11 +54,12 @@ export function UploadArea() {
       }
 
       const data = await response.json();
+      const job = data.job_id ? await waitForJob(data.job_id) : null;
       
       addDocument({
-        id: data.doc_id,
+        id: job?.doc_id ?? data.doc_id,
         filename: file.name,
-        chunkCount: data.chunk_count,
+        chunkCount: job ? job.chunks_total : data.chunk_count,
         uploadTime: new Date().toISOString()
       });
       
@@ -50,6 +68,7 @@ export function UploadArea() {
       setError(err.message || 'Failed to upload file');
     } finally {
       setIsUploading(false);
+      setProgress(null);
     }
   };
 
@@ -88,7 +107,7 @@ export function UploadArea() {
         {isUploading ? (
           <div className="flex flex-col items-center w-full">
             <Loader2 className="w-6 h-6 text-[#f5a623] animate-spin mb-2" />
-            <span className="text-xs text-gray-400">Processing...</span>
+            <span className="text-xs text-gray-400">{progress ? `Processing ${progress}` : 'Processing...'}</span>
           </div>
         ) : (
           <>
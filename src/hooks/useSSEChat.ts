@@ -1,6 +1,9 @@
 import { useRef, useCallback, useEffect } from 'react';
 import { useChatStore } from '../store/useChatStore';
 
+const MAX_RESUME_ATTEMPTS = 3;
+const RESUME_DELAY_MS = 500;
+
 export function useSSEChat() {
   const abortControllerRef = useRef<AbortController | null>(null);
   
@@ -23,6 +26,66 @@ export function useSSEChat() {
     setStreaming(false);
   }, [setStreaming]);
 
+  const readStream = useCallback(async (response: Response, onEventId: (id: number) => void) => {
+    if (!response.body) {
+      throw new Error('No response body received');
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder('utf-8');
+    let buffer = '';
+    let finished = false;
+
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+
+      // Append new chunk to buffer
+      buffer += decoder.decode(value, { stream: true });
+
+      // Split buffer by newlines to process complete lines
+      const lines = buffer.split('\n');
+
+      // Keep the last potentially incomplete line in the buffer
+      buffer = lines.pop() || '';
+
+      for (const line of lines) {
+        const trimmedLine = line.trim();
+        if (trimmedLine.startsWith('id: ')) {
+          onEventId(Number(trimmedLine.slice(4)));
+          continue;
+        }
+        // Skips blank lines and ": ping" heartbeats
+        if (!trimmedLine || !trimmedLine.startsWith('data: ')) continue;
+
+        const dataStr = trimmedLine.slice(6);
+        try {
+          const data = JSON.parse(dataStr);
+
+          if (data.type === 'token') {
+            // console.log('[SSE] Token:', data.content); // Too noisy
+            appendToken(data.content);
+          } else if (data.type === 'sources') {
+            console.log('[SSE] Sources:', data.sources);
+            setMessageSources(data.sources);
+          } else if (data.type === 'done') {
+            console.log('[SSE] Done. Usage:', data.usage);
+            setDone(data.usage || { prompt_tokens: 0, completion_tokens: 0, total_tokens: 0 });
+            finished = true;
+          } else if (data.type === 'error') {
+             console.error('[SSE] Server Error:', data.message);
+             appendToken(`\n\n**Error:** ${data.message}`);
+             setStreaming(false);
+             finished = true;
+          }
+        } catch (e) {
+           console.error('[SSE] Failed to parse message:', e, 'Line:', line);
+        }
+      }
+    }
+    return finished;
+  }, [appendToken, setMessageSources, setDone, setStreaming]);
+
   const send = useCallback(async (query: string) => {
     // Cancel any previous request
     if (abortControllerRef.current) {
@@ -62,59 +125,39 @@ export function useSSEChat() {
       if (!response.ok) {
         throw new Error(`HTTP Error: ${response.status} ${response.statusText}`);
       }
-      
-      if (!response.body) {
-         throw new Error('No response body received');
-      }
 
-      const reader = response.body.getReader();
-      const decoder = new TextDecoder('utf-8');
-      let buffer = '';
+      // The server keeps generating for a short grace period after a drop;
+      // reattach with the last event id we saw instead of asking again.
+      const streamId = response.headers.get('X-Stream-Id');
+      let lastEventId = 0;
+      let current: Response = response;
+      let finished = false;
 
-      while (true) {
-        const { done, value } = await reader.read();
-        
-        if (done) {
-            console.log('[SSE] Stream complete');
-            break;
+      for (let attempt = 0; ; attempt++) {
+        try {
+          finished = await readStream(current, (id) => { lastEventId = id; });
+          if (finished) break;
+        } catch (error: any) {
+          if (error.name === 'AbortError') throw error;
+          console.warn('[SSE] Stream interrupted:', error);
         }
-        
-        // Append new chunk to buffer
-        buffer += decoder.decode(value, { stream: true });
-        
-        // Split buffer by newlines to process complete lines
-        const lines = buffer.split('\n');
-        
-        // Keep the last potentially incomplete line in the buffer
-        buffer = lines.pop() || '';
-
-        for (const line of lines) {
-          const trimmedLine = line.trim();
-          if (!trimmedLine || !trimmedLine.startsWith('data: ')) continue;
-
-          const dataStr = trimmedLine.slice(6);
-          try {
-            const data = JSON.parse(dataStr);
-
-            if (data.type === 'token') {
-              // console.log('[SSE] Token:', data.content); // Too noisy
-              appendToken(data.content);
-            } else if (data.type === 'sources') {
-              console.log('[SSE] Sources:', data.sources);
-              setMessageSources(data.sources);
-            } else if (data.type === 'done') {
-              console.log('[SSE] Done. Usage:', data.usage);
-              setDone(data.usage || { prompt_tokens: 0, completion_tokens: 0, total_tokens: 0 });
-            } else if (data.type === 'error') {
-               console.error('[SSE] Server Error:', data.message);
-               appendToken(`\n\n**Error:** ${data.message}`);
-               setStreaming(false);
-            }
-          } catch (e) {
-             console.error('[SSE] Failed to parse message:', e, 'Line:', line);
-          }
+        if (!streamId || attempt >= MAX_RESUME_ATTEMPTS) break;
+
+        console.log('[SSE] Resuming stream', streamId, 'after event', lastEventId);
+        await new Promise((resolve) => setTimeout(resolve, RESUME_DELAY_MS * (attempt + 1)));
+        current = await fetch(`http://localhost:8000/api/chat/stream/${streamId}`, {
+          headers: { 'Last-Event-ID': String(lastEventId) },
+          signal: controller.signal,
+        });
+        if (!current.ok) {
+          throw new Error(`HTTP Error: ${current.status} ${current.statusText}`);
         }
       }
+
+      if (!finished) {
+        throw new Error('Stream ended before the answer was complete');
+      }
+      console.log('[SSE] Stream complete');
     } catch (error: any) {
       if (error.name === 'AbortError') {
         console.log('[SSE] Request aborted by user');
@@ -126,7 +169,7 @@ export function useSSEChat() {
     } finally {
       abortControllerRef.current = null;
     }
-  }, [appendToken, setMessageSources, setDone, setStreaming, getMessages, selectedDocIds]);
+  }, [readStream, appendToken, setStreaming, getMessages, selectedDocIds]);
 
   // Cleanup on unmount
   useEffect(() => {
@@ -36,5 +36,5 @@ export interface ChatRequest {
 export type SSEEvent =
   | { type: 'token'; content: string }
   | { type: 'sources'; sources: Source[] }
-  | { type: 'done'; usage: Usage }
+  | { type: 'done'; usage: Usage; timings?: Record<string, number>; timed_out?: string[] }
   | { type: 'error'; message: string };